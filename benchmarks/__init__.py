@@ -0,0 +1 @@
+"""Performance benchmarks for dynamo_objects, see `benchmarks/run.py`."""
@@ -0,0 +1,388 @@
+"""
+Benchmarks for the record / table hot paths.
+
+Runs against the in-memory `dynamock` by default or against the local
+DynamoDB (--local), writes results as JSON and compares them with the
+baseline (the exit code is 1 if some benchmark is slower than the baseline
+by more than the --tolerance):
+
+    $ python -m benchmarks.run --output bench.json
+    $ python -m benchmarks.run --save-baseline bench_baseline.json
+    $ python -m benchmarks.run --baseline bench_baseline.json
+    $ python -m benchmarks.run --sizes 10000,100000,1000000 --only query
+
+Results are seconds per operation, the best of --repeat runs (the best
+run is the least affected by the noise from other processes).
+
+Timings depend on the machine, so the baseline is recorded locally: if
+the --baseline file does not exist, results of the run are saved to it
+(run it before the change), the next runs are compared with it.
+`benchmarks/baseline.json` has reference figures of the dynamock run.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+
+from boto.dynamodb2.fields import HashKey, RangeKey
+from boto.dynamodb2.types import NUMBER
+
+TABLE_PREFIX = 'zz_bench_'
+# min time to run the operation in a loop for one measurement
+MIN_RUN_TIME = 0.2
+
+BENCHMARKS = []
+
+
+def benchmark(name, sized=False):
+    """Register the benchmark setup function.
+
+    The setup function gets the context (and the data size for sized
+    benchmarks) and returns the function to measure.
+    """
+    def decorator(setup):
+        BENCHMARKS.append((name, sized, setup))
+        return setup
+    return decorator
+
+
+def define_schema():
+    # the database module is imported after the mock (if mock is used)
+    from dynamo_objects.database import DynamoRecord, DynamoTable
+
+    class BenchRecord(DynamoRecord):
+
+        def __init__(self, **data):
+            self.group = ''
+            self.num = 0
+            self.name = ''
+            self.city = ''
+            self.tags = []
+            self.visits = 0
+            super(BenchRecord, self).__init__(**data)
+
+    class BenchTable(DynamoTable):
+
+        def __init__(self, table_name='bench'):
+            super(BenchTable, self).__init__(
+                table_name,
+                schema=[HashKey('group'), RangeKey('num', data_type=NUMBER)],
+                throughput={'read': 100, 'write': 100},
+                record_class=BenchRecord)
+
+    return BenchRecord, BenchTable
+
+
+def record_data(group, num):
+    return {
+        'group': group, 'num': num, 'name': 'Name %s' % num,
+        'city': 'City %s' % (num % 100), 'tags': ['one', 'two'],
+        'visits': num % 7
+    }
+
+
+class Context(object):
+    """Database, tables and data shared by benchmarks."""
+
+    def __init__(self, db, sizes):
+        self.db = db
+        self.sizes = sizes
+        self.record_class, self.table_class = define_schema()
+        self.table = self.table_class()
+        self.loaded = set()
+
+    def load(self, table, group, size):
+        with table.table.batch_write() as batch:
+            for num in range(size):
+                batch.put_item(record_data(group, num))
+
+    def group(self, size):
+        """Load `size` items into the separate partition, return its name."""
+        group = 'size-%s' % size
+        if size not in self.loaded:
+            self.load(self.table, group, size)
+            self.loaded.add(size)
+        return group
+
+    def scan_table(self, size):
+        """Get the separate table with `size` items."""
+        table = self.table_class('bench_scan_%s' % size)
+        self.load(table, 'scan', size)
+        return table
+
+    def record(self, num):
+        return self.record_class(**record_data('single', num))
+
+    def saved_record(self, num):
+        """Get the loaded record, it is saved if it does not exist."""
+        record = self.table.find('single', num)
+        if record is None:
+            self.table.save(self.record(num))
+            record = self.table.get('single', num)
+        return record
+
+
+@benchmark('table_get')
+def bench_get(context):
+    group, size = context.group(min(context.sizes)), min(context.sizes)
+    nums = [random.randrange(size) for __ in range(1000)]
+    state = {'index': 0}
+
+    def run():
+        state['index'] = (state['index'] + 1) % len(nums)
+        context.table.get(group, nums[state['index']])
+    return run
+
+
+@benchmark('table_save_new')
+def bench_save_new(context):
+    state = {'num': 0}
+
+    def run():
+        state['num'] += 1
+        context.table.save(context.record(state['num']))
+    return run
+
+
+@benchmark('table_save_update')
+def bench_save_update(context):
+    record = context.saved_record(0)
+
+    def run():
+        record.visits += 1
+        context.table.save(record)
+    return run
+
+
+@benchmark('record_hydrate')
+def bench_hydrate(context):
+    group = context.group(min(context.sizes))
+    item = context.table.table.get_item(group=group, num=1)
+
+    def run():
+        context.table._create_record_for_item(item)
+    return run
+
+
+@benchmark('record_get_dict')
+def bench_get_dict(context):
+    record = context.record(1)
+
+    def run():
+        record.get_dict()
+    return run
+
+
+@benchmark('record_safe_data')
+def bench_safe_data(context):
+    data = context.record(1).get_dict()
+
+    def run():
+        context.table._get_safe_data(data)
+    return run
+
+
+@benchmark('counter_update')
+def bench_counter(context):
+    context.saved_record(0)
+
+    def run():
+        context.table.update_counter('single', 0, visits=1)
+    return run
+
+
+@benchmark('query', sized=True)
+def bench_query(context, size):
+    group = context.group(size)
+
+    def run():
+        for __ in context.table.query(group__eq=group):
+            pass
+    return run
+
+
+@benchmark('query_count', sized=True)
+def bench_query_count(context, size):
+    group = context.group(size)
+
+    def run():
+        context.table.query_count(group__eq=group)
+    return run
+
+
+@benchmark('scan', sized=True)
+def bench_scan(context, size):
+    table = context.scan_table(size)
+
+    def run():
+        for __ in table.scan():
+            pass
+    return run
+
+
+@benchmark('memory_table_hit')
+def bench_memory_hit(context):
+    from dynamo_objects.memorydb import MemoryTable
+    group = context.group(min(context.sizes))
+    memory = MemoryTable(context.table)
+    memory.get(group, 1)
+
+    def run():
+        memory.get(group, 1)
+    return run
+
+
+@benchmark('memory_table_miss')
+def bench_memory_miss(context):
+    from dynamo_objects.memorydb import MemoryTable
+    group = context.group(min(context.sizes))
+    memory = MemoryTable(context.table)
+
+    def run():
+        memory.reset()
+        memory.get(group, 1)
+    return run
+
+
+@benchmark('memory_table_batch_flush_100')
+def bench_batch_flush(context):
+    from dynamo_objects.memorydb import MemoryTable
+    memory = MemoryTable(context.table)
+    memory.set_load_from_db(False)
+    for num in range(100):
+        memory.get('flush', num, create=True)
+
+    def run():
+        memory.save_data_batch(overwrite=True)
+    return run
+
+
+def measure(func, repeat, min_time=MIN_RUN_TIME):
+    """Get (seconds per operation, number of operations per run)."""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 10 ** 6:
+            break
+        number *= 10
+    best = min([elapsed] + timer.repeat(repeat - 1, number))
+    return best / number, number
+
+
+def run_benchmarks(db, sizes, repeat=3, only=None, log=None,
+                   min_time=MIN_RUN_TIME):
+    context = Context(db, sizes)
+    results = {}
+    for name, sized, setup in BENCHMARKS:
+        for size in (sizes if sized else [None]):
+            full_name = name if size is None else '%s_%s' % (name, size)
+            if only and not any(part in full_name for part in only):
+                continue
+            func = setup(context, size) if sized else setup(context)
+            seconds, number = measure(func, repeat, min_time)
+            results[full_name] = {'seconds': seconds, 'number': number}
+            if log:
+                log('%-35s %12.3f us' % (full_name, seconds * 10 ** 6))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compare with the baseline, returns [(name, ratio)] of regressions."""
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name]['seconds'] / baseline[name]['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def connect(local, port):
+    if not local:
+        # mock boto with the in-memory dynamodb
+        from dynamo_objects import dynamock  # noqa
+    from dynamo_objects.database import DynamoDatabase
+    db = DynamoDatabase()
+    db.connect(
+        region_name='localhost', DYNAMODB_PORT=port,
+        table_prefix=TABLE_PREFIX)
+    delete_tables(db)
+    return db
+
+
+def delete_tables(db):
+    db.delete_tables([
+        name[len(TABLE_PREFIX):] for name in db.get_tables()
+        if name.startswith(TABLE_PREFIX)])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Run dynamo_objects benchmarks')
+    parser.add_argument(
+        '--local', action='store_true',
+        help='use the local DynamoDB instead of dynamock')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '--sizes', default='1000,10000',
+        help='comma-separated data sizes for query / scan benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--min-time', type=float, default=MIN_RUN_TIME,
+        help='min time of one measurement in seconds')
+    parser.add_argument(
+        '--only', help='comma-separated parts of benchmark names to run')
+    parser.add_argument('--output', help='file to write results to')
+    parser.add_argument('--save-baseline', help='save results as baseline')
+    parser.add_argument('--baseline', help='baseline to compare with')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.25,
+        help='allowed slowdown relative to baseline (0.25 = 25%%)')
+    options = parser.parse_args(args)
+
+    sizes = [int(size) for size in options.sizes.split(',')]
+    only = options.only.split(',') if options.only else None
+    db = connect(options.local, options.port)
+    try:
+        results = run_benchmarks(
+            db, sizes, options.repeat, only, log=print,
+            min_time=options.min_time)
+    finally:
+        delete_tables(db)
+    report = {
+        'meta': {
+            'backend': 'local' if options.local else 'dynamock',
+            'python': platform.python_version(),
+            'sizes': sizes,
+        },
+        'results': results
+    }
+    paths = [options.output, options.save_baseline]
+    regressions = []
+    if options.baseline and not os.path.exists(options.baseline):
+        # the first run records the local baseline
+        print('No baseline %s, results are saved as the baseline' %
+              options.baseline)
+        paths.append(options.baseline)
+    elif options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, options.tolerance)
+        for name, ratio in regressions:
+            print('REGRESSION %-35s %.2fx slower' % (name, ratio))
+    for path in paths:
+        if path:
+            with open(path, 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
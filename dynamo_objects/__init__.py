@@ -1,7 +1,8 @@
 from .database import DynamoException, InvalidKeysException
+from .database import VersionConflictException
 from .database import DynamoDatabase, DynamoTable, DynamoRecord
 from .database import TableThroughput
-from .memorydb import MemoryTable
+from .memorydb import MemoryTable, QueryCache
 
 __author__ = 'Boris Serebrov'
 __license__ = 'MIT'
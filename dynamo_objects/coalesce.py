@@ -0,0 +1,167 @@
+"""
+Coalescing of concurrent reads of the same items.
+
+SingleFlight: concurrent gets of the same key share one GetItem request
+(and its result or ItemNotFound).
+
+BatchGetter: gets from different threads made within a short time window
+are merged into one BatchGetItem request (same keys are requested once).
+
+To use it for DynamoTable.get(), set the `get_coalescer` attribute of
+the table class:
+
+    class StoreTable(DynamoTable):
+        get_coalescer = SingleFlight()
+        # or
+        get_coalescer = BatchGetter(window=0.002)
+"""
+import copy
+import threading
+
+from boto.dynamodb2.exceptions import ItemNotFound
+
+from dynamo_objects.database import hashable_value
+
+# max number of keys in the BatchGetItem request
+BATCH_GET_SIZE = 100
+
+
+def copy_item(item):
+    """Copy boto Item, so it can be changed independently."""
+    return type(item)(
+        item.table, copy.deepcopy(dict(item.items())), loaded=True)
+
+
+class Call(object):
+    """The in-flight request, waiters get its result or error."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight(object):
+    """Runs only one function call per key at a time.
+
+    Concurrent callers with the same key wait for the running call and
+    get its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Call()
+        if not leader:
+            return call.wait()
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def get(self, table, keys_data):
+        """Get boto Item by keys, for DynamoTable.get()."""
+        key = (table.table_name, hashable_value(keys_data))
+        result = {}
+
+        def get_item():
+            result['item'] = table.get_item(**keys_data)
+            return result['item']
+        item = self.do(key, get_item)
+        if result:
+            return item
+        # the item is shared with another thread, use a copy
+        return copy_item(item)
+
+
+class Batch(object):
+
+    def __init__(self, table):
+        self.table = table
+        # hashable key: (keys_data, Call)
+        self.calls = {}
+        self.full = threading.Event()
+        self.closed = False
+
+
+class BatchGetter(object):
+    """Merges gets made within the time window into one BatchGetItem.
+
+    The first get starts the batch and waits for `window` seconds (or
+    until there are `max_size` keys), gets from other threads made
+    meanwhile are added to the batch. Then all keys are read with one
+    BatchGetItem request and results are passed to waiting threads.
+    """
+
+    def __init__(self, window=0.002, max_size=BATCH_GET_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._open = {}
+
+    def get(self, table, keys_data):
+        """Get boto Item by keys, for DynamoTable.get()."""
+        key = hashable_value(keys_data)
+        with self._lock:
+            batch = self._open.get(table.table_name)
+            leader = batch is None
+            if leader:
+                batch = self._open[table.table_name] = Batch(table)
+            if key not in batch.calls:
+                batch.calls[key] = (keys_data, Call())
+            call = batch.calls[key][1]
+            if len(batch.calls) >= self.max_size:
+                self._close(batch)
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                self._close(batch)
+            self._fetch(batch)
+        item = call.wait()
+        if item is None:
+            raise ItemNotFound()
+        # the item can be requested by several threads, use a copy
+        return copy_item(item)
+
+    def _close(self, batch):
+        # no more keys can be added to the batch
+        if not batch.closed:
+            batch.closed = True
+            del self._open[batch.table.table_name]
+            batch.full.set()
+
+    def _fetch(self, batch):
+        self.batches += 1
+        try:
+            keys = [keys_data for keys_data, __ in batch.calls.values()]
+            key_names = list(keys[0].keys())
+            found = {}
+            for item in batch.table.batch_get(keys=keys):
+                found[hashable_value(
+                    dict((name, item[name]) for name in key_names))] = item
+            for key, (__, call) in batch.calls.items():
+                call.result = found.get(key)
+        except Exception as e:
+            for __, call in batch.calls.values():
+                call.error = e
+        for __, call in batch.calls.values():
+            call.event.set()
@@ -0,0 +1,160 @@
+"""
+Wire format encoding of records data, compiled once per record class.
+
+Boto encodes values with the Dynamizer, which detects the DynamoDB type
+of each value, and empty values (that DynamoDB does not store) are
+removed in a separate pass. The RecordCodec takes field types from the
+default values set by the record constructor and selects the encoder
+for each field in advance, values are encoded and empty values dropped
+in one pass:
+
+    codec = record_codec(Customer)
+    wire = codec.encode({'customer_id': 'C1', 'age': 20, 'name': ''})
+    # {'customer_id': {'S': 'C1'}, 'age': {'N': '20'}}
+    codec.decode(wire)
+    # {'customer_id': 'C1', 'age': Decimal('20')}
+    codec.decode(wire, native_numbers=True)
+    # {'customer_id': 'C1', 'age': 20}
+
+Values which do not match the field type (and fields not set by the
+constructor) are encoded with the Dynamizer, so the result is the same.
+"""
+import threading
+
+from boto.compat import six
+from boto.dynamodb.types import DYNAMODB_CONTEXT, Dynamizer
+
+STRING_TYPES = (str, six.text_type)
+
+# integers with more digits are encoded by the Dynamizer (it raises
+# the error as DynamoDB numbers are limited to 38 digits)
+MAX_INT = 10 ** 38
+
+# the Dynamizer has no state, so it is shared
+_dynamizer = Dynamizer()
+
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+
+def is_storable(value):
+    """Check if the value can be stored (same as boto Item._is_storable).
+
+    None, empty strings, sets, lists and dicts are not stored, but 0 and
+    False are.
+    """
+    if not value:
+        return value in (0, 0.0, False)
+    return True
+
+
+def storable_data(data):
+    """Get the data without values that can not be stored.
+
+    Nested dicts are cleaned too.
+    """
+    result = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            result[key] = storable_data(value)
+        elif is_storable(value):
+            result[key] = value
+    return result
+
+
+def encode_value(value):
+    if isinstance(value, dict):
+        value = storable_data(value)
+    return _dynamizer.encode(value)
+
+
+def encode_string(value):
+    if type(value) in STRING_TYPES:
+        return {'S': value}
+    return encode_value(value)
+
+
+def encode_number(value):
+    if type(value) in six.integer_types and -MAX_INT < value < MAX_INT:
+        return {'N': str(value)}
+    return encode_value(value)
+
+
+def decode_number(value, native=False):
+    if not native:
+        return DYNAMODB_CONTEXT.create_decimal(value)
+    if '.' in value or 'e' in value or 'E' in value:
+        return float(value)
+    return int(value)
+
+
+def field_encoder(default):
+    """Get the encoder for the field by its default value."""
+    if type(default) in STRING_TYPES:
+        return encode_string
+    if type(default) in six.integer_types or type(default) is float:
+        return encode_number
+    return encode_value
+
+
+class RecordCodec(object):
+    """Encodes / decodes record data to / from the DynamoDB wire format."""
+
+    def __init__(self, record_class=None):
+        self.record_class = record_class
+        # {field name: encoder}
+        self.encoders = {}
+        if record_class is not None:
+            try:
+                defaults = record_class()._get_raw_dict()
+            except Exception:
+                # the constructor requires arguments, use generic encoding
+                defaults = {}
+            for name, default in defaults.items():
+                self.encoders[name] = field_encoder(default)
+
+    def encode(self, data):
+        """Get {name: {type: value}}, values that can't be stored are
+        skipped."""
+        encoders = self.encoders
+        wire = {}
+        for name, value in data.items():
+            if not value and value not in (0, 0.0, False):
+                continue
+            wire[name] = encoders.get(name, encode_value)(value)
+        return wire
+
+    def encode_value(self, name, value):
+        """Encode the value of one field."""
+        return self.encoders.get(name, encode_value)(value)
+
+    def decode(self, wire, native_numbers=False):
+        """Get the data from the wire format.
+
+        Numbers are Decimal (as boto returns them), with native_numbers
+        they are int or float.
+        """
+        data = {}
+        for name, value in wire.items():
+            if 'S' in value:
+                data[name] = value['S']
+            elif 'N' in value:
+                data[name] = decode_number(value['N'], native_numbers)
+            else:
+                data[name] = _dynamizer.decode(value)
+        return data
+
+
+def record_codec(record_class):
+    """Get the codec for the record class (created once per class)."""
+    codec = _codecs.get(record_class)
+    if codec is None:
+        with _codecs_lock:
+            codec = _codecs.get(record_class)
+            if codec is None:
+                codec = _codecs[record_class] = RecordCodec(record_class)
+    return codec
+
+
+# the codec without field types, for data of unknown records
+default_codec = RecordCodec()
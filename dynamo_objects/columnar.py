@@ -0,0 +1,414 @@
+"""
+Columnar storage of records for MemoryTable.
+
+Instead of the record object per item (with its own __dict__ and the
+boto Item copy of data), values are kept column-wise: integers and
+floats in typed arrays, strings in the shared utf-8 buffer, other values
+(sets, lists, dicts, Decimal) in lists. Attribute names are interned and
+stored once per column, each value needs a flag byte per row.
+
+Records are materialized as views on access: the view is an instance of
+the record class subclass, which reads and writes attributes in columns,
+so changes made via the view are stored:
+
+    memory = MemoryTable(CustomerTable(), columnar=True)
+    customer = memory.get('C1', 20)   # the view
+    customer.first_name = 'Changed'   # written to the column
+    memory.save_data_batch()
+
+Integral Decimal values (boto loads numbers as Decimal) of integer
+columns are stored and returned as integers.
+Views are not cached, every get() returns the new view object and
+records passed to save() are copied into columns (later changes of that
+record object are not stored, use the view returned by get()).
+Views do not keep the boto Item, so saves write full items (overwrite).
+Private attributes set by the record constructor (like `self._ts = None`)
+are initialized with values of the new record.
+Records with compressed fields or the version field are not supported.
+"""
+import copy
+import threading
+from array import array
+from decimal import Decimal
+
+from boto.compat import six
+
+from dynamo_objects import compression
+from dynamo_objects.database import DynamoException, DynamoRecord
+from dynamo_objects.database import DynamoSchemaException
+
+# row flags: no value, the value is in typed storage, other value
+MISSING, TYPED, OTHER = 0, 1, 2
+
+# rewrite the string buffer when this part of it is not used
+GARBAGE_RATIO = 0.5
+MIN_COMPACT_SIZE = 65536
+
+_views = {}
+_views_lock = threading.Lock()
+
+
+class Column(object):
+    """Values of one attribute, the row value is typed or other."""
+
+    def __init__(self, name):
+        self.name = name
+        self.flags = bytearray()
+        # {row: value} for values that don't fit the typed storage
+        self.other = {}
+
+    def get(self, row):
+        """Get the value, raises KeyError if the row has no value."""
+        flag = self.flags[row] if row < len(self.flags) else MISSING
+        if flag == TYPED:
+            return self._load(row)
+        if flag == OTHER:
+            return self.other[row]
+        raise KeyError(row)
+
+    def has(self, row):
+        return row < len(self.flags) and self.flags[row] != MISSING
+
+    def set(self, row, value):
+        if row >= len(self.flags):
+            # grow in chunks, rows above the last one have no values
+            self._extend(max(row + 1, 2 * len(self.flags)))
+        self.clear(row)
+        if self._store(row, value):
+            self.flags[row] = TYPED
+        else:
+            self.other[row] = value
+            self.flags[row] = OTHER
+
+    def clear(self, row):
+        if row < len(self.flags):
+            if self.flags[row] == OTHER:
+                del self.other[row]
+            self.flags[row] = MISSING
+
+    def _extend(self, size):
+        self.flags.extend(bytearray(size - len(self.flags)))
+
+    def _store(self, row, value):
+        return False
+
+    def _load(self, row):
+        raise KeyError(row)
+
+
+class NumberColumn(Column):
+    """Integers (typecode 'l') or floats ('d') in the array."""
+
+    def __init__(self, name, typecode):
+        super(NumberColumn, self).__init__(name)
+        self.values = array(typecode)
+        self.value_type = float if typecode == 'd' else six.integer_types
+
+    def _extend(self, size):
+        self.values.extend([0] * (size - len(self.values)))
+        super(NumberColumn, self)._extend(size)
+
+    def _store(self, row, value):
+        if type(value) is Decimal and self.value_type is not float and \
+                value == value.to_integral_value():
+            # boto returns numbers as Decimal
+            value = int(value)
+        if type(value) is bool or not isinstance(value, self.value_type):
+            return False
+        try:
+            self.values[row] = value
+        except OverflowError:
+            return False
+        return True
+
+    def _load(self, row):
+        return self.values[row]
+
+
+class StringColumn(Column):
+    """Strings as utf-8 bytes in the shared buffer."""
+
+    def __init__(self, name):
+        super(StringColumn, self).__init__(name)
+        self.buffer = bytearray()
+        self.starts = array('l')
+        self.lengths = array('l')
+        self.garbage = 0
+
+    def _extend(self, size):
+        self.starts.extend([0] * (size - len(self.starts)))
+        self.lengths.extend([0] * (size - len(self.lengths)))
+        super(StringColumn, self)._extend(size)
+
+    def clear(self, row):
+        if row < len(self.flags) and self.flags[row] == TYPED:
+            self.garbage += self.lengths[row]
+        super(StringColumn, self).clear(row)
+
+    def _store(self, row, value):
+        if type(value) is not six.text_type:
+            return False
+        data = value.encode('utf-8')
+        self._compact()
+        self.starts[row] = len(self.buffer)
+        self.lengths[row] = len(data)
+        self.buffer.extend(data)
+        return True
+
+    def _load(self, row):
+        start = self.starts[row]
+        return self.buffer[start:start + self.lengths[row]].decode('utf-8')
+
+    def _compact(self):
+        size = len(self.buffer)
+        if size < MIN_COMPACT_SIZE or self.garbage < size * GARBAGE_RATIO:
+            return
+        buffer = bytearray()
+        for row, flag in enumerate(self.flags):
+            if flag == TYPED:
+                start = self.starts[row]
+                self.starts[row] = len(buffer)
+                buffer.extend(self.buffer[start:start + self.lengths[row]])
+        self.buffer = buffer
+        self.garbage = 0
+
+
+class ObjectColumn(Column):
+    """Any values (sets, lists, dicts, ...) in the list."""
+
+    def __init__(self, name):
+        super(ObjectColumn, self).__init__(name)
+        self.values = []
+
+    def _extend(self, size):
+        self.values.extend([None] * (size - len(self.values)))
+        super(ObjectColumn, self)._extend(size)
+
+    def clear(self, row):
+        if row < len(self.values):
+            self.values[row] = None
+        super(ObjectColumn, self).clear(row)
+
+    def _store(self, row, value):
+        self.values[row] = value
+        return True
+
+    def _load(self, row):
+        return self.values[row]
+
+
+def make_column(name, value):
+    """Create the column for values like the given one."""
+    name = six.moves.intern(str(name))
+    if type(value) is float:
+        return NumberColumn(name, 'd')
+    if isinstance(value, six.integer_types) and type(value) is not bool:
+        return NumberColumn(name, 'l')
+    if isinstance(value, six.string_types):
+        return StringColumn(name)
+    return ObjectColumn(name)
+
+
+def view_class(record_class):
+    """Get the view class for records of the record_class."""
+    view = _views.get(record_class)
+    if view is not None:
+        return view
+    with _views_lock:
+        if record_class not in _views:
+            try:
+                defaults = vars(record_class())
+            except Exception:
+                # the constructor requires arguments
+                defaults = {}
+            private = dict(
+                (name, value) for name, value in defaults.items()
+                if name.startswith('_') and
+                name not in ('_item', '_strict_schema'))
+            _views[record_class] = type(
+                'Columnar' + record_class.__name__,
+                (RecordView, record_class), {'_private_defaults': private})
+        return _views[record_class]
+
+
+class RecordView(object):
+    """The record which keeps its data in the ColumnarData."""
+
+    # {name: value} of private attributes set by the record constructor
+    _private_defaults = {}
+    # there is no loaded item, saves overwrite the item
+    _detached = True
+
+    def __init__(self, store, key):
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_item', None)
+        self._freeze_schema()
+
+    def __getattr__(self, name):
+        # called for attributes not found in __dict__ and the class
+        if name.startswith('_'):
+            if name not in self._private_defaults:
+                raise AttributeError(name)
+            # the copy, so mutable values are not shared by views
+            value = copy.copy(self._private_defaults[name])
+            object.__setattr__(self, name, value)
+            return value
+        try:
+            return self._store.get_value(self._key, name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+            return
+        if self._strict_schema and not hasattr(self, name):
+            raise DynamoSchemaException(
+                "DynamoRecord %s doesn't have '%s' attribute, "
+                "can not set it to '%s'" % (self.__class__, name, value))
+        self._store.set_value(self._key, name, value)
+
+    def _get_raw_dict(self, exclude=None):
+        self._check_data()
+        data = self._store.get_values(self._key)
+        for key in exclude or []:
+            data.pop(key, None)
+        return data
+
+
+class ColumnarData(object):
+    """Mapping {key: record} with records data stored in columns.
+
+    Values other than records (like the NOT_FOUND marker) are kept as is.
+    """
+
+    def __init__(self, record_class):
+        if compression.compressed_fields(record_class):
+            raise DynamoException(
+                'Columnar storage does not support compressed fields: %s' %
+                record_class.__name__)
+        if record_class._version_field:
+            raise DynamoException(
+                'Columnar storage does not support versioned records: %s' %
+                record_class.__name__)
+        self.record_class = record_class
+        self.view_class = view_class(record_class)
+        # {key: row}
+        self.rows = {}
+        # {key: value} for values other than records
+        self.markers = {}
+        self.columns = {}
+        self._free_rows = []
+        self._next_row = 0
+        self._lock = threading.RLock()
+        try:
+            defaults = record_class()._get_raw_dict()
+        except Exception:
+            # the constructor requires arguments, columns are created
+            # by first values
+            defaults = {}
+        for name, value in defaults.items():
+            column = make_column(name, value)
+            self.columns[column.name] = column
+
+    def __getitem__(self, key):
+        if key in self.rows:
+            return self.view_class(self, key)
+        return self.markers[key]
+
+    def __setitem__(self, key, value):
+        if not isinstance(value, DynamoRecord):
+            with self._lock:
+                self._free(key)
+                self.markers[key] = value
+            return
+        if isinstance(value, RecordView) and value._store is self and \
+                value._key == key:
+            # the view of this row, data is already here
+            return
+        data = value._get_raw_dict()
+        with self._lock:
+            self.markers.pop(key, None)
+            row = self.rows.get(key)
+            if row is None:
+                row = self.rows[key] = self._allocate()
+            for name, column in self.columns.items():
+                if name not in data:
+                    column.clear(row)
+            for name, column_value in data.items():
+                self._column(name, column_value).set(row, column_value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key in self.markers:
+                del self.markers[key]
+            elif key in self.rows:
+                self._free(key)
+            else:
+                raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.rows or key in self.markers
+
+    def __iter__(self):
+        for key in list(self.rows):
+            yield key
+        for key in list(self.markers):
+            yield key
+
+    def __len__(self):
+        return len(self.rows) + len(self.markers)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def get_value(self, key, name):
+        """Get the attribute value, raises KeyError if it is not set."""
+        column = self.columns.get(name)
+        if column is None:
+            raise KeyError(name)
+        # the string buffer may be compacted by the concurrent write
+        with self._lock:
+            return column.get(self.rows[key])
+
+    def set_value(self, key, name, value):
+        with self._lock:
+            self._column(name, value).set(self.rows[key], value)
+
+    def get_values(self, key):
+        with self._lock:
+            row = self.rows[key]
+            return dict(
+                (name, column.get(row))
+                for name, column in self.columns.items() if column.has(row))
+
+    def _column(self, name, value):
+        column = self.columns.get(name)
+        if column is None:
+            column = make_column(name, value)
+            self.columns[column.name] = column
+        return column
+
+    def _allocate(self):
+        if self._free_rows:
+            return self._free_rows.pop()
+        row = self._next_row
+        self._next_row += 1
+        return row
+
+    def _free(self, key):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            for column in self.columns.values():
+                column.clear(row)
+            self._free_rows.append(row)
@@ -0,0 +1,210 @@
+"""
+Transparent compression of large record fields.
+
+Large text / JSON fields can be declared as compressed on the record
+class, the field is still set in the `__init__` as usual:
+
+    from dynamo_objects.compression import CompressedField, ZlibCodec
+
+    class Document(DynamoRecord):
+        body = CompressedField(threshold=1024)
+        meta = CompressedField(codec=ZlibCodec(level=9))
+
+        def __init__(self, **data):
+            self.doc_id = ''
+            self.body = ''
+            self.meta = {}
+            super(Document, self).__init__(**data)
+
+When the record is saved, values larger than the threshold (serialized
+size in bytes) are compressed and stored as Binary attributes with the
+codec header, smaller values are stored as is.
+Loaded values are decompressed lazily, on the first access to the field
+(or in `get_dict()`), the record can be loaded and saved back without
+decompressing fields that were not used.
+
+Text, bytes and JSON-serializable values (dicts, lists, numbers) are
+supported, the value type is stored in the header and restored on load.
+"""
+import json
+import zlib
+from decimal import Decimal
+
+from boto.compat import six
+from boto.dynamodb.types import Binary
+
+try:
+    # optional, faster (but with lower ratio) compression
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# value types, stored after the codec header
+TEXT = b't'
+BYTES = b'b'
+JSON = b'j'
+
+HEADER_SIZE = 4
+
+
+class ZlibCodec(object):
+
+    header = b'DOZ1'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def decompress(data):
+        return zlib.decompress(data)
+
+
+class Lz4Codec(object):
+
+    header = b'DOL1'
+
+    def __init__(self, level=0):
+        if lz4 is None:
+            raise ImportError('lz4 package is required for Lz4Codec')
+        self.level = level
+
+    def compress(self, data):
+        return lz4.frame.compress(data, compression_level=self.level)
+
+    @staticmethod
+    def decompress(data):
+        if lz4 is None:
+            raise ImportError('lz4 package is required to read the value')
+        return lz4.frame.decompress(data)
+
+
+# {header: codec class}, used to decompress values
+CODECS = {ZlibCodec.header: ZlibCodec, Lz4Codec.header: Lz4Codec}
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == int(value) else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def serialize(value):
+    """Get (value type, bytes) for the field value."""
+    if isinstance(value, six.text_type):
+        return TEXT, value.encode('utf-8')
+    if isinstance(value, six.binary_type):
+        if six.PY2:
+            try:
+                value.decode('utf-8')
+                return TEXT, value
+            except UnicodeDecodeError:
+                pass
+        return BYTES, value
+    data = json.dumps(value, sort_keys=True, default=json_default)
+    return JSON, data.encode('utf-8')
+
+
+def deserialize(value_type, data):
+    if value_type == TEXT:
+        return data.decode('utf-8')
+    if value_type == BYTES:
+        return data
+    return json.loads(data.decode('utf-8'))
+
+
+def is_compressed(value):
+    return isinstance(value, Binary) and \
+        value.value[:HEADER_SIZE] in CODECS
+
+
+def decompress(value):
+    """Get the field value from the compressed Binary value."""
+    data = value.value
+    codec = CODECS[data[:HEADER_SIZE]]
+    value_type = data[HEADER_SIZE:HEADER_SIZE + 1]
+    return deserialize(
+        value_type, codec.decompress(data[HEADER_SIZE + 1:]))
+
+
+class CompressedField(object):
+    """The record field compressed when saved to the database.
+
+    threshold - min serialized size (in bytes) to compress the value
+    codec - ZlibCodec (default) or Lz4Codec
+    """
+
+    def __init__(self, threshold=1024, codec=None):
+        self.threshold = threshold
+        self.codec = codec or ZlibCodec()
+        self.name = None
+
+    def compress(self, value):
+        """Get the value to store, Binary or the value itself."""
+        if value is None or is_compressed(value):
+            return value
+        value_type, data = serialize(value)
+        if len(data) < self.threshold:
+            return value
+        compressed = self.codec.compress(data)
+        if len(compressed) + HEADER_SIZE + 1 >= len(data):
+            # not compressible
+            return value
+        return Binary(self.codec.header + value_type + compressed)
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        if self.name is None:
+            compressed_fields(cls)
+        try:
+            value = obj.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+        if is_compressed(value):
+            value = obj.__dict__[self.name] = decompress(value)
+        return value
+
+    def __set__(self, obj, value):
+        if self.name is None:
+            compressed_fields(type(obj))
+        obj.__dict__[self.name] = value
+
+
+_class_fields = {}
+
+
+def compressed_fields(cls):
+    """Get {name: CompressedField} for the record class."""
+    try:
+        return _class_fields[cls]
+    except KeyError:
+        pass
+    fields = {}
+    for klass in reversed(cls.__mro__):
+        for name, value in vars(klass).items():
+            if isinstance(value, CompressedField):
+                value.name = name
+                fields[name] = value
+    _class_fields[cls] = fields
+    return fields
+
+
+def decompress_data(fields, data):
+    """Decompress fields in the record data dict (in place)."""
+    for name in fields:
+        if name in data and is_compressed(data[name]):
+            data[name] = decompress(data[name])
+    return data
+
+
+def compress_data(fields, data):
+    """Compress fields in the record data dict (in place)."""
+    for name, field in fields.items():
+        if name in data:
+            data[name] = field.compress(data[name])
+    return data
@@ -1,12 +1,38 @@
+import base64
+import hashlib
+import heapq
+import json
+import threading
+import random
 import time
 import copy
 import boto
+from decimal import Decimal
+
+from boto.compat import six
 
 from boto.dynamodb2 import connect_to_region
 from boto.dynamodb2.table import Table
 from boto.dynamodb2.items import Item
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException
 from boto.dynamodb2.exceptions import ItemNotFound
-from boto.dynamodb.types import Dynamizer
+from boto.dynamodb2.types import STRING
+from dynamo_objects import codec
+from dynamo_objects import compression
+from dynamo_objects import fingerprint
+from dynamo_objects import hotkeys
+from dynamo_objects import transfer
+
+# optional numpy module (False if not installed), used for numeric columns
+# in columnar query / scan results, imported on the first use by get_numpy()
+_numpy = None
+
+NUMBER_TYPES = six.integer_types + (float, Decimal)
+SET_TYPES = ('SS', 'NS', 'BS')
+
+# attribute of counter shard items (the shard number), they are skipped
+# by record-level scans and queries
+COUNTER_SHARD = '_counter_shard'
 
 
 def item_to_dict(item, deep=True, set_to_list=False):
@@ -25,6 +51,218 @@ def item_to_dict(item, deep=True, set_to_list=False):
     return i
 
 
+def item_hash(item):
+    """Get the content hash of the item in the wire format."""
+    data = {}
+    for name, value in item.items():
+        # set values can be returned in any order
+        value = dict(
+            (value_type, sorted(values) if value_type in SET_TYPES
+             else values)
+            for value_type, values in value.items())
+        data[name] = value
+    return hashlib.md5(
+        json.dumps(data, sort_keys=True).encode('utf-8')).digest()
+
+
+def get_numpy():
+    """Import numpy on the first use (it is slow to import).
+
+    Returns None if numpy is not installed.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def column_values(values):
+    """Convert the column to numpy array if all values are numbers.
+
+    Integer columns become int64 arrays, other numeric columns become
+    float64 arrays with NaN for missing values. Values are returned as is
+    if numpy is not available or the column is not numeric.
+    """
+    numpy = get_numpy()
+    if numpy is None:
+        return values
+    numbers = [value for value in values if value is not None]
+    if not numbers:
+        return values
+    for value in numbers:
+        if isinstance(value, bool) or not isinstance(value, NUMBER_TYPES):
+            return values
+    if len(numbers) == len(values) and \
+            all(value == int(value) for value in numbers):
+        try:
+            return numpy.array(
+                [int(value) for value in values], dtype=numpy.int64)
+        except OverflowError:
+            pass
+    return numpy.array(
+        [numpy.nan if value is None else float(value) for value in values],
+        dtype=numpy.float64)
+
+
+def items_to_columns(items, attributes=None):
+    """Convert the list of dicts to columns: {attribute: values}.
+
+    Missing values are None (NaN in numeric numpy arrays).
+    """
+    if attributes is None:
+        names = set()
+        for item in items:
+            names.update(item.keys())
+        attributes = sorted(names)
+    return dict(
+        (name, column_values([item.get(name) for item in items]))
+        for name in attributes)
+
+
+def iter_columns(items, batch_size, attributes=None):
+    """Iterate over batches of items converted to columns."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield items_to_columns(batch, attributes)
+            batch = []
+    if batch:
+        yield items_to_columns(batch, attributes)
+
+
+def prefetch_items(results, pages=1):
+    """Iterate over boto's ResultSet, reading pages ahead.
+
+    Next pages (up to `pages`) are fetched in the background thread while
+    the consumer processes the current page. The `limit` of the result set
+    is applied to the number of items (as boto's iteration does).
+    """
+    buffer = six.moves.queue.Queue(maxsize=pages)
+    stopped = threading.Event()
+    limit = results._limit
+
+    def put(value):
+        # don't block forever if the consumer stopped the iteration
+        while not stopped.is_set():
+            try:
+                buffer.put(value, timeout=0.1)
+                return True
+            except six.moves.queue.Full:
+                pass
+        return False
+
+    def read():
+        count = 0
+        try:
+            while results._results_left and (limit is None or count < limit):
+                results.fetch_more()
+                page = results._results
+                if limit is not None:
+                    page = page[:limit - count]
+                    count += len(page)
+                if not put((page, None)):
+                    return
+        except Exception as e:
+            put((None, e))
+            return
+        put((None, None))
+
+    thread = threading.Thread(target=read)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            page, error = buffer.get()
+            if error is not None:
+                raise error
+            if page is None:
+                return
+            for item in page:
+                yield item
+    finally:
+        stopped.set()
+
+
+def hashable_value(value):
+    """Convert lists, sets and dicts to hashable tuples / frozensets."""
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable_value(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, dict):
+        return tuple(sorted(
+            (key, hashable_value(item)) for key, item in value.items()))
+    return value
+
+
+class Descending(object):
+    """Sort key wrapper for the reversed order."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+# the DynamoTable.map_reduce() job: (table, mapper, reducer, scan kwargs),
+# set before worker processes are forked, so functions are not pickled
+_map_reduce_job = None
+_map_reduce_lock = threading.Lock()
+
+
+def _init_map_reduce_worker():
+    db = DynamoDatabase()
+    if not hasattr(db.get_connection(), 'consumed_capacity'):
+        # the forked process should not use the parent's http connection
+        # (dynamock connection is the forked copy of data, it is used as is)
+        db.reconnect()
+        _map_reduce_job[0]._table = None
+
+
+def _map_reduce_segment(task):
+    """Scan the segment in the worker, returns (has_result, result)."""
+    segment, segments = task
+    table, mapper, reducer, kwargs = _map_reduce_job
+    items = table.table.scan(
+        segment=segment, total_segments=segments, **kwargs)
+    has_result, result = False, None
+    for item in table._skip_counter_shards(items):
+        value = mapper(table._create_record_for_item(item))
+        result = reducer(result, value) if has_result else value
+        has_result = True
+    return has_result, result
+
+
+def encode_cursor(last_key):
+    """Convert the last evaluated key to the url-safe string (page token)."""
+    if not last_key:
+        return None
+    data = codec.default_codec.encode(last_key)
+    data = json.dumps(data, sort_keys=True).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Convert the page token back to the last evaluated key."""
+    try:
+        data = base64.urlsafe_b64decode(str(cursor))
+        data = json.loads(data.decode('utf-8'))
+        return codec.default_codec.decode(data)
+    except (TypeError, ValueError, AttributeError):
+        raise DynamoException('Invalid cursor: %s' % cursor)
+
+
 class DynamoException(Exception):
     pass
 
@@ -33,6 +271,11 @@ class DynamoSchemaException(DynamoException):
     pass
 
 
+class VersionConflictException(DynamoException):
+    """The record was changed (or created) by someone else."""
+    pass
+
+
 class InvalidKeysException(DynamoException):
 
     def __init__(self, record, hashkey, rangekey):
@@ -56,6 +299,13 @@ class DynamoDatabase(object):
     local_dynamodb = False
     table_prefix = ''
     tables = None
+    # lazy connection: tables are listed and checked on the first use
+    lazy = False
+    # shared DynamoTable objects, see DynamoTable.instance()
+    _table_instances = {}
+    _instances_lock = threading.Lock()
+    # connect() parameters, for reconnect()
+    _connect_kwargs = None
 
     def __init__(self):
         pass
@@ -67,7 +317,14 @@ class DynamoDatabase(object):
                 'the database')
         return DynamoDatabase._db_connection
 
-    def connect(self, **kwargs):
+    def connect(self, lazy=False, **kwargs):
+        """Connect to the database.
+
+        With lazy=True tables are not listed on connect and DynamoTable
+        objects check that the table exists (or create it) on the first
+        use instead of in the constructor, so no requests are sent until
+        the data is actually needed.
+        """
         if 'table_prefix' in kwargs:
             DynamoDatabase.table_prefix = kwargs['table_prefix']
             del kwargs['table_prefix']
@@ -75,6 +332,7 @@ class DynamoDatabase(object):
             raise DynamoException(
                 'Already connected, use disconnect() before making a '
                 'new connection')
+        DynamoDatabase._connect_kwargs = dict(kwargs, lazy=lazy)
         if (
             'region_name' in kwargs and
             kwargs['region_name'] == 'localhost'
@@ -92,13 +350,28 @@ class DynamoDatabase(object):
             DynamoDatabase.local_dynamodb = True
         else:  # Real dynamo db
             DynamoDatabase._db_connection = connect_to_region(**kwargs)
-        self.get_tables()
+        DynamoDatabase.lazy = lazy
+        DynamoDatabase.tables = None
+        if not lazy:
+            self.get_tables()
         return DynamoDatabase._db_connection
 
     def disconnect(self):
         if DynamoDatabase._db_connection is not None:
             del DynamoDatabase._db_connection
             DynamoDatabase._db_connection = None
+        self.reset_table_instances()
+
+    def reconnect(self):
+        """Make the new connection with the same parameters.
+
+        The old connection is dropped without closing, this is used in
+        forked processes which should not share connections with the
+        parent process.
+        """
+        DynamoDatabase._db_connection = None
+        self.reset_table_instances()
+        return self.connect(**DynamoDatabase._connect_kwargs)
 
     def connected(self):
         return DynamoDatabase._db_connection is not None
@@ -115,11 +388,36 @@ class DynamoDatabase(object):
                 str(DynamoDatabase._db_connection))
         return DynamoDatabase.tables['TableNames']
 
+    def get_table_instance(self, table_class, *args):
+        """Get the shared table object, created once per connection."""
+        key = (table_class,) + args
+        try:
+            return DynamoDatabase._table_instances[key]
+        except KeyError:
+            pass
+        with DynamoDatabase._instances_lock:
+            if key not in DynamoDatabase._table_instances:
+                DynamoDatabase._table_instances[key] = table_class(*args)
+            return DynamoDatabase._table_instances[key]
+
+    def reset_table_instances(self, table_names=None):
+        """Remove shared table objects (for given table names or all)."""
+        with DynamoDatabase._instances_lock:
+            if table_names is None:
+                DynamoDatabase._table_instances = {}
+                return
+            DynamoDatabase._table_instances = dict(
+                (key, table)
+                for key, table in DynamoDatabase._table_instances.items()
+                if table.table_name not in table_names)
+
     def get_table_name(self, table_name):
         return DynamoDatabase.table_prefix + table_name
 
     def exists(self, table_name):
         if self.get_connection():
+            if DynamoDatabase.tables is None:
+                self.get_tables()
             prefixed_name = self.get_table_name(table_name)
             return prefixed_name in DynamoDatabase.tables['TableNames']
         return False
@@ -144,6 +442,23 @@ class DynamoDatabase(object):
         self.wait_table_active(table_name)
         self.get_tables()
 
+    def create_tables(self, tables):
+        """Create several tables at once and wait until all are active.
+
+        tables - list of dicts with create_table() arguments, like
+            [{'table_name': 'customer', 'schema': [HashKey('id')],
+              'throughput': {'read': 1, 'write': 1}}, ...]
+        """
+        for params in tables:
+            Table.create(
+                self.get_table_name(params['table_name']),
+                schema=params['schema'], throughput=params['throughput'],
+                connection=self.get_connection(),
+                indexes=params.get('indexes'),
+                global_indexes=params.get('global_indexes'))
+        self.wait_tables_active([params['table_name'] for params in tables])
+        self.get_tables()
+
     def get_table(self, table_name):
         return Table(
             self.get_table_name(table_name), connection=self.get_connection())
@@ -179,64 +494,288 @@ class DynamoDatabase(object):
             item_to[key] = val
         return item_to
 
+    def put_new_item(self, table_name, item, hashkey=None):
+        """Save the item only if it does not exist (one conditional put).
+
+        The hash key name is read from the table description if not set.
+        Raises DynamoException if the item already exists.
+        """
+        hashkey = hashkey or self.get_table_key(table_name)[0]
+        try:
+            self.get_connection().put_item(
+                self.get_table_name(table_name),
+                codec.default_codec.encode(dict(item.items())),
+                condition_expression='attribute_not_exists(#key)',
+                expression_attribute_names={'#key': hashkey})
+        except ConditionalCheckFailedException:
+            raise DynamoException(
+                'Item already exists: %s in %s' % (
+                    {hashkey: item[hashkey]}, table_name))
+
     def copy_table_data(
         self, table_name_from, table_name_to,
         update=False, progress=None,
         transform=None
     ):
         table_from = self.get_table(table_name_from)
+        table_to = self.get_table(table_name_to)
         data = table_from.scan()
+        hashkey = self.get_table_key(table_name_to)[0]
         num_moved = 0
         for record in data:
             try:
-                elem = self.copy_item(record, table_name_to, update)
+                if update:
+                    elem = self.copy_item(record, table_name_to, update)
+                else:
+                    # the destination is not read, the conditional put
+                    # raises the error if the item already exists
+                    elem = Item(table_to, dict(record.items()))
                 if transform:
                     transform(elem)
-                elem.save()
+                if update:
+                    elem.save()
+                else:
+                    self.put_new_item(table_name_to, elem, hashkey)
                 if progress:
                     progress.update(1)
                 num_moved += 1
             except:
-                progress.update(0)
+                if progress:
+                    progress.update(0)
                 raise
         return num_moved
 
+    def sync_table_data(
+        self, table_name_from, table_name_to, delete=False, segments=4,
+        progress=None
+    ):
+        """Make the destination table data the same as in the source table.
+
+        Only new and changed items are written: the destination is scanned
+        first (in parallel segments) to get item content hashes, then the
+        source is scanned in parallel and items with different hashes are
+        written with batch writes.
+        Destination items missing in the source are deleted if `delete`
+        is True.
+
+        The progress.update(count) is called for each scanned page of
+        the source table.
+        Returns counts: {'scanned', 'written', 'unchanged', 'deleted',
+        'seconds', 'throughput'} (throughput is scanned items per second).
+        """
+        started = time.time()
+        full_name_from = self.get_table_name(table_name_from)
+        full_name_to = self.get_table_name(table_name_to)
+        key_names = [
+            key for key in self.get_table_key(table_name_to) if key]
+        lock = threading.Lock()
+        hashes = {}
+        counts = {'scanned': 0, 'written': 0, 'unchanged': 0}
+
+        def item_key(item):
+            return json.dumps(
+                dict((name, item[name]) for name in key_names),
+                sort_keys=True)
+
+        def read_hashes(items):
+            page = dict(
+                (item_key(item), item_hash(item)) for item in items)
+            with lock:
+                hashes.update(page)
+
+        def sync_page(items):
+            requests = []
+            unchanged = 0
+            for item in items:
+                key = item_key(item)
+                with lock:
+                    old_hash = hashes.pop(key, None)
+                if old_hash == item_hash(item):
+                    unchanged += 1
+                else:
+                    requests.append({'PutRequest': {'Item': item}})
+            self._batch_write(full_name_to, requests)
+            with lock:
+                counts['scanned'] += len(items)
+                counts['written'] += len(requests)
+                counts['unchanged'] += unchanged
+                if progress:
+                    progress.update(len(items))
+
+        self._parallel_scan(full_name_to, read_hashes, segments)
+        self._parallel_scan(full_name_from, sync_page, segments)
+        counts['deleted'] = 0
+        if delete:
+            counts['deleted'] = self._batch_delete(
+                full_name_to, [json.loads(key) for key in hashes])
+        counts['seconds'] = time.time() - started
+        counts['throughput'] = counts['scanned'] / max(
+            counts['seconds'], 0.001)
+        return counts
+
     def wait_table_active(self, table_name):
-        table = self.get_table(table_name)
-        while True:
-            status = table.describe()['Table']['TableStatus']
-            if status == 'ACTIVE':
-                break
-            time.sleep(1)
+        self.wait_tables_active([table_name])
+
+    def wait_tables_active(self, table_names):
+        pending = set(table_names)
+
+        def check():
+            for table_name in list(pending):
+                info = self.get_table(table_name).describe()['Table']
+                if info['TableStatus'] == 'ACTIVE':
+                    pending.discard(table_name)
+            return not pending
+        self._wait(check)
 
     def delete_table(self, table_name):
+        return self.delete_tables([table_name]) == [table_name]
+
+    def delete_tables(self, table_names):
+        """Delete several tables at once and wait until all are deleted.
+
+        Returns the list of deleted tables.
+        """
+        deleted = []
+        for table_name in table_names:
+            try:
+                self.get_table(table_name).delete()
+            except:
+                continue
+            deleted.append(table_name)
+        self.reset_table_instances(deleted)
+
+        def check():
+            self.get_tables()
+            return not any(self.exists(name) for name in deleted)
+        self._wait(check)
+        return deleted
+
+    def truncate_table(self, table_name, workers=4):
+        """Delete all items from the table, the table itself is kept.
+
+        The table is scanned in parallel segments (only keys are read),
+        items are deleted with batch writes, one worker per segment.
+        Returns the number of deleted items.
+        """
+        full_name = self.get_table_name(table_name)
+        keys = [key for key in self.get_table_key(table_name) if key]
+        connection = self.get_connection()
+
+        def truncate_segment(segment):
+            deleted = 0
+            items, start_key = [], None
+            while True:
+                result = connection.scan(
+                    full_name, attributes_to_get=keys,
+                    exclusive_start_key=start_key,
+                    segment=segment, total_segments=workers)
+                # delete the previous page after the next one is fetched,
+                # so the start key is still there when we read the next page
+                deleted += self._batch_delete(full_name, items)
+                items = result.get('Items', [])
+                start_key = result.get('LastEvaluatedKey')
+                if not start_key:
+                    return deleted + self._batch_delete(full_name, items)
+
+        pool = transfer.thread_pool(workers)
         try:
-            self.get_table(table_name).delete()
-        except:
-            return False
-        while True:
-            if self.exists(table_name):
-                time.sleep(1)
-                self.get_tables()
-            else:
-                return True
+            return sum(pool.map(truncate_segment, range(workers)))
+        finally:
+            pool.close()
+            pool.join()
+
+    def export_table(self, table_name, path, segments=4, shard_size=10000):
+        """Export the table data into the directory with gzipped JSONL shards.
+
+        See the `transfer` module for details.
+        """
+        return transfer.export_table(
+            self.get_connection(), self.get_table_name(table_name), path,
+            segments=segments, shard_size=shard_size)
+
+    def import_table(
+        self, path, table_name, workers=4, rate=None, progress_path=None,
+        progress=None
+    ):
+        """Import data exported with export_table() into the table.
+
+        The table is created if it does not exist, the import can be
+        resumed if it was interrupted. See the `transfer` module for details.
+        """
+        count = transfer.import_table(
+            self.get_connection(), path, self.get_table_name(table_name),
+            workers=workers, rate=rate, progress_path=progress_path,
+            progress=progress)
+        self.get_tables()
+        return count
+
+    def _batch_delete(self, table_name, keys):
+        """Delete items by keys (in the wire format) with batch writes."""
+        self._batch_write(
+            table_name, [{'DeleteRequest': {'Key': key}} for key in keys])
+        return len(keys)
+
+    def _batch_write(self, table_name, requests):
+        """Send put / delete requests (in the wire format) in batches."""
+        connection = self.get_connection()
+        for start in range(0, len(requests), transfer.BATCH_WRITE_SIZE):
+            batch = requests[start:start + transfer.BATCH_WRITE_SIZE]
+            delay = 0.05
+            while batch:
+                result = connection.batch_write_item({table_name: batch})
+                batch = result.get('UnprocessedItems', {}).get(table_name)
+                if batch:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 5)
+
+    def _parallel_scan(self, table_name, process, segments):
+        """Scan the table in parallel segments, process(items) each page."""
+        connection = self.get_connection()
+
+        def scan_segment(segment):
+            start_key = None
+            while True:
+                result = connection.scan(
+                    table_name, exclusive_start_key=start_key,
+                    segment=segment, total_segments=segments)
+                process(result.get('Items', []))
+                start_key = result.get('LastEvaluatedKey')
+                if not start_key:
+                    return
+
+        pool = transfer.thread_pool(segments)
+        try:
+            pool.map(scan_segment, range(segments))
+        finally:
+            pool.close()
+            pool.join()
+
+    def _wait(self, check, delay=0.05, max_delay=5):
+        """Wait until check() returns True, poll with exponential backoff."""
+        while not check():
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
 
     def get_table_throughputs(self, table):
-        info = table.describe()['Table']
-        result = {
-            'table': {
-                'write': info['ProvisionedThroughput']['WriteCapacityUnits'],
-                'read': info['ProvisionedThroughput']['ReadCapacityUnits']
-            }
+        return table_throughputs(table.describe()['Table'])
+
+
+def table_throughputs(info):
+    """Get {'table': {'read', 'write'}, 'IndexName': ...} from description."""
+    result = {
+        'table': {
+            'write': info['ProvisionedThroughput']['WriteCapacityUnits'],
+            'read': info['ProvisionedThroughput']['ReadCapacityUnits']
         }
-        if 'GlobalSecondaryIndexes' in info:
-            for index_info in info['GlobalSecondaryIndexes']:
-                throughput_info = index_info['ProvisionedThroughput']
-                result[index_info['IndexName']] = {
-                    'read': throughput_info['ReadCapacityUnits'],
-                    'write': throughput_info['WriteCapacityUnits']
-                }
-        return result
+    }
+    if 'GlobalSecondaryIndexes' in info:
+        for index_info in info['GlobalSecondaryIndexes']:
+            throughput_info = index_info['ProvisionedThroughput']
+            result[index_info['IndexName']] = {
+                'read': throughput_info['ReadCapacityUnits'],
+                'write': throughput_info['WriteCapacityUnits']
+            }
+    return result
 
 
 class TableThroughput(object):
@@ -311,13 +850,24 @@ class TableThroughput(object):
                 else:
                     raise
         if wait:
-            for table_name in throughputs:
-                self.db.wait_table_active(table_name)
+            # updates are applied in parallel, wait for all tables at once
+            self.db.wait_tables_active(list(throughputs))
 
 
 class DynamoRecord(object):
 
     _strict_schema = False
+    # optimistic locking: the name of the version attribute (it should be
+    # defined in the __init__ like `self.version = 0`), the version is
+    # incremented on save and the save fails with VersionConflictException
+    # if the record was changed in the database after it was loaded
+    _version_field = None
+    # fingerprint.Fingerprint of the loaded item, it is set instead of
+    # the _item if the table has `keep_items = False`
+    _fingerprint = None
+    # the record is stored without the loaded item (like columnar
+    # views), save() overwrites the item
+    _detached = False
 
     def __init__(self, **data):
         self._item = None
@@ -337,6 +887,14 @@ class DynamoRecord(object):
         self._check_data()
 
     def get_dict(self, exclude=None):
+        data = self._get_raw_dict(exclude)
+        fields = compression.compressed_fields(type(self))
+        if fields:
+            compression.decompress_data(fields, data)
+        return data
+
+    def _get_raw_dict(self, exclude=None):
+        # compressed fields are returned as is (may be still compressed)
         exclude = exclude or []
         # this is for the case when the value was assigned directly,
         # like `obj.field = '1'`
@@ -368,6 +926,39 @@ class DynamoRecord(object):
 
 class DynamoTable(object):
 
+    # optional memorydb.QueryCache to cache query() results, set it
+    # in the subclass: `query_cache = QueryCache(ttl=60, max_size=1000)`
+    # cached queries are invalidated on save, delete and update_counter
+    query_cache = None
+
+    # optional coalesce.SingleFlight or coalesce.BatchGetter to merge
+    # concurrent get() requests, set it in the subclass
+    get_coalescer = None
+
+    # sharded counters: {counter name: number of shards}, increments are
+    # spread over shard items (hash key with '#<shard>' suffix, scan and
+    # query skip them), the shard 0 is the item itself, use get_counter()
+    # to read the value
+    counter_shards = {}
+
+    # optional hotkeys.KeySampler to count reads / writes per hash key,
+    # set it in the subclass: `key_sampler = KeySampler(capacity=1000)`
+    key_sampler = None
+
+    # optional writebehind.WriteBehind to queue save() and write records
+    # in background with batch writes, set it in the subclass
+    write_behind = None
+
+    # the table is known to exist: it is not checked (or created), so
+    # the constructor does not send any requests
+    assume_exists = False
+
+    # loaded records keep the boto Item to save changed attributes, set
+    # to False to keep the compact fingerprint.Fingerprint instead
+    keep_items = True
+
+    _create_lock = threading.Lock()
+
     def __init__(
         self, table_name, schema, throughput,
         record_class, global_indexes=None
@@ -378,14 +969,35 @@ class DynamoTable(object):
         self.global_indexes = global_indexes
         self.throughput = throughput
         self.record_class = record_class
-        if not self.db.exists(self.table_name):
-            self._create_table()
-        self.table = self.db.get_table(self.table_name)
+        self._table = None
+        if not DynamoDatabase.lazy:
+            self._get_table()
         self.hashkey = self.schema[0].name
         self.rangekey = None
         if len(self.schema) > 1:
             self.rangekey = self.schema[1].name
 
+    @classmethod
+    def instance(cls, *args):
+        """Get the shared table object.
+
+        The table object (with its boto Table) is created once per
+        connection and reused, instead of `StoreTable()` on every call
+        use `StoreTable.instance()`.
+        """
+        return DynamoDatabase().get_table_instance(cls, *args)
+
+    @property
+    def table(self):
+        """The boto Table object."""
+        return self._table or self._get_table()
+
+    @table.setter
+    def table(self, table):
+        # the boto Table can be replaced (for example, with the table of
+        # the different connection), it is not checked or created
+        self._table = table
+
     def get(self, hashkey, rangekey=None, create=False):
         try:
             keys_data = self._get_keys_dict(hashkey, rangekey)
@@ -401,12 +1013,16 @@ class DynamoTable(object):
         try:
             item = self._get_boto_item(keys_data)
         except ItemNotFound:
+            if self.key_sampler is not None:
+                self._sample('read', keys_data, units=1)
             # create the new item if requested
             # or raise the ItemNotFound otherwise
             if create:
                 cls = self.record_class
                 return cls(**keys_data)
             raise
+        if self.key_sampler is not None:
+            self._sample('read', item)
         return self._create_record_for_item(item)
 
     def find(self, hashkey, rangekey=None, default=None):
@@ -418,51 +1034,650 @@ class DynamoTable(object):
     def delete(self, hashkey, rangekey=None):
         item = self.table.get_item(**self._get_keys_dict(hashkey, rangekey))
         item.delete()
+        self._invalidate_query_cache(item)
+        if self.key_sampler is not None:
+            self._sample('write', item)
         return self._create_record_for_item(item)
 
     def save(self, record):
         # verify that keys are valid
         self._get_record_keys(record)
-        item = self._get_item_for_record(record)
-        if record._item:
-            # update existing record
-            item.partial_save()
+        if record._version_field:
+            return self._save_versioned(record)
+        if self.write_behind is not None:
+            return self.write_behind.save(self, record)
+        if record._fingerprint is not None and record._item is None:
+            return self._save_fingerprinted(record)
+        return self._save_record(record)
+
+    def query(self, prefetch=0, cache=True, **kwargs):
+        """Query records, parameters are the same as for boto's query_2.
+
+        If prefetch is set, up to `prefetch` next pages are fetched in
+        the background while the current page is processed.
+        If the table has the query_cache, results are cached (use
+        cache=False to skip the cache).
+        """
+        if cache and self.query_cache is not None:
+            items = self._skip_counter_shards(
+                self._cached_query_items(kwargs))
         else:
-            # new item was created, full save
-            item.save()
-
-    def query(self, **kwargs):
-        items = self.table.query_2(**kwargs)
+            items = self._iter_items(self.table.query_2(**kwargs), prefetch)
+        if self.key_sampler is not None:
+            items = self._sampled_query(items, kwargs)
         for item in items:
             yield self._create_record_for_item(item)
 
+    def query_many(
+        self, hash_values, merge=False, limit=None, workers=8, **kwargs
+    ):
+        """Run the same query for several hash keys concurrently.
+
+        Parameters are the same as for query(), except the hash key
+        condition (the hash key of the index if the index is given),
+        at most `workers` queries run at once.
+
+        Returns {hash_value: [records]}, the limit is per hash key.
+        With merge=True returns records of all hash keys merged by the
+        range key (in the order of the `reverse` parameter), up to `limit`
+        records in total. Next pages are read in the background, once
+        the limit is reached no more pages are requested.
+        """
+        hash_values = list(hash_values)
+        hash_name = self._index_hash_keys().get(
+            kwargs.get('index'), self.hashkey)
+        queries = []
+        for value in hash_values:
+            query = dict(kwargs, limit=limit)
+            query[hash_name + '__eq'] = value
+            queries.append(query)
+        if merge:
+            return self._merge_queries(queries, hash_name, limit, workers)
+        pool = transfer.thread_pool(max(1, min(workers, len(queries))))
+        try:
+            results = pool.map(
+                lambda query: list(self.query(**query)), queries)
+        finally:
+            pool.close()
+            pool.join()
+        return dict(zip(hash_values, results))
+
     def query_count(self, **kwargs):
         return self.table.query_count(**kwargs)
 
-    def scan(self, **kwargs):
-        items = self.table.scan(**kwargs)
+    def scan(self, prefetch=0, **kwargs):
+        items = self._iter_items(self.table.scan(**kwargs), prefetch)
         for item in items:
             yield self._create_record_for_item(item)
 
+    def query_page(self, page_size, cursor=None, **kwargs):
+        """Query one page of records, returns (records, next_cursor).
+
+        The cursor is a string token to get the next page (None if there
+        is no more data), it should be used with the same query parameters.
+        """
+        results = self.table.query_2(max_page_size=page_size, **kwargs)
+        return self._fetch_page(results, cursor)
+
+    def scan_page(self, page_size, cursor=None, **kwargs):
+        """Scan one page of records, returns (records, next_cursor)."""
+        results = self.table.scan(max_page_size=page_size, **kwargs)
+        return self._fetch_page(results, cursor)
+
+    def truncate(self, workers=4):
+        """Delete all records from the table."""
+        return self.db.truncate_table(self.table_name, workers)
+
+    def map_reduce(
+        self, mapper, reducer, initial=None, segments=8, processes=None,
+        **kwargs
+    ):
+        """Process all records in parallel processes.
+
+        Like reduce(reducer, map(mapper, scan()), initial), but segments
+        of the table are scanned in `processes` worker processes (the CPU
+        count by default). Workers create records and reduce mapped values
+        of each segment, only segment results are sent back and reduced,
+        so the reducer should be associative and commutative.
+        Other parameters are passed to scan (like filters).
+
+        Workers are forked, so mapper and reducer can be any functions
+        (not only picklable ones), but results should be picklable.
+        Without fork support, segments are processed in this process.
+        """
+        global _map_reduce_job
+        tasks = [(segment, segments) for segment in range(segments)]
+        has_result, result = initial is not None, initial
+        with _map_reduce_lock:
+            _map_reduce_job = (self, mapper, reducer, kwargs)
+            try:
+                pool = transfer.fork_pool(
+                    processes, _init_map_reduce_worker)
+                if pool is None:
+                    results = (_map_reduce_segment(task) for task in tasks)
+                else:
+                    results = pool.imap_unordered(
+                        _map_reduce_segment, tasks)
+                try:
+                    for has_part, part in results:
+                        if has_part:
+                            result = reducer(result, part) \
+                                if has_result else part
+                            has_result = True
+                finally:
+                    if pool is not None:
+                        pool.close()
+                        pool.join()
+            finally:
+                _map_reduce_job = None
+        return result
+
+    def query_raw(self, prefetch=0, **kwargs):
+        """Query items as plain dicts (stored attributes only).
+
+        This is faster than query() as records are not created, use it
+        when the data is processed as dicts anyway.
+        """
+        items = self._iter_items(self.table.query_2(**kwargs), prefetch)
+        for item in items:
+            yield dict(item.items())
+
+    def scan_raw(self, prefetch=0, **kwargs):
+        """Scan items as plain dicts (stored attributes only)."""
+        items = self._iter_items(self.table.scan(**kwargs), prefetch)
+        for item in items:
+            yield dict(item.items())
+
+    def query_columns(self, batch_size=10000, attributes=None, **kwargs):
+        """Query items in batches of columns: {attribute: values}.
+
+        Numeric attributes are numpy arrays if numpy is installed,
+        so aggregations can be vectorized, other values are lists.
+        If attributes are given, only these attributes are read.
+        """
+        return iter_columns(
+            self.query_raw(attributes=attributes, **kwargs),
+            batch_size, attributes)
+
+    def scan_columns(self, batch_size=10000, attributes=None, **kwargs):
+        """Scan items in batches of columns: {attribute: values}."""
+        return iter_columns(
+            self.scan_raw(attributes=attributes, **kwargs),
+            batch_size, attributes)
+
     def update_counter(self, hashkey, rangekey=None, **kwargs):
-        dyn = Dynamizer()
+        record_codec = self._get_codec()
         counter = list(kwargs.keys())[0]
         inc = list(kwargs.values())[0]
         connection = self.db.get_connection()
         keys = self._get_keys_dict(hashkey, rangekey)
-        for key in keys:
-            keys[key] = dyn.encode(keys[key])
+        update_expression = "SET #counter = #counter + :inc"
+        names = {'#counter': counter}
+        values = {':inc': record_codec.encode_value(counter, inc)}
+        shards = self._get_counter_shards(counter)
+        if shards > 1:
+            shard = random.randrange(shards)
+            keys = self._get_counter_shard_keys(hashkey, rangekey, shard)
+            if shard:
+                # shard items are created on the first update, they are
+                # marked to skip them in scan / query results
+                update_expression = "ADD #counter :inc SET #shard = :shard"
+                names['#shard'] = COUNTER_SHARD
+                values[':shard'] = {'N': str(shard)}
+            else:
+                update_expression = "ADD #counter :inc"
+        if self.key_sampler is not None:
+            self._sample('write', keys, units=1)
         self.db.get_connection().update_item(
             table_name=self.db.get_table_name(self.table_name),
-            key=keys,
-            update_expression="SET #counter = #counter + :inc",
-            expression_attribute_names={'#counter': counter},
-            expression_attribute_values={':inc': dyn.encode(kwargs[counter])},
+            key=record_codec.encode(keys),
+            update_expression=update_expression,
+            expression_attribute_names=names,
+            expression_attribute_values=values,
             return_values="UPDATED_NEW")
+        if self.query_cache is not None:
+            if counter in self._index_hash_keys().values():
+                # old value of the index key is unknown
+                self.query_cache.invalidate([(self.table_name,)])
+            else:
+                self._invalidate_query_cache(
+                    self._get_keys_dict(hashkey, rangekey))
+
+    def get_counter(self, counter, hashkey, rangekey=None):
+        """Get the counter value, sums all shards for sharded counters."""
+        keys = [
+            self._get_counter_shard_keys(hashkey, rangekey, shard)
+            for shard in range(self._get_counter_shards(counter))]
+        items = self.table.batch_get(keys=keys, attributes=[counter])
+        return sum(item.get(counter) or 0 for item in items)
+
+    def compact_counter(self, counter, hashkey, rangekey=None):
+        """Move values of counter shards into the item itself (shard 0).
+
+        Each value is subtracted from the shard and added to the item with
+        atomic updates, so concurrent increments are not lost.
+        Returns the moved value.
+        """
+        shards = self._get_counter_shards(counter)
+        keys = [
+            self._get_counter_shard_keys(hashkey, rangekey, shard)
+            for shard in range(1, shards)]
+        if not keys:
+            return 0
+        key_names = [key for key in (self.hashkey, self.rangekey) if key]
+        moved = 0
+        items = self.table.batch_get(
+            keys=keys, attributes=[counter] + key_names)
+        for item in items:
+            value = item.get(counter)
+            if not value:
+                continue
+            shard_keys = dict((key, item[key]) for key in key_names)
+            self._add_to_counter(shard_keys, counter, -value)
+            moved += value
+        if moved:
+            self._add_to_counter(
+                self._get_keys_dict(hashkey, rangekey), counter, moved)
+        return moved
+
+    def _add_to_counter(self, keys, counter, value):
+        record_codec = self._get_codec()
+        self.db.get_connection().update_item(
+            table_name=self.db.get_table_name(self.table_name),
+            key=record_codec.encode(keys),
+            update_expression="ADD #counter :inc",
+            expression_attribute_names={'#counter': counter},
+            expression_attribute_values={
+                ':inc': record_codec.encode_value(counter, value)})
+
+    def _save_versioned(self, record):
+        """Save the record with the version check (one conditional write).
+
+        New records (not loaded from the database) are inserted only if
+        the item does not exist, loaded records are updated only if the
+        version in the database is the same as when it was loaded.
+        """
+        field = record._version_field
+        version = getattr(record, field) or 0
+        data = self._get_safe_data(self._get_record_data(record))
+        data[field] = version + 1
+        keys = self._get_keys_dict(*self._get_record_keys(record))
+        record_codec = self._get_codec()
+        old_data = None
+        connection = self.db.get_connection()
+        table_name = self.table.table_name
+        try:
+            if record._item is None and record._fingerprint is None:
+                connection.put_item(
+                    table_name,
+                    record_codec.encode(data),
+                    condition_expression='attribute_not_exists(#key)',
+                    expression_attribute_names={'#key': self.hashkey})
+            else:
+                names = {'#version': field}
+                values = {}
+                if record._item is not None:
+                    old_data = dict(record._item.items())
+                    changed = [
+                        key for key in set(old_data) | set(data)
+                        if old_data.get(key) != data.get(key)]
+                else:
+                    old_data = record._fingerprint.get_keys(
+                        self._fingerprint_keys())
+                    changed = record._fingerprint.changes(data)
+                if old_data.get(field) is not None:
+                    condition = '#version = :version'
+                    values[':version'] = record_codec.encode_value(
+                        field, old_data[field])
+                else:
+                    condition = 'attribute_not_exists(#version)'
+                connection.update_item(
+                    table_name,
+                    record_codec.encode(keys),
+                    update_expression=self._update_expression(
+                        changed, data, keys, names, values),
+                    condition_expression=condition,
+                    expression_attribute_names=names,
+                    expression_attribute_values=values)
+        except ConditionalCheckFailedException:
+            raise VersionConflictException(
+                'Version conflict for %s %s, version %s' % (
+                    self.table_name, keys, version))
+        setattr(record, field, version + 1)
+        self._set_loaded(record, data)
+        self._invalidate_query_cache(data, old_data)
+        if self.key_sampler is not None:
+            self._sample('write', data)
+
+    def _save_record(self, record):
+        """Save the record with the request encoded by the codec.
+
+        New records are put if the item does not exist, loaded records
+        are updated with attributes changed since load if they were not
+        changed in the database (like boto's Item.save / partial_save).
+        The loaded record with changed keys is saved as the new item, the
+        loaded item is not changed.
+        """
+        data = self._get_safe_data(self._get_record_data(record))
+        keys = self._get_keys_dict(*self._get_record_keys(record))
+        record_codec = self._get_codec()
+        connection = self.db.get_connection()
+        # the table is checked (or created) on the first use
+        table_name = self.table.table_name
+        old_data = None
+        if record._item:
+            # values before update, also to invalidate queries by old
+            # index keys
+            old_data = dict(record._item.items())
+            if any(old_data.get(name) != value
+                   for name, value in keys.items()):
+                # keys were changed, this is the new item
+                old_data = None
+        if old_data is None and record._detached:
+            connection.put_item(table_name, record_codec.encode(data))
+        elif old_data is None:
+            connection.put_item(
+                table_name,
+                record_codec.encode(data),
+                condition_expression='attribute_not_exists(#key)',
+                expression_attribute_names={'#key': self.hashkey})
+        else:
+            changed = [
+                key for key in set(old_data) | set(data)
+                if key not in keys and old_data.get(key) != data.get(key)]
+            if not changed:
+                return
+            names, values = {}, {}
+            expression = self._update_expression(
+                changed, data, keys, names, values)
+            conditions = []
+            for name, key in sorted(names.items()):
+                if key in old_data:
+                    value_name = ':o' + name[1:]
+                    conditions.append('%s = %s' % (name, value_name))
+                    values[value_name] = record_codec.encode_value(
+                        key, old_data[key])
+                else:
+                    conditions.append('attribute_not_exists(%s)' % name)
+            connection.update_item(
+                table_name,
+                record_codec.encode(keys),
+                update_expression=expression,
+                condition_expression=' AND '.join(conditions),
+                expression_attribute_names=names,
+                expression_attribute_values=values or None)
+        self._set_loaded(record, data)
+        self._invalidate_query_cache(data, old_data)
+        if self.key_sampler is not None:
+            self._sample('write', data)
+
+    def _save_fingerprinted(self, record):
+        """Update attributes changed since load (see the fingerprint)."""
+        data = self._get_safe_data(self._get_record_data(record))
+        keys = self._get_keys_dict(*self._get_record_keys(record))
+        old_data = record._fingerprint.get_keys(self._fingerprint_keys())
+        if any(old_data.get(key) != value for key, value in keys.items()):
+            # keys were changed, this is the new item
+            Item(self.table, data=data).save()
+        else:
+            changed = record._fingerprint.changes(data)
+            if not changed:
+                return
+            names, values = {}, {}
+            self.db.get_connection().update_item(
+                self.db.get_table_name(self.table_name),
+                self._get_codec().encode(keys),
+                update_expression=self._update_expression(
+                    changed, data, keys, names, values),
+                expression_attribute_names=names,
+                expression_attribute_values=values or None)
+        self._set_loaded(record, data)
+        self._invalidate_query_cache(data, old_data)
+        if self.key_sampler is not None:
+            self._sample('write', data)
+
+    def _update_expression(self, changed, data, keys, names, values):
+        """Get SET / REMOVE expression for changed attributes."""
+        record_codec = self._get_codec()
+        updates, removes = [], []
+        for num, key in enumerate(sorted(changed)):
+            if key in keys:
+                continue
+            name = '#a%s' % num
+            names[name] = key
+            if key in data:
+                values[':a%s' % num] = record_codec.encode_value(
+                    key, data[key])
+                updates.append('%s = :a%s' % (name, num))
+            else:
+                removes.append(name)
+        expression = []
+        if updates:
+            expression.append('SET ' + ', '.join(updates))
+        if removes:
+            expression.append('REMOVE ' + ', '.join(removes))
+        return ' '.join(expression)
+
+    def _fingerprint_keys(self):
+        """Get names of attributes which values are kept in fingerprints:
+        keys of the table and indexes and the version field."""
+        names = [self.hashkey]
+        if self.rangekey:
+            names.append(self.rangekey)
+        for name in sorted(set(self._index_hash_keys().values())):
+            if name not in names:
+                names.append(name)
+        version = self.record_class._version_field
+        if version and version not in names:
+            names.append(version)
+        return names
+
+    def _set_loaded(self, record, data):
+        """Keep the loaded (or saved) state of the record."""
+        if self.keep_items:
+            record._item = Item(self.table, data=data, loaded=True)
+        else:
+            record._fingerprint = fingerprint.Fingerprint(
+                data, self._fingerprint_keys())
+
+    def _get_counter_shards(self, counter):
+        """Get the number of counter shards (1 if it is not sharded)."""
+        shards = self.counter_shards.get(counter) or 1
+        if shards > 1 and self.schema[0].data_type != STRING:
+            raise DynamoException(
+                'Sharded counters require the string hash key')
+        return shards
+
+    def _get_counter_shard_keys(self, hashkey, rangekey, shard):
+        keys = self._get_keys_dict(hashkey, rangekey)
+        if shard:
+            keys[self.hashkey] = '%s#%d' % (keys[self.hashkey], shard)
+        return keys
+
+    def _cached_query_items(self, kwargs):
+        cache = self.query_cache
+        try:
+            key = (self.table_name, hashable_value(kwargs))
+            hash(key)
+        except TypeError:
+            # unhashable query parameters, don't cache
+            return self.table.query_2(**kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            # copy, so changes in records do not affect the cache
+            return [
+                Item(self.table, copy.deepcopy(data), loaded=True)
+                for data in cached]
+        version = cache.version
+        items = list(self.table.query_2(**kwargs))
+        cache.put(
+            key, [copy.deepcopy(dict(item.items())) for item in items],
+            self._query_cache_tags(kwargs), version)
+        return items
+
+    def _sample(self, operation, data, units=None, index=None,
+                hash_name=None):
+        """Count the read / write of the item (dict) in the key sampler."""
+        value = data.get(hash_name or self.hashkey)
+        self.key_sampler.record(
+            self.table_name, operation, hashable_value(value),
+            units or hotkeys.item_units(data, operation), index)
+
+    def _sampled_query(self, items, kwargs):
+        # the query reads 4KB units of all items, count it when done
+        index = kwargs.get('index')
+        hash_name = self._index_hash_keys().get(index, self.hashkey)
+        size = 0
+        try:
+            for item in items:
+                size += hotkeys.item_size(item)
+                yield item
+        finally:
+            self._sample(
+                'read', {hash_name: kwargs.get(hash_name + '__eq')},
+                hotkeys.size_units(size, 'read'), index, hash_name)
+
+    def _merge_queries(self, queries, hash_name, limit, workers):
+        index = queries[0].get('index') if queries else None
+        range_name = self._index_range_key(index)
+        if range_name is None:
+            raise DynamoException('Merged query requires the range key')
+        sort_key = Descending if queries and queries[0].get('reverse') \
+            else (lambda value: value)
+        stopped = threading.Event()
+
+        def fetch(results, hash_value):
+            if stopped.is_set():
+                return []
+            results.fetch_more()
+            page = results._results
+            if self.key_sampler is not None:
+                size = sum(hotkeys.item_size(item) for item in page)
+                self._sample(
+                    'read', {hash_name: hash_value},
+                    hotkeys.size_units(size, 'read'), index, hash_name)
+            return page
+
+        def request(num):
+            pending[num] = pool.apply_async(
+                fetch, (results[num], queries[num][hash_name + '__eq']))
+
+        def advance(num):
+            # push the next item of the query to the heap
+            while True:
+                item = next(pages[num], None)
+                if item is not None:
+                    heapq.heappush(
+                        heap, (sort_key(item[range_name]), num, item))
+                    return
+                if pending[num] is None:
+                    return
+                page = pending[num].get()
+                pending[num] = None
+                if results[num]._results_left:
+                    # read ahead while the page is consumed
+                    request(num)
+                pages[num] = iter(page)
+
+        if not queries or limit is not None and limit <= 0:
+            return
+        pool = transfer.thread_pool(min(workers, len(queries)))
+        results = [self.table.query_2(**query) for query in queries]
+        pending = [None] * len(queries)
+        pages = [iter([])] * len(queries)
+        heap = []
+        count = 0
+        try:
+            for num in range(len(queries)):
+                request(num)
+            for num in range(len(queries)):
+                advance(num)
+            while heap:
+                __, num, item = heapq.heappop(heap)
+                if self.counter_shards and item.get(COUNTER_SHARD) is not None:
+                    advance(num)
+                    continue
+                yield self._create_record_for_item(item)
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+                advance(num)
+        finally:
+            stopped.set()
+            pool.close()
+            pool.join()
+
+    def _index_range_key(self, index=None):
+        if index is None:
+            return self.rangekey
+        for global_index in self.global_indexes or []:
+            if global_index.name == index and len(global_index.parts) > 1:
+                return global_index.parts[1].name
+        return None
+
+    def _index_hash_keys(self):
+        """Get {index_name: hash key name}, None is for the table itself."""
+        keys = {None: self.hashkey}
+        for index in self.global_indexes or []:
+            keys[index.name] = index.parts[0].name
+        return keys
+
+    def _query_cache_tags(self, kwargs):
+        hash_name = self._index_hash_keys().get(
+            kwargs.get('index'), self.hashkey)
+        value = kwargs.get(hash_name + '__eq')
+        if value is None:
+            # invalidated on any change in the table
+            return [(self.table_name,), (self.table_name, None, None)]
+        return [(self.table_name,), (self.table_name, hash_name, value)]
+
+    def _invalidate_query_cache(self, *items):
+        if self.query_cache is None:
+            return
+        tags = set([(self.table_name, None, None)])
+        for name in set(self._index_hash_keys().values()):
+            for item in items:
+                value = item.get(name) if item is not None else None
+                if value is not None:
+                    tags.add((self.table_name, name, value))
+        self.query_cache.invalidate(tags)
+
+    def _iter_items(self, results, prefetch=0):
+        if prefetch:
+            results = prefetch_items(results, prefetch)
+        return self._skip_counter_shards(results)
+
+    def _skip_counter_shards(self, items):
+        """Skip items of counter shards (if the table has sharded
+        counters)."""
+        if not self.counter_shards:
+            return items
+        return (item for item in items if item.get(COUNTER_SHARD) is None)
+
+    def _fetch_page(self, results, cursor=None):
+        if cursor:
+            # continue the query from the given key
+            results._last_key_seen = decode_cursor(cursor)
+        results.fetch_more()
+        records = [
+            self._create_record_for_item(item)
+            for item in self._skip_counter_shards(results._results)]
+        return records, encode_cursor(results._last_key_seen)
 
     def _get_boto_item(self, keys_data):
+        if self.get_coalescer is not None:
+            return self.get_coalescer.get(self.table, keys_data)
         return self.table.get_item(**keys_data)
 
+    def _get_table(self):
+        with self._create_lock:
+            if self._table is None:
+                if not self.assume_exists and \
+                        not self.db.exists(self.table_name):
+                    self._create_table()
+                self._table = self.db.get_table(self.table_name)
+        return self._table
+
     def _create_table(self):
         self.db.create_table(
             table_name=self.table_name,
@@ -502,20 +1717,25 @@ class DynamoTable(object):
             key_data[self.rangekey] = keys[1]
         return key_data
 
-    def _get_safe_data(self, dictionary, checker=None):
-        checker = checker or Item(self.table)
-        data = {}
-        for key in dictionary:
-            if isinstance(dictionary[key], dict):
-                data[key] = self._get_safe_data(dictionary[key], checker)
-            elif checker._is_storable(dictionary[key]):
-                data[key] = dictionary[key]
-        return data
+    def _get_safe_data(self, dictionary):
+        return codec.storable_data(dictionary)
+
+    def _get_codec(self):
+        """Get the wire format codec of the record class."""
+        return codec.record_codec(self.record_class)
+
+    def _get_record_data(self, record):
+        """Get record data to save, compressed fields are encoded."""
+        fields = compression.compressed_fields(type(record))
+        if not fields:
+            return record.get_dict()
+        # fields not accessed after load are still compressed
+        return compression.compress_data(fields, record._get_raw_dict())
 
     def _get_item_for_record(self, record):
         if record._item:
             item = record._item
-            data = record.get_dict()
+            data = self._get_record_data(record)
             for key in data:
                 if item._is_storable(data[key]) or key in item:
                     # only copy storable fields or those we want to reset
@@ -525,7 +1745,7 @@ class DynamoTable(object):
                     item[key] = data[key]
             return item
         else:
-            data = self._get_safe_data(record.get_dict())
+            data = self._get_safe_data(self._get_record_data(record))
             item = Item(self.table, data=data)
             return item
 
@@ -545,6 +1765,12 @@ class DynamoTable(object):
         #     return None
         cls = self.record_class
         obj = cls()
-        obj.update_data_safe(**item_to_dict(item))
-        obj._item = item
+        data = item_to_dict(item)
+        # compressed fields are decompressed on the first access
+        obj.update_data_safe(**data)
+        if self.keep_items:
+            obj._item = item
+        else:
+            obj._fingerprint = fingerprint.Fingerprint(
+                data, self._fingerprint_keys())
         return obj
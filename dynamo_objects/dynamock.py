@@ -1,9 +1,68 @@
-from collections import defaultdict
+import copy
+import itertools
+import threading
+import time
+import zlib
 
+from boto.compat import six
+from boto.dynamodb2 import exceptions
 from boto.dynamodb2.fields import HashKey, RangeKey
+from boto.dynamodb2.fields import AllIndex, KeysOnlyIndex, IncludeIndex
+from boto.dynamodb2.fields import GlobalAllIndex, GlobalKeysOnlyIndex
+from boto.dynamodb2.fields import GlobalIncludeIndex
 from boto.dynamodb2.exceptions import ItemNotFound
+from boto.dynamodb2.results import ResultSet
 from boto.dynamodb.types import Dynamizer
 
+from dynamo_objects import codec
+from dynamo_objects import expressions
+from dynamo_objects import hotkeys
+from dynamo_objects.mockstorage import MemoryStorage, order_key
+
+ERROR_PREFIX = 'com.amazonaws.dynamodb.v20120810#'
+
+# simulated throughput limits: number of decreases per table per day and
+# number of describe_table calls the table stays UPDATING after the update
+MAX_DECREASES_PER_DAY = 27
+UPDATING_DESCRIBES = 1
+
+# change streams: one shard per table, the stream is kept in memory
+STREAM_ARN = 'arn:aws:dynamodb:local:000000000000:table/%s/stream/mock'
+STREAM_SHARD_ID = 'shardId-00000000000000000001'
+STREAM_VIEW_TYPES = (
+    'KEYS_ONLY', 'NEW_IMAGE', 'OLD_IMAGE', 'NEW_AND_OLD_IMAGES')
+
+# legacy (KeyConditions / QueryFilter / ScanFilter) comparison operators
+# mapped to the boto's filter names (like `name__beginswith`)
+COMPARISON_OPERATORS = {
+    'EQ': 'eq',
+    'NE': 'ne',
+    'LE': 'lte',
+    'LT': 'lt',
+    'GE': 'gte',
+    'GT': 'gt',
+    'BETWEEN': 'between',
+    'BEGINS_WITH': 'beginswith',
+    'IN': 'in',
+    'CONTAINS': 'contains',
+    'NOT_CONTAINS': 'ncontains',
+    'NULL': 'null',
+    'NOT_NULL': 'nnull',
+}
+
+PROJECTION_INDEXES = {
+    'local': {
+        'ALL': AllIndex,
+        'KEYS_ONLY': KeysOnlyIndex,
+        'INCLUDE': IncludeIndex,
+    },
+    'global': {
+        'ALL': GlobalAllIndex,
+        'KEYS_ONLY': GlobalKeysOnlyIndex,
+        'INCLUDE': GlobalIncludeIndex,
+    }
+}
+
 
 def mock_item_to_dict(item, deep=True, set_to_list=False):
     i = dict()
@@ -22,33 +81,569 @@ def mock_item_to_dict(item, deep=True, set_to_list=False):
     return i
 
 
+_dynamizer = Dynamizer()
+_storage = None
+
+
+def set_storage(storage):
+    """Set the storage engine for new mock connections.
+
+    Use None to switch back to the default in-memory storage.
+    """
+    global _storage
+    _storage = storage
+
+
+def _error(exception_class, message):
+    """Build the boto exception like the real DynamoDB connection does."""
+    return exception_class(
+        400, 'Bad Request',
+        body={
+            '__type': ERROR_PREFIX + exception_class.__name__,
+            'message': message
+        })
+
+
+def encode_item(item):
+    """Convert python values to DynamoDB wire format ({'S': 'value'})."""
+    return dict(
+        (key, _dynamizer.encode(value)) for key, value in item.items())
+
+
+def decode_item(raw_item):
+    """Convert DynamoDB wire format to python values."""
+    return codec.default_codec.decode(raw_item)
+
+
+class Stream(object):
+    """Ordered change records of the table, like DynamoDB Streams.
+
+    Records are in the DynamoDB Streams format: INSERT, MODIFY or REMOVE
+    events with keys and old / new images (depending on the view type).
+    Writes that do not change the item are not recorded.
+    """
+
+    def __init__(self, table_name, view_type='NEW_AND_OLD_IMAGES'):
+        if view_type not in STREAM_VIEW_TYPES:
+            raise _error(
+                exceptions.ValidationException,
+                'Invalid StreamViewType: %s' % view_type)
+        self.table_name = table_name
+        self.arn = STREAM_ARN % table_name
+        self.view_type = view_type
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, keys, old, new):
+        if old == new:
+            return
+        if old is None:
+            event = 'INSERT'
+        elif new is None:
+            event = 'REMOVE'
+        else:
+            event = 'MODIFY'
+        change = {
+            'ApproximateCreationDateTime': time.time(),
+            'Keys': encode_item(keys),
+            'StreamViewType': self.view_type,
+            'SizeBytes': (
+                hotkeys.item_size(old or {}) + hotkeys.item_size(new or {}))
+        }
+        if old is not None and self.view_type in (
+                'OLD_IMAGE', 'NEW_AND_OLD_IMAGES'):
+            change['OldImage'] = encode_item(old)
+        if new is not None and self.view_type in (
+                'NEW_IMAGE', 'NEW_AND_OLD_IMAGES'):
+            change['NewImage'] = encode_item(new)
+        with self._lock:
+            sequence = len(self.records) + 1
+            change['SequenceNumber'] = sequence_number(sequence)
+            self.records.append({
+                'eventID': str(sequence),
+                'eventName': event,
+                'eventVersion': '1.1',
+                'eventSource': 'aws:dynamodb',
+                'awsRegion': 'local',
+                'dynamodb': change
+            })
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+
+def sequence_number(position):
+    return '%021d' % position
+
+
+def stream_iterator(stream_arn, position):
+    """The iterator is the stream and the position of the next record."""
+    return '%s|%s|%d' % (stream_arn, STREAM_SHARD_ID, position)
+
+
+def throughput_from_wire(throughput):
+    if throughput is None or 'ReadCapacityUnits' not in throughput:
+        return throughput
+    return {
+        'read': int(throughput['ReadCapacityUnits']),
+        'write': int(throughput['WriteCapacityUnits'])
+    }
+
+
+def schema_from_wire(key_schema, attribute_definitions=None):
+    """Convert wire KeySchema to boto's HashKey / RangeKey objects.
+
+    Boto field objects (as passed by the mocked Table.create) are
+    returned as is.
+    """
+    types = {}
+    for definition in attribute_definitions or []:
+        if isinstance(definition, dict):
+            types[definition['AttributeName']] = definition['AttributeType']
+    schema = []
+    for field in key_schema:
+        if not isinstance(field, dict):
+            schema.append(field)
+            continue
+        name = field['AttributeName']
+        field_class = HashKey if field['KeyType'] == 'HASH' else RangeKey
+        schema.append(field_class(name, data_type=types.get(name, 'S')))
+    return schema
+
+
+def indexes_from_wire(indexes, attribute_definitions, kind):
+    if not indexes:
+        return indexes
+    result = []
+    for index in indexes:
+        if not isinstance(index, dict):
+            result.append(index)
+            continue
+        projection = index.get('Projection', {})
+        projection_type = projection.get('ProjectionType', 'ALL')
+        kwargs = {
+            'parts': schema_from_wire(
+                index['KeySchema'], attribute_definitions)
+        }
+        if projection_type == 'INCLUDE':
+            kwargs['includes'] = projection.get('NonKeyAttributes', [])
+        if 'ProvisionedThroughput' in index:
+            kwargs['throughput'] = throughput_from_wire(
+                index['ProvisionedThroughput'])
+        index_class = PROJECTION_INDEXES[kind][projection_type]
+        result.append(index_class(index['IndexName'], **kwargs))
+    return result
+
+
+def filters_from_wire(conditions):
+    """Convert KeyConditions / QueryFilter / ScanFilter to mock filters."""
+    filters = []
+    for field_name, condition in (conditions or {}).items():
+        operator = COMPARISON_OPERATORS[condition['ComparisonOperator']]
+        values = [
+            _dynamizer.decode(value)
+            for value in condition.get('AttributeValueList', [])]
+        if operator in ('between', 'in'):
+            value = values
+        else:
+            value = values[0] if values else None
+        filters.append((field_name, operator, value))
+    return filters
+
+
+def check_expected(item, expected, conditional_operator=None):
+    """Check legacy `Expected` conditions, raise if they are not met.
+
+    The `item` is the current item data or None if item does not exist.
+    """
+    if not expected:
+        return
+    item = item or {}
+    results = []
+    for field_name, condition in expected.items():
+        if 'ComparisonOperator' in condition:
+            (__, operator, value), = filters_from_wire(
+                {field_name: condition})
+            results.append(match_filter(item, field_name, operator, value))
+        elif condition.get('Exists', True) is False:
+            results.append(field_name not in item)
+        elif 'Value' in condition:
+            results.append(
+                field_name in item and
+                item[field_name] == _dynamizer.decode(condition['Value']))
+        else:
+            results.append(field_name in item)
+    if conditional_operator == 'OR':
+        passed = any(results)
+    else:
+        passed = all(results)
+    if not passed:
+        raise _error(
+            exceptions.ConditionalCheckFailedException,
+            'The conditional request failed')
+
+
+def evaluate_condition(expression, item, names=None, values=None):
+    """Evaluate the condition expression for the item (python values).
+
+    Values are given in wire format.
+    """
+    try:
+        condition = expressions.compile_condition(expression)
+        return condition.evaluate(
+            item, names, decode_item(values or {}))
+    except expressions.ExpressionError as e:
+        raise _error(exceptions.ValidationException, str(e))
+
+
+def match_filter(record, field_name, operator, value):
+    if operator not in (
+        'eq', 'ne', 'gt', 'gte', 'lt', 'lte', 'between', 'beginswith',
+        'in', 'contains', 'ncontains', 'null', 'nnull'
+    ):
+        raise Exception('Unsupported mock operator %s' % operator)
+    if operator == 'null':
+        return field_name not in record
+    if operator == 'nnull':
+        return field_name in record
+    if field_name not in record:
+        return operator in ('ne', 'ncontains')
+    actual = record[field_name]
+    try:
+        if operator == 'eq':
+            return actual == value
+        elif operator == 'ne':
+            return actual != value
+        elif operator == 'gt':
+            return actual > value
+        elif operator == 'gte':
+            return actual >= value
+        elif operator == 'lt':
+            return actual < value
+        elif operator == 'lte':
+            return actual <= value
+        elif operator == 'between':
+            return value[0] <= actual <= value[1]
+        elif operator == 'beginswith':
+            return actual.startswith(value)
+        elif operator == 'in':
+            return actual in value
+        elif operator == 'contains':
+            return value in actual
+        elif operator == 'ncontains':
+            return value not in actual
+    except (TypeError, AttributeError):
+        # DynamoDB does not match values of different types
+        return False
+
+
+def project(item, attributes=None):
+    if not attributes:
+        return item
+    return dict((name, item[name]) for name in attributes if name in item)
+
+
+def projection_names(attributes_to_get, projection_expression, names):
+    if projection_expression:
+        names = names or {}
+        return [
+            names.get(name.strip(), name.strip())
+            for name in projection_expression.split(',')]
+    return attributes_to_get
+
+
+def return_values_result(return_values, old, new, updated=None):
+    source = old if return_values in ('ALL_OLD', 'UPDATED_OLD') else new
+    if not source or return_values in (None, 'NONE'):
+        return {}
+    if return_values in ('UPDATED_OLD', 'UPDATED_NEW'):
+        source = project(source, list(updated or []))
+    if not source:
+        return {}
+    return {'Attributes': encode_item(source)}
+
+
+def search_results(items, last_key, select=None, attributes_to_get=None):
+    result = {'Count': len(items), 'ScannedCount': len(items)}
+    if select != 'COUNT':
+        result['Items'] = [
+            encode_item(project(item, attributes_to_get)) for item in items]
+    if last_key:
+        result['LastEvaluatedKey'] = encode_item(last_key)
+    return result
+
+
+def capacity_units(items, operation):
+    """Capacity units to read the page / write items.
+
+    Reads are 4KB units per page, writes are 1KB units per item.
+    """
+    if operation == 'read':
+        return hotkeys.size_units(
+            sum(hotkeys.item_size(item) for item in items), operation)
+    return sum(hotkeys.item_units(item, operation) for item in items)
+
+
+def paginate(items, limit, exclusive_start_key, key_names, order=None,
+             reverse=False):
+    """Get the page from items iterable, return (page, last_key).
+
+    Items are ordered by the `order` function (descending if reverse),
+    the page starts after the exclusive_start_key, also if the item with
+    this key is already deleted.
+    """
+    items = iter(items)
+    if exclusive_start_key:
+        start = order(exclusive_start_key)
+        if reverse:
+            items = itertools.dropwhile(
+                lambda item: order(item) >= start, items)
+        else:
+            items = itertools.dropwhile(
+                lambda item: order(item) <= start, items)
+    page = []
+    for item in items:
+        if limit and len(page) == limit:
+            # there are more items, return the key of the last one
+            last_key = dict(
+                (name, page[-1][name]) for name in key_names
+                if name in page[-1])
+            return page, last_key
+        page.append(item)
+    return page, None
+
+
+def scan_segment(value, total_segments):
+    """Stable segment number for the hash key value."""
+    data = six.text_type(value).encode('utf-8')
+    return (zlib.crc32(data) & 0xffffffff) % total_segments
+
+
 class Connection(dict):
+    """In-memory replacement for boto's DynamoDBConnection (layer1).
 
-    def __init__(self, **kwargs):
-        pass
+    Low-level methods accept and return data in DynamoDB wire format,
+    same as the real connection does.
+    """
+
+    def __init__(self, storage=None, **kwargs):
+        self.storage = storage or _storage or MemoryStorage()
+        self.update(self.storage.load_tables())
+        # simulated throughput state, {table_name: state}
+        self.throughput_state = {}
+        # change streams, {table_name: Stream}
+        self.streams = {}
+
+    def consumed_capacity(self, table_name):
+        """Capacity units consumed by the table since it was created.
+
+        Returns {'table': {'read': units, 'write': units}, 'IndexName': ...}
+        for the table and its global secondary indexes.
+        """
+        return copy.deepcopy(self._throughput_state(table_name)['consumed'])
+
+    def _throughput_state(self, table_name):
+        if table_name not in self.throughput_state:
+            self.throughput_state[table_name] = {
+                'consumed': {}, 'decreases': 0, 'updating': 0}
+        return self.throughput_state[table_name]
 
     def create_table(self, attribute_definitions, table_name, key_schema,
                      provisioned_throughput, local_secondary_indexes=None,
                      global_secondary_indexes=None):
+        if table_name in self:
+            raise _error(
+                exceptions.ResourceInUseException,
+                'Table already exists: %s' % table_name)
+        schema = schema_from_wire(key_schema, attribute_definitions)
         self[table_name] = {'hashkey': '', 'rangekey': ''}
-        for key in key_schema:
+        for key in schema:
             if isinstance(key, HashKey):
                 self[table_name]['hashkey'] = key.name
             if isinstance(key, RangeKey):
                 self[table_name]['rangekey'] = key.name
-        self[table_name]['data'] = defaultdict(lambda: defaultdict(dict))
         self[table_name]['meta'] = {
-            'throughput': provisioned_throughput,
-            'local_indexes': local_secondary_indexes,
-            'global_indexes': global_secondary_indexes
+            'schema': schema,
+            'throughput': throughput_from_wire(provisioned_throughput),
+            'local_indexes': indexes_from_wire(
+                local_secondary_indexes, attribute_definitions, 'local'),
+            'global_indexes': indexes_from_wire(
+                global_secondary_indexes, attribute_definitions, 'global')
+        }
+        self[table_name]['data'] = self.storage.create_table(
+            table_name, self[table_name])
+        return {
+            'TableDescription': self.describe_table(table_name)['Table']
         }
 
-    def list_tables(self):
-        return {'TableNames': self.keys()}
+    def list_tables(self, exclusive_start_table_name=None, limit=None):
+        names = sorted(self.keys())
+        if exclusive_start_table_name is not None:
+            names = [
+                name for name in names if name > exclusive_start_table_name]
+        if limit and len(names) > limit:
+            return {
+                'TableNames': names[:limit],
+                'LastEvaluatedTableName': names[limit - 1]
+            }
+        return {'TableNames': names}
 
     def reset(self):
         for table_name in self.keys():
-            self[table_name]['data'] = defaultdict(lambda: defaultdict(dict))
+            self[table_name]['data'].clear()
+        self.throughput_state = {}
+        for stream in self.streams.values():
+            stream.clear()
+
+    def enable_stream(self, table_name, view_type='NEW_AND_OLD_IMAGES'):
+        """Start recording changes of the table, returns the stream ARN.
+
+        The real DynamoDB stream is enabled with UpdateTable (the
+        StreamSpecification parameter).
+        """
+        self._get_table(table_name)
+        stream = self.streams.get(table_name)
+        if stream is None or stream.view_type != view_type:
+            stream = self.streams[table_name] = Stream(table_name, view_type)
+        return stream.arn
+
+    def disable_stream(self, table_name):
+        self.streams.pop(table_name, None)
+
+    def describe_stream(self, stream_arn, limit=None,
+                        exclusive_start_shard_id=None):
+        stream = self._get_stream(stream_arn)
+        table = self._get_table(stream.table_name)
+        shards = []
+        if exclusive_start_shard_id is None:
+            shards.append({
+                'ShardId': STREAM_SHARD_ID,
+                'SequenceNumberRange': {
+                    'StartingSequenceNumber': sequence_number(1)
+                }
+            })
+        return {'StreamDescription': {
+            'StreamArn': stream.arn,
+            'StreamLabel': 'mock',
+            'StreamStatus': 'ENABLED',
+            'StreamViewType': stream.view_type,
+            'TableName': stream.table_name,
+            'KeySchema': table.describe()['Table']['KeySchema'],
+            'Shards': shards
+        }}
+
+    def get_shard_iterator(self, stream_arn, shard_id, shard_iterator_type,
+                           sequence_number=None):
+        stream = self._get_stream(stream_arn)
+        if shard_id != STREAM_SHARD_ID:
+            raise _error(
+                exceptions.ResourceNotFoundException,
+                'Requested resource not found: Shard: %s' % shard_id)
+        if shard_iterator_type == 'TRIM_HORIZON':
+            position = 1
+        elif shard_iterator_type == 'LATEST':
+            position = len(stream.records) + 1
+        elif shard_iterator_type == 'AT_SEQUENCE_NUMBER':
+            position = int(sequence_number)
+        elif shard_iterator_type == 'AFTER_SEQUENCE_NUMBER':
+            position = int(sequence_number) + 1
+        else:
+            raise _error(
+                exceptions.ValidationException,
+                'Invalid ShardIteratorType: %s' % shard_iterator_type)
+        return {'ShardIterator': stream_iterator(stream.arn, position)}
+
+    def get_records(self, shard_iterator, limit=None):
+        try:
+            stream_arn, __, position = shard_iterator.rsplit('|', 2)
+            position = int(position)
+        except ValueError:
+            raise _error(
+                exceptions.ValidationException,
+                'Invalid ShardIterator: %s' % shard_iterator)
+        stream = self._get_stream(stream_arn)
+        end = len(stream.records) + 1
+        if limit:
+            end = min(end, position + limit)
+        records = copy.deepcopy(stream.records[position - 1:end - 1])
+        # the shard is open, so the next iterator is always returned
+        return {
+            'Records': records,
+            'NextShardIterator': stream_iterator(
+                stream.arn, max(position, end))
+        }
+
+    def describe_table(self, table_name):
+        return self._get_table(table_name).describe()
+
+    def delete_table(self, table_name):
+        description = self.describe_table(table_name)['Table']
+        del self[table_name]
+        self.throughput_state.pop(table_name, None)
+        self.streams.pop(table_name, None)
+        self.storage.delete_table(table_name)
+        description['TableStatus'] = 'DELETING'
+        return {'TableDescription': description}
+
+    def update_table(self, table_name, provisioned_throughput=None,
+                     global_secondary_index_updates=None,
+                     attribute_definitions=None):
+        table = self._get_table(table_name)
+        global_indexes = {}
+        for index_update in global_secondary_index_updates or []:
+            if 'Update' in index_update:
+                update = index_update['Update']
+                global_indexes[update['IndexName']] = throughput_from_wire(
+                    update['ProvisionedThroughput'])
+        table.update(
+            throughput_from_wire(provisioned_throughput), global_indexes)
+        return {'TableDescription': table.describe()['Table']}
+
+    def get_item(self, table_name, key, attributes_to_get=None,
+                 consistent_read=None, return_consumed_capacity=None,
+                 projection_expression=None,
+                 expression_attribute_names=None):
+        table = self._get_table(table_name)
+        item = table._read(decode_item(key))
+        if item is None:
+            return {}
+        attributes = projection_names(
+            attributes_to_get, projection_expression,
+            expression_attribute_names)
+        return {'Item': encode_item(project(item, attributes))}
+
+    def put_item(self, table_name, item, expected=None, return_values=None,
+                 return_consumed_capacity=None,
+                 return_item_collection_metrics=None,
+                 conditional_operator=None, condition_expression=None,
+                 expression_attribute_names=None,
+                 expression_attribute_values=None):
+        table = self._get_table(table_name)
+        data = decode_item(item)
+        old = table._find(data)
+        table._check_conditions(
+            old, expected, conditional_operator, condition_expression,
+            expression_attribute_names, expression_attribute_values)
+        table._set_data(data)
+        return return_values_result(return_values, old, None)
+
+    def delete_item(self, table_name, key, expected=None,
+                    conditional_operator=None, return_values=None,
+                    return_consumed_capacity=None,
+                    return_item_collection_metrics=None,
+                    condition_expression=None,
+                    expression_attribute_names=None,
+                    expression_attribute_values=None):
+        table = self._get_table(table_name)
+        key_data = decode_item(key)
+        old = table._find(key_data)
+        table._check_conditions(
+            old, expected, conditional_operator, condition_expression,
+            expression_attribute_names, expression_attribute_values)
+        if old is not None:
+            table._remove_item(key_data)
+        return return_values_result(return_values, old, None)
 
     def update_item(self, table_name, key, attribute_updates=None,
                     expected=None, conditional_operator=None,
@@ -58,10 +653,12 @@ class Connection(dict):
                     expression_attribute_names=None,
                     expression_attribute_values=None):
         """Update item low-level method.
-           Warning: support is very limited, only to counter updates
+
+        Supports update / condition expressions and legacy attribute
+        updates (see Table.update_item).
         """
-        table = Table(table_name, self)
-        table.update_item(
+        table = self._get_table(table_name)
+        return table.update_item(
             key, attribute_updates,
             expected, conditional_operator,
             return_values, return_consumed_capacity,
@@ -70,6 +667,112 @@ class Connection(dict):
             expression_attribute_names,
             expression_attribute_values)
 
+    def query(self, table_name, key_conditions=None, index_name=None,
+              select=None, attributes_to_get=None, limit=None,
+              consistent_read=None, query_filter=None,
+              conditional_operator=None, scan_index_forward=None,
+              exclusive_start_key=None, return_consumed_capacity=None,
+              projection_expression=None, filter_expression=None,
+              key_condition_expression=None,
+              expression_attribute_names=None,
+              expression_attribute_values=None):
+        table = self._get_table(table_name)
+        if exclusive_start_key:
+            exclusive_start_key = decode_item(exclusive_start_key)
+        filters = filters_from_wire(key_conditions) + \
+            filters_from_wire(query_filter)
+        conditions = []
+        if key_condition_expression:
+            # equality conditions allow to read only the needed partition
+            try:
+                key_condition = expressions.compile_condition(
+                    key_condition_expression)
+                equals = key_condition.equality_values(
+                    expression_attribute_names,
+                    decode_item(expression_attribute_values or {}))
+            except expressions.ExpressionError as e:
+                raise _error(exceptions.ValidationException, str(e))
+            for name, value in equals.items():
+                filters.append((name, 'eq', value))
+            conditions.append(key_condition_expression)
+        if filter_expression:
+            conditions.append(filter_expression)
+        items, last_key = table._search(
+            filters, index=index_name, reverse=scan_index_forward is False,
+            limit=limit, exclusive_start_key=exclusive_start_key,
+            query=True, conditions=conditions,
+            condition_names=expression_attribute_names,
+            condition_values=expression_attribute_values)
+        return search_results(
+            items, last_key, select, projection_names(
+                attributes_to_get, projection_expression,
+                expression_attribute_names))
+
+    def scan(self, table_name, attributes_to_get=None, limit=None,
+             select=None, scan_filter=None, conditional_operator=None,
+             exclusive_start_key=None, segment=None, total_segments=None,
+             return_consumed_capacity=None, projection_expression=None,
+             filter_expression=None, expression_attribute_names=None,
+             expression_attribute_values=None, index_name=None,
+             consistent_read=None):
+        table = self._get_table(table_name)
+        if exclusive_start_key:
+            exclusive_start_key = decode_item(exclusive_start_key)
+        items, last_key = table._search(
+            filters_from_wire(scan_filter), index=index_name,
+            limit=limit, exclusive_start_key=exclusive_start_key,
+            segment=segment, total_segments=total_segments,
+            conditions=[filter_expression] if filter_expression else None,
+            condition_names=expression_attribute_names,
+            condition_values=expression_attribute_values)
+        return search_results(
+            items, last_key, select, projection_names(
+                attributes_to_get, projection_expression,
+                expression_attribute_names))
+
+    def batch_get_item(self, request_items, return_consumed_capacity=None):
+        responses = {}
+        for table_name, request in request_items.items():
+            table = self._get_table(table_name)
+            items = responses.setdefault(table_name, [])
+            for key in request['Keys']:
+                item = table._read(decode_item(key))
+                if item is not None:
+                    items.append(encode_item(
+                        project(item, request.get('AttributesToGet'))))
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, request_items, return_consumed_capacity=None,
+                         return_item_collection_metrics=None):
+        for table_name, requests in request_items.items():
+            table = self._get_table(table_name)
+            for request in requests:
+                if 'PutRequest' in request:
+                    table._set_data(
+                        decode_item(request['PutRequest']['Item']))
+                elif 'DeleteRequest' in request:
+                    key_data = decode_item(request['DeleteRequest']['Key'])
+                    if table._find(key_data) is not None:
+                        table._remove_item(key_data)
+        return {'UnprocessedItems': {}}
+
+    def _get_stream(self, stream_arn):
+        for stream in list(self.streams.values()):
+            if stream.arn == stream_arn:
+                return stream
+        raise _error(
+            exceptions.ResourceNotFoundException,
+            'Requested resource not found: Stream: %s not found' %
+            stream_arn)
+
+    def _get_table(self, table_name):
+        if table_name not in self:
+            raise _error(
+                exceptions.ResourceNotFoundException,
+                'Requested resource not found: Table: %s not found' %
+                table_name)
+        return Table(table_name, self)
+
 
 class Table:
 
@@ -96,27 +799,57 @@ class Table:
         )
         return Table(table_name, connection)
 
+    def delete(self):
+        self.connection.delete_table(self.table_name)
+        return True
+
     def get_item(self, **kwargs):
-        if kwargs[self.hashkey] not in self.data:
+        item = self._read(kwargs)
+        if item is None:
             raise ItemNotFound()
-        if self.rangekey == '':
-            return Item(self, self.data[kwargs[self.hashkey]])
-        else:
-            if kwargs[self.rangekey] not in self.data[kwargs[self.hashkey]]:
-                raise ItemNotFound()
-            return Item(
-                self,
-                self.data[kwargs[self.hashkey]][kwargs[self.rangekey]])
+        return item
+
+    def batch_get(self, keys, consistent=False, attributes=None):
+        items = []
+        for key_data in keys:
+            data = self._read(key_data)
+            if data is not None:
+                items.append(Item(self, project(data, attributes)))
+        return items
+
+    def _find(self, key_data):
+        """Return the item for given keys or None if it does not exist.
+
+        The capacity is not consumed, use _read() for reads.
+        """
+        try:
+            range_value = key_data[self.rangekey] if self.rangekey else None
+            data = self.data.get(key_data[self.hashkey], range_value)
+        except KeyError:
+            return None
+        if data is None:
+            return None
+        return Item(self, data)
+
+    def _read(self, key_data):
+        """Read the item (consumes the read capacity), None if not found."""
+        item = self._find(key_data)
+        self._consume('read', [item] if item is not None else [])
+        return item
 
     def _remove_item(self, item):
-        if item[self.hashkey] not in self.data:
+        range_value = None
+        if self.rangekey:
+            range_value = item[self.rangekey]
+        stream = self.connection.streams.get(self.table_name)
+        old = None
+        if stream is not None:
+            old = self.data.get(item[self.hashkey], range_value)
+        if not self.data.delete(item[self.hashkey], range_value):
             raise ItemNotFound()
-        if self.rangekey == '':
-            del self.data[item[self.hashkey]]
-        else:
-            if item[self.rangekey] not in self.data[item[self.hashkey]]:
-                raise ItemNotFound()
-            del self.data[item[self.hashkey]][item[self.rangekey]]
+        self._consume('write', [item])
+        if stream is not None:
+            stream.record(self._keys(item), old, None)
 
     def batch_write(self):
         return BatchTable(self)
@@ -125,8 +858,39 @@ class Table:
                 consistent=False, attributes=None, max_page_size=None,
                 query_filter=None, conditional_operator=None,
                 **filter_kwargs):
+        # validate the query before returning the lazy result set
+        self._query_filters(index, filter_kwargs, query_filter)
+        results = ResultSet(max_page_size=max_page_size)
+        kwargs = filter_kwargs.copy()
+        kwargs.update({
+            'limit': limit,
+            'index': index,
+            'reverse': reverse,
+            'consistent': consistent,
+            'attributes_to_get': attributes,
+            'query_filter': query_filter,
+            'conditional_operator': conditional_operator
+        })
+        results.to_call(self._query, **kwargs)
+        return results
+
+    def _query(self, limit=None, index=None, reverse=False, consistent=False,
+               exclusive_start_key=None, select=None, attributes_to_get=None,
+               query_filter=None, conditional_operator=None,
+               **filter_kwargs):
+        filters = self._query_filters(index, filter_kwargs, query_filter)
+        items, last_key = self._search(
+            filters, index=index, reverse=reverse, limit=limit,
+            exclusive_start_key=exclusive_start_key, query=True)
+        return {
+            'results': [
+                Item(self, project(item, attributes_to_get))
+                for item in items],
+            'last_key': last_key
+        }
+
+    def _query_filters(self, index, filter_kwargs, query_filter=None):
         hash_value = None
-        range_value = None
         filters = []
         for key in filter_kwargs:
             meta = key.split('__')
@@ -141,8 +905,7 @@ class Table:
                 filters.append((self.hashkey, 'eq', hash_value))
             elif field_name == self.rangekey:
                 operator = meta[1]
-                range_value = filter_kwargs[key]
-                filters.append((self.rangekey, operator, range_value))
+                filters.append((self.rangekey, operator, filter_kwargs[key]))
             elif index is not None:
                 # assume secondary index is valid - don't actually check
                 operator = meta[1]
@@ -165,116 +928,295 @@ class Table:
                 operator = meta[1]
                 value = query_filter[filter_key]
                 filters.append((field_name, operator, value))
-
-        return self.search_by_filters(filters)
+        return filters
 
     def scan(self, limit=None, segment=None, total_segments=None,
              max_page_size=None, attributes=None, conditional_operator=None,
              **filter_kwargs):
+        results = ResultSet(max_page_size=max_page_size)
+        kwargs = filter_kwargs.copy()
+        kwargs.update({
+            'limit': limit,
+            'segment': segment,
+            'total_segments': total_segments,
+            'attributes': attributes,
+            'conditional_operator': conditional_operator
+        })
+        results.to_call(self._scan, **kwargs)
+        return results
+
+    def _scan(self, limit=None, exclusive_start_key=None, segment=None,
+              total_segments=None, attributes=None, conditional_operator=None,
+              **filter_kwargs):
         filters = []
         for key in filter_kwargs:
             meta = key.split('__')
             field_name = meta[0]
             operator = meta[1]
             filters.append((field_name, operator, filter_kwargs[key]))
-        return self.search_by_filters(filters)
+        items, last_key = self._search(
+            filters, limit=limit, exclusive_start_key=exclusive_start_key,
+            segment=segment, total_segments=total_segments)
+        return {
+            'results': [
+                Item(self, project(item, attributes)) for item in items],
+            'last_key': last_key
+        }
 
     def query_count(self, **kwargs):
-        return len(self.query_2(**kwargs))
-
-    def search_by_filters(self, filters):
-        results = []
-        for hash_key in self.data:
-            record = self.data[hash_key]
-            if not self.rangekey:
-                if self.test_filters(record, filters):
-                    results.append(Item(self, record))
-            else:
-                for rng_key in record:
-                    if self.test_filters(record[rng_key], filters):
-                        results.append(Item(self, record[rng_key]))
-        return results
+        return len(list(self.query_2(**kwargs)))
+
+    def _search(self, filters, index=None, reverse=False, limit=None,
+                exclusive_start_key=None, segment=None, total_segments=None,
+                query=False, conditions=None, condition_names=None,
+                condition_values=None):
+        """Find items matching filters and return (items_page, last_key).
+
+        Query results are sorted by the range key of the table or index,
+        scan results can be split into segments by the hash key.
+        Conditions are expressions (like FilterExpression) to check in
+        addition to filters.
+        """
+        key_names = [self.hashkey]
+        if self.rangekey:
+            key_names.append(self.rangekey)
+        index_hash, index_range = None, None
+        if index is not None:
+            index_hash, index_range = self._get_index_keys(index)
+            for name in (index_hash, index_range):
+                if name and name not in key_names:
+                    key_names.append(name)
+        hash_name = index_hash if index is not None else self.hashkey
+        hash_values = [
+            value for name, operator, value in filters
+            if name == hash_name and operator == 'eq']
+        if query and hash_values and index is None:
+            candidates = self.data.partition(hash_values[0])
+        elif query and hash_values and index_hash:
+            candidates = self.data.index_partition(index, hash_values[0])
+        elif not query and index is None and exclusive_start_key:
+            # continue the scan from the last key
+            candidates = self.data.scan((
+                exclusive_start_key[self.hashkey],
+                exclusive_start_key.get(self.rangekey)))
+            exclusive_start_key = None
+        else:
+            candidates = self.data.scan()
+        items = self.search_by_filters(filters, candidates)
+        for condition in conditions or []:
+            items = self._filter_condition(
+                items, condition, condition_names, condition_values)
+        if segment is not None and total_segments:
+            items = (
+                item for item in items
+                if scan_segment(
+                    item[self.hashkey], total_segments) == segment)
+        if index_hash:
+            # secondary indexes are sparse
+            items = (
+                item for item in items
+                if index_hash in item and (
+                    not index_range or index_range in item))
+        # items are ordered by the sort key (of the table or index), then
+        # by keys of the table, as the table data is scanned
+        order_names = [self.hashkey]
+        if self.rangekey:
+            order_names.append(self.rangekey)
+        sort_key = index_range if index is not None else self.rangekey
+        if query and sort_key:
+            order_names.insert(0, sort_key)
+
+        def order(item):
+            return tuple(order_key(item.get(name)) for name in order_names)
+
+        if query:
+            items = sorted(items, key=order, reverse=reverse)
+        page, last_key = paginate(
+            items, limit, exclusive_start_key, key_names, order, reverse)
+        self._consume('read', page, index)
+        return page, last_key
+
+    def _filter_condition(self, items, condition, names, values):
+        for item in items:
+            if evaluate_condition(condition, item, names, values):
+                yield item
+
+    def _get_index_keys(self, index_name):
+        indexes = (
+            (self.meta['global_indexes'] or []) +
+            (self.meta['local_indexes'] or []))
+        for index in indexes:
+            if index.name == index_name:
+                range_name = None
+                if len(index.parts) > 1:
+                    range_name = index.parts[1].name
+                return index.parts[0].name, range_name
+        return None, None
+
+    def search_by_filters(self, filters, items=None):
+        """Iterate items (all table items by default) matching filters."""
+        if items is None:
+            items = self.data.scan()
+        for record in items:
+            if self.test_filters(record, filters):
+                yield Item(self, record)
 
     def test_filters(self, record, filters):
-        for f in filters:
-            field_name = f[0]
-            operator = f[1]
-            value = f[2]
-            if field_name not in record:
-                return False
-            if operator not in ('eq', 'gt', 'gte', 'lt', 'lte', 'between'):
-                raise Exception('Unsupported mock operator %s' % operator)
-            if operator == 'eq' and not (record[field_name] == value):
-                return False
-            elif operator == 'gt' and not (record[field_name] > value):
-                return False
-            elif operator == 'gte' and not (record[field_name] >= value):
-                return False
-            elif operator == 'lt' and not (record[field_name] < value):
-                return False
-            elif operator == 'lte' and not (record[field_name] <= value):
-                return False
-            elif operator == 'between' and not (
-                (record[field_name] < value) or (record[field_name] > value)
-            ):
+        for field_name, operator, value in filters:
+            if not match_filter(record, field_name, operator, value):
                 return False
         return True
 
+    def count_items(self):
+        return len(self.data)
+
     def describe(self):
+        self.schema = self.meta.get('schema') or [HashKey(self.hashkey)]
+        if not self.meta.get('schema') and self.rangekey:
+            self.schema.append(RangeKey(self.rangekey))
+        definitions = []
+        for field in self.schema:
+            definitions.append(field.definition())
+        state = self.connection._throughput_state(self.table_name)
+        status = 'ACTIVE'
+        if state['updating']:
+            state['updating'] -= 1
+            status = 'UPDATING'
         result = {'Table': {
-            'TableStatus': 'ACTIVE',
+            'TableName': self.table_name,
+            'TableStatus': status,
+            'KeySchema': [field.schema() for field in self.schema],
+            'AttributeDefinitions': definitions,
+            'ItemCount': self.count_items(),
             'ProvisionedThroughput': {
                 'WriteCapacityUnits': self.meta['throughput']['write'],
-                'ReadCapacityUnits': self.meta['throughput']['read']
+                'ReadCapacityUnits': self.meta['throughput']['read'],
+                'NumberOfDecreasesToday': state['decreases']
             },
             'GlobalSecondaryIndexes': []
         }}
+        stream = self.connection.streams.get(self.table_name)
+        if stream is not None:
+            result['Table']['StreamSpecification'] = {
+                'StreamEnabled': True,
+                'StreamViewType': stream.view_type
+            }
+            result['Table']['LatestStreamArn'] = stream.arn
+            result['Table']['LatestStreamLabel'] = 'mock'
         if self.meta['global_indexes']:
             for idx in self.meta['global_indexes']:
-                idx_data = {
-                    'IndexName': idx.name,
-                    'ProvisionedThroughput': {
-                        'WriteCapacityUnits': idx.throughput['write'],
-                        'ReadCapacityUnits': idx.throughput['read']
-                    }
+                idx_data = idx.schema()
+                idx_data['IndexStatus'] = 'ACTIVE'
+                idx_data['ProvisionedThroughput'] = {
+                    'WriteCapacityUnits': idx.throughput['write'],
+                    'ReadCapacityUnits': idx.throughput['read'],
+                    'NumberOfDecreasesToday': state['decreases']
                 }
                 result['Table']['GlobalSecondaryIndexes'].append(idx_data)
-
-        self.schema = [HashKey(self.hashkey)]
-        if self.rangekey:
-            self.schema.append(RangeKey(self.rangekey))
+        if self.meta['local_indexes']:
+            result['Table']['LocalSecondaryIndexes'] = [
+                idx.schema() for idx in self.meta['local_indexes']]
+        for idx in (
+            (self.meta['global_indexes'] or []) +
+            (self.meta['local_indexes'] or [])
+        ):
+            for definition in idx.definition():
+                if definition not in definitions:
+                    definitions.append(definition)
         return result
 
     def update(self, throughput, global_indexes=None):
         """
         Updates table attributes.
+
+        The number of throughput decreases is limited like in DynamoDB and
+        the table is UPDATING for the next describe() call.
         """
-        self.meta['throughput'] = throughput
+        old_values = [self.meta['throughput']] + [
+            idx.throughput for idx in self.meta['global_indexes'] or []
+            if idx.name in (global_indexes or {})]
+        new_values = [throughput or self.meta['throughput']] + [
+            global_indexes[idx.name]
+            for idx in self.meta['global_indexes'] or []
+            if idx.name in (global_indexes or {})]
+        state = self.connection._throughput_state(self.table_name)
+        if any(
+            new[op] < old[op]
+            for old, new in zip(old_values, new_values)
+            for op in ('read', 'write')
+        ):
+            if state['decreases'] >= MAX_DECREASES_PER_DAY:
+                raise _error(
+                    exceptions.LimitExceededException,
+                    'Subscriber limit exceeded: Provisioned throughput '
+                    'decreases are limited within a given UTC day')
+            state['decreases'] += 1
+        state['updating'] = UPDATING_DESCRIBES
+        if throughput:
+            self.meta['throughput'] = throughput
         if global_indexes:
             for gsi_name, gsi_throughput in global_indexes.items():
                 for idx in self.meta['global_indexes']:
                     if idx.name == gsi_name:
                         idx.throughput = gsi_throughput
                         break
-
+        self.connection.storage.update_table(
+            self.table_name, self.connection[self.table_name])
         return True
 
     def get_data(self, **kwargs):
         return self.data
 
     def _set_data(self, data):
-        final_data = {}
-        checker = Item(self)
-        for key, value in data.items():
-            if not checker._is_storable(value):
-                continue
-            final_data[key] = value
-
-        if self.rangekey == '':
-            self.data[final_data[self.hashkey]] = final_data
-        else:
-            self.data[final_data[self.hashkey]][final_data[self.rangekey]] = \
-                final_data
+        final_data = dict(
+            (key, value) for key, value in data.items()
+            if codec.is_storable(value))
+
+        range_value = None
+        if self.rangekey:
+            range_value = final_data[self.rangekey]
+        stream = self.connection.streams.get(self.table_name)
+        old = None
+        if stream is not None:
+            old = self.data.get(final_data[self.hashkey], range_value)
+        self.data.put(final_data[self.hashkey], range_value, final_data)
+        self._consume('write', [final_data])
+        for idx in self.meta['global_indexes'] or []:
+            if idx.parts[0].name in final_data:
+                self._consume('write', [final_data], idx.name)
+        if stream is not None:
+            stream.record(self._keys(final_data), old, final_data)
+
+    def _keys(self, item):
+        keys = {self.hashkey: item[self.hashkey]}
+        if self.rangekey:
+            keys[self.rangekey] = item[self.rangekey]
+        return keys
+
+    def _consume(self, operation, items, index=None):
+        """Record consumed capacity for the table or global index."""
+        if index not in [
+                idx.name for idx in self.meta['global_indexes'] or []]:
+            # local indexes use the table capacity
+            index = None
+        consumed = self.connection._throughput_state(
+            self.table_name)['consumed']
+        part = consumed.setdefault(index or 'table', {'read': 0, 'write': 0})
+        part[operation] += capacity_units(items, operation)
+
+    def _check_conditions(self, item, expected=None, conditional_operator=None,
+                          condition_expression=None,
+                          expression_attribute_names=None,
+                          expression_attribute_values=None):
+        if condition_expression:
+            passed = evaluate_condition(
+                condition_expression, item,
+                expression_attribute_names, expression_attribute_values)
+            if not passed:
+                raise _error(
+                    exceptions.ConditionalCheckFailedException,
+                    'The conditional request failed')
+        check_expected(item, expected, conditional_operator)
 
     def update_item(self, key, attribute_updates=None,
                     expected=None, conditional_operator=None,
@@ -284,26 +1226,56 @@ class Table:
                     expression_attribute_names=None,
                     expression_attribute_values=None):
         """Update item low-level method.
-           Warning: support is very limited, only for counter updates
+
+        Supports both update expressions and legacy attribute updates.
+        The item is created if it does not exist.
         """
-        dyn = Dynamizer()
-        # print update_expression, expression_attribute_values
-        for name in key:
-            key[name] = dyn.decode(key[name])
-        item = self.get_item(**key)
-        # expression is like SET a = a + :a SET b = b + :b'
-        try:
-            key, val = update_expression.split('=')[1].split('+')
-        except IndexError:
-            raise Exception(
-                'Table.update_item is limited to counter updates, '
-                'expressions like SET a = a + :val')
-        key, val = key.strip(), val.strip()
-        if expression_attribute_names and key in expression_attribute_names:
-            key = expression_attribute_names[key]
-        val = expression_attribute_values[val]
-        item[dyn.decode(key)] += dyn.decode(val)
+        key_data = decode_item(key)
+        old = self._find(key_data)
+        self._check_conditions(
+            old, expected, conditional_operator, condition_expression,
+            expression_attribute_names, expression_attribute_values)
+        # nested values are changed in place, so the update is applied to
+        # the copy which is stored only if the update succeeds, the stored
+        # item is kept as the old image (for streams and return values)
+        original = old if old is not None else key_data
+        item = Item(self, expressions.copy_value(dict(original)))
+        updated = set()
+        for name, update in (attribute_updates or {}).items():
+            action = update.get('Action', 'PUT')
+            value = None
+            if 'Value' in update:
+                value = _dynamizer.decode(update['Value'])
+            if action == 'PUT':
+                item[name] = value
+            elif action == 'DELETE':
+                if value is None or name not in item:
+                    item.pop(name, None)
+                else:
+                    item[name] = item[name] - value
+            elif action == 'ADD':
+                if isinstance(value, set):
+                    item[name] = item.get(name, set()) | value
+                else:
+                    item[name] = item.get(name, 0) + value
+            updated.add(name)
+        if update_expression:
+            try:
+                update = expressions.compile_update(update_expression)
+                updated.update(update.apply(
+                    item, expression_attribute_names,
+                    decode_item(expression_attribute_values or {}),
+                    original))
+            except expressions.ExpressionError as e:
+                raise _error(exceptions.ValidationException, str(e))
+            for name in key_data:
+                if item.get(name) != key_data[name]:
+                    raise _error(
+                        exceptions.ValidationException,
+                        'Cannot update attribute %s. '
+                        'This attribute is part of the key' % name)
         item.save()
+        return return_values_result(return_values, old, item, updated)
 
     def __repr__(self):
         return "'%s'" % self.table_name
@@ -311,7 +1283,7 @@ class Table:
 
 class Item(dict):
 
-    def __init__(self, table, data=None):
+    def __init__(self, table, data=None, loaded=False):
         self.table = table
         super(Item, self).__init__(data or {})
 
@@ -377,7 +1349,8 @@ class BatchTable(object):
             item.save()
 
         for delete in self._to_delete:
-            item.delete()
+            if self.table._find(delete) is not None:
+                self.table._remove_item(delete)
 
         self._to_put = []
         self._to_delete = []
@@ -0,0 +1,191 @@
+"""
+Lightweight local DynamoDB server on top of the dynamock engine.
+
+The server speaks the DynamoDB JSON API (the same protocol boto uses),
+so it can be used instead of the java-based DynamoDB Local:
+
+    $ python -m dynamo_objects.dynamoserver --port 8000
+
+    DynamoDatabase().connect(region_name='localhost', DYNAMODB_PORT=8000)
+
+Or it can be started in-process in the background thread:
+
+    server = DynamoServer(port=0).start()
+    # ... requests to server.port
+    server.stop()
+
+Note: the server imports the `dynamock` module, so boto is mocked in
+the process where the server runs. To test and benchmark the real boto
+client (serialization, http, connection reuse) run the client in the
+separate process.
+"""
+import argparse
+import json
+import re
+import threading
+
+from boto.exception import JSONResponseError
+from boto.vendored.six.moves import BaseHTTPServer, socketserver
+
+from dynamo_objects import dynamock
+
+OPERATIONS = (
+    'BatchGetItem', 'BatchWriteItem', 'CreateTable', 'DeleteItem',
+    'DeleteTable', 'DescribeTable', 'GetItem', 'ListTables', 'PutItem',
+    'Query', 'Scan', 'UpdateItem', 'UpdateTable'
+)
+
+
+def camel_to_snake(name):
+    """Convert 'ExclusiveStartKey' to 'exclusive_start_key'."""
+    return re.sub('([a-z0-9])([A-Z])', r'\1_\2', name).lower()
+
+
+class DynamoApi(object):
+    """Dispatches DynamoDB API requests to the dynamock connection.
+
+    The mock connection methods have the same signatures as boto's
+    low-level DynamoDBConnection, so request parameters are just
+    converted to snake case and passed through.
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection or dynamock.Connection()
+        # the dynamock engine is not thread-safe
+        self._lock = threading.Lock()
+
+    def dispatch(self, operation, params):
+        """Handle the request, return (http status, response data)."""
+        if operation not in OPERATIONS:
+            return 400, {
+                '__type': 'com.amazonaws.dynamodb.v20120810#'
+                          'UnknownOperationException',
+                'message': 'Unknown operation: %s' % operation
+            }
+        method = getattr(self.connection, camel_to_snake(operation))
+        kwargs = dict(
+            (camel_to_snake(key), value) for key, value in params.items())
+        try:
+            with self._lock:
+                return 200, method(**kwargs)
+        except JSONResponseError as e:
+            return e.status, e.body
+        except Exception as e:
+            # unexpected request parameters (TypeError) or the request the
+            # mock does not support
+            return 400, {
+                '__type': 'com.amazon.coral.validate#ValidationException',
+                'message': str(e)
+            }
+
+
+class DynamoRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # keep-alive connections, boto reuses them
+    protocol_version = 'HTTP/1.1'
+    # send responses without the delay, otherwise each request on the
+    # keep-alive connection waits for the delayed ACK (about 40ms)
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        operation = self.headers.get('X-Amz-Target', '').split('.')[-1]
+        try:
+            params = json.loads(body) if body else {}
+        except ValueError:
+            status, result = 400, {
+                '__type': 'com.amazon.coral.service#SerializationException',
+                'message': 'Invalid JSON request'
+            }
+        else:
+            status, result = self.server.api.dispatch(operation, params)
+        data = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-amz-json-1.0')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(
+                self, format, *args)
+
+
+class DynamoHTTPServer(socketserver.ThreadingMixIn,
+                       BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, api, verbose=False):
+        self.api = api
+        self.verbose = verbose
+        BaseHTTPServer.HTTPServer.__init__(
+            self, address, DynamoRequestHandler)
+
+
+class DynamoServer(object):
+    """Local DynamoDB server, runs in a background thread or in foreground.
+
+    Use port=0 to bind to a free port, the actual port is available
+    as `server.port` after the server is created.
+    """
+
+    def __init__(self, host='localhost', port=8000, connection=None,
+                 verbose=False):
+        self.api = DynamoApi(connection)
+        self.httpd = DynamoHTTPServer((host, port), self.api, verbose)
+        self.host = host
+        self.port = self.httpd.server_address[1]
+        self._thread = None
+
+    @property
+    def connection(self):
+        return self.api.connection
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Local DynamoDB server based on the dynamock engine')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', help='log requests')
+    options = parser.parse_args(args)
+    server = DynamoServer(options.host, options.port, verbose=options.verbose)
+    print('Serving DynamoDB API on %s:%s' % (server.host, server.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
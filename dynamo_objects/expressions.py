@@ -0,0 +1,594 @@
+"""
+DynamoDB update and condition expressions for the dynamock engine.
+
+Expressions are parsed once and compiled into python functions, compiled
+expressions are cached by the expression string (applications usually
+use a small set of expression templates with different values):
+
+    update = compile_update('SET #c = if_not_exists(#c, :zero) + :inc')
+    update.apply(item, names={'#c': 'count'}, values={':zero': 0, ':inc': 1})
+
+    condition = compile_condition('attribute_not_exists(id) OR v = :v')
+    condition.evaluate(item, names={}, values={':v': 3})
+
+Items are python dicts with decoded values (not the wire format).
+Supported:
+
+* update: SET (with `+` / `-`, if_not_exists, list_append), REMOVE, ADD,
+  DELETE, nested paths like `a.b[0].c`
+* condition: = <> < <= > >=, BETWEEN, IN, AND, OR, NOT, parentheses,
+  attribute_exists, attribute_not_exists, attribute_type, begins_with,
+  contains, size
+"""
+import re
+
+from boto.compat import six
+from boto.dynamodb.types import get_dynamodb_type
+
+# max number of cached compiled expressions
+MAX_CACHE_SIZE = 1000
+
+TOKEN_RE = re.compile(r'''
+    \s*(?:
+        (?P<number>\d+) |
+        (?P<name>\#[A-Za-z0-9_]+) |
+        (?P<value>:[A-Za-z0-9_]+) |
+        (?P<word>[A-Za-z_][A-Za-z0-9_]*) |
+        (?P<op><>|<=|>=|[=<>(),.\[\]+\-])
+    )''', re.VERBOSE)
+
+KEYWORDS = ('SET', 'REMOVE', 'ADD', 'DELETE', 'AND', 'OR', 'NOT',
+            'BETWEEN', 'IN')
+COMPARATORS = ('=', '<>', '<', '<=', '>', '>=')
+CONDITION_FUNCTIONS = {
+    'attribute_exists': 1,
+    'attribute_not_exists': 1,
+    'attribute_type': 2,
+    'begins_with': 2,
+    'contains': 2,
+}
+OPERAND_FUNCTIONS = {
+    'if_not_exists': 2,
+    'list_append': 2,
+    'size': 1,
+}
+
+_cache = {}
+
+
+class ExpressionError(Exception):
+    """Invalid expression or expression can not be applied to the item."""
+    pass
+
+
+class _Missing(object):
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_RE.match(expression, position)
+        if not match or match.end() == position:
+            raise ExpressionError(
+                'Invalid expression: %s, unexpected input at %s' %
+                (expression, position))
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'word' and text.upper() in KEYWORDS:
+            kind, text = 'keyword', text.upper()
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+class Parser(object):
+    """Recursive descent parser, builds the expression tree (tuples)."""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+
+    def error(self, message):
+        return ExpressionError(
+            'Invalid expression "%s": %s' % (self.expression, message))
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        if position < len(self.tokens):
+            return self.tokens[position]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise self.error('unexpected end of expression')
+        self.position += 1
+        return token
+
+    def accept(self, text):
+        if self.peek()[1] == text:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            raise self.error('expected "%s", got "%s"' % (
+                text, self.peek()[1]))
+
+    def done(self):
+        if self.peek()[0] is not None:
+            raise self.error('unexpected "%s"' % self.peek()[1])
+
+    def parse_update(self):
+        actions = []
+        while self.peek()[0] is not None:
+            kind, clause = self.next()
+            if kind != 'keyword' or clause not in (
+                'SET', 'REMOVE', 'ADD', 'DELETE'
+            ):
+                raise self.error('expected SET, REMOVE, ADD or DELETE')
+            while True:
+                path = self.parse_path()
+                if clause == 'SET':
+                    self.expect('=')
+                    actions.append((clause, path, self.parse_value()))
+                elif clause == 'REMOVE':
+                    actions.append((clause, path, None))
+                else:
+                    actions.append((clause, path, self.parse_operand()))
+                if not self.accept(','):
+                    break
+        if not actions:
+            raise self.error('empty update expression')
+        return actions
+
+    def parse_path(self):
+        kind, text = self.next()
+        if kind not in ('name', 'word'):
+            raise self.error('expected attribute name, got "%s"' % text)
+        elements = [('name', text)]
+        while True:
+            if self.accept('.'):
+                kind, text = self.next()
+                if kind not in ('name', 'word'):
+                    raise self.error('expected attribute name after "."')
+                elements.append(('name', text))
+            elif self.accept('['):
+                kind, text = self.next()
+                if kind != 'number':
+                    raise self.error('expected list index')
+                elements.append(('index', int(text)))
+                self.expect(']')
+            else:
+                return ('path', tuple(elements))
+
+    def parse_value(self):
+        left = self.parse_operand()
+        for operator in ('+', '-'):
+            if self.accept(operator):
+                return (operator, left, self.parse_operand())
+        return left
+
+    def parse_operand(self):
+        kind, text = self.peek()
+        if kind == 'value':
+            self.next()
+            return ('value', text)
+        if kind == 'word' and self.peek(1)[1] == '(':
+            if text not in OPERAND_FUNCTIONS:
+                raise self.error('unknown function %s' % text)
+            return self.parse_call(OPERAND_FUNCTIONS)
+        return self.parse_path()
+
+    def parse_call(self, functions):
+        kind, name = self.next()
+        self.expect('(')
+        args = [self.parse_operand()]
+        while self.accept(','):
+            args.append(self.parse_operand())
+        self.expect(')')
+        if len(args) != functions[name]:
+            raise self.error('wrong number of arguments for %s' % name)
+        return ('call', name, args)
+
+    def parse_condition(self):
+        left = self.parse_and()
+        while self.accept('OR'):
+            left = ('or', left, self.parse_and())
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self.accept('AND'):
+            left = ('and', left, self.parse_not())
+        return left
+
+    def parse_not(self):
+        if self.accept('NOT'):
+            return ('not', self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        if self.accept('('):
+            condition = self.parse_condition()
+            self.expect(')')
+            return condition
+        kind, text = self.peek()
+        if kind == 'word' and text in CONDITION_FUNCTIONS:
+            return self.parse_call(CONDITION_FUNCTIONS)
+        left = self.parse_operand()
+        if self.accept('BETWEEN'):
+            low = self.parse_operand()
+            self.expect('AND')
+            return ('between', left, low, self.parse_operand())
+        if self.accept('IN'):
+            self.expect('(')
+            options = [self.parse_operand()]
+            while self.accept(','):
+                options.append(self.parse_operand())
+            self.expect(')')
+            return ('in', left, options)
+        kind, operator = self.next()
+        if operator not in COMPARATORS:
+            raise self.error('expected comparison, got "%s"' % operator)
+        return ('compare', operator, left, self.parse_operand())
+
+
+def resolve_path(path, names):
+    keys = []
+    for kind, element in path[1]:
+        if kind == 'name' and element.startswith('#'):
+            if not names or element not in names:
+                raise ExpressionError(
+                    'An expression attribute name used in the document '
+                    'path is not defined: %s' % element)
+            element = names[element]
+        keys.append(element)
+    return keys
+
+
+def get_path(item, keys):
+    value = item
+    for key in keys:
+        if isinstance(key, int):
+            if not isinstance(value, list) or key >= len(value):
+                return MISSING
+        elif not isinstance(value, dict) or key not in value:
+            return MISSING
+        value = value[key]
+    return value
+
+
+def get_parent(item, keys):
+    parent = get_path(item, keys[:-1])
+    key = keys[-1]
+    if isinstance(key, int) and isinstance(parent, list):
+        return parent, key
+    if not isinstance(key, int) and isinstance(parent, dict):
+        return parent, key
+    raise ExpressionError(
+        'The document path provided in the update expression is '
+        'invalid for update')
+
+
+def set_path(item, keys, value):
+    parent, key = get_parent(item, keys)
+    if isinstance(key, int) and key >= len(parent):
+        parent.append(value)
+    else:
+        parent[key] = value
+
+
+def remove_path(item, keys):
+    parent, key = get_parent(item, keys)
+    if isinstance(key, int):
+        if key < len(parent):
+            del parent[key]
+    else:
+        parent.pop(key, None)
+
+
+def copy_value(value):
+    """Copy maps, lists and sets of the value (other values are immutable),
+    it is faster than copy.deepcopy."""
+    if isinstance(value, dict):
+        return dict((key, copy_value(element))
+                    for key, element in value.items())
+    if isinstance(value, list):
+        return [copy_value(element) for element in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+def is_number(value):
+    if isinstance(value, bool):
+        return False
+    try:
+        return get_dynamodb_type(value) == 'N'
+    except TypeError:
+        return False
+
+
+def compile_operand_node(node):
+    kind = node[0]
+    if kind == 'path':
+        def operand(item, names, values):
+            return get_path(item, resolve_path(node, names))
+    elif kind == 'value':
+        placeholder = node[1]
+
+        def operand(item, names, values):
+            if not values or placeholder not in values:
+                raise ExpressionError(
+                    'An expression attribute value used in expression '
+                    'is not defined: %s' % placeholder)
+            return values[placeholder]
+    elif kind in ('+', '-'):
+        left = compile_operand_node(node[1])
+        right = compile_operand_node(node[2])
+        sign = 1 if kind == '+' else -1
+
+        def operand(item, names, values):
+            a, b = left(item, names, values), right(item, names, values)
+            if a is MISSING or b is MISSING:
+                raise ExpressionError(
+                    'The provided expression refers to an attribute that '
+                    'does not exist in the item')
+            if not is_number(a) or not is_number(b):
+                raise ExpressionError(
+                    'An operand in the update expression has an incorrect '
+                    'data type')
+            return a + sign * b
+    elif node[1] == 'if_not_exists':
+        path, default = compile_operand_node(node[2][0]), \
+            compile_operand_node(node[2][1])
+
+        def operand(item, names, values):
+            value = path(item, names, values)
+            if value is MISSING:
+                return default(item, names, values)
+            return value
+    elif node[1] == 'list_append':
+        left = compile_operand_node(node[2][0])
+        right = compile_operand_node(node[2][1])
+
+        def operand(item, names, values):
+            a, b = left(item, names, values), right(item, names, values)
+            if not isinstance(a, list) or not isinstance(b, list):
+                raise ExpressionError(
+                    'Incorrect operand type for operator or function; '
+                    'operator or function: list_append')
+            return a + b
+    else:
+        # size()
+        path = compile_operand_node(node[2][0])
+
+        def operand(item, names, values):
+            value = path(item, names, values)
+            if value is MISSING or is_number(value):
+                return MISSING
+            return len(value)
+    return operand
+
+
+def compare(operator, a, b):
+    if a is MISSING or b is MISSING:
+        return False
+    if operator == '=':
+        return a == b
+    if operator == '<>':
+        return a != b
+    try:
+        # DynamoDB does not compare values of different types
+        if not (is_number(a) and is_number(b)) and \
+                get_dynamodb_type(a) != get_dynamodb_type(b):
+            return False
+        if operator == '<':
+            return a < b
+        if operator == '<=':
+            return a <= b
+        if operator == '>':
+            return a > b
+        return a >= b
+    except TypeError:
+        return False
+
+
+def compile_condition_node(node):
+    kind = node[0]
+    if kind in ('and', 'or'):
+        left = compile_condition_node(node[1])
+        right = compile_condition_node(node[2])
+        if kind == 'and':
+            return lambda item, names, values: (
+                left(item, names, values) and right(item, names, values))
+        return lambda item, names, values: (
+            left(item, names, values) or right(item, names, values))
+    if kind == 'not':
+        inner = compile_condition_node(node[1])
+        return lambda item, names, values: not inner(item, names, values)
+    if kind == 'compare':
+        operator = node[1]
+        left = compile_operand_node(node[2])
+        right = compile_operand_node(node[3])
+        return lambda item, names, values: compare(
+            operator, left(item, names, values), right(item, names, values))
+    if kind == 'between':
+        value, low, high = [compile_operand_node(arg) for arg in node[1:]]
+
+        def condition(item, names, values):
+            actual = value(item, names, values)
+            return (
+                compare('>=', actual, low(item, names, values)) and
+                compare('<=', actual, high(item, names, values)))
+        return condition
+    if kind == 'in':
+        value = compile_operand_node(node[1])
+        options = [compile_operand_node(option) for option in node[2]]
+        return lambda item, names, values: any(
+            compare('=', value(item, names, values), option(
+                item, names, values))
+            for option in options)
+    # function call
+    name = node[1]
+    args = [compile_operand_node(arg) for arg in node[2]]
+
+    def condition(item, names, values):
+        first = args[0](item, names, values)
+        if name == 'attribute_exists':
+            return first is not MISSING
+        if name == 'attribute_not_exists':
+            return first is MISSING
+        if first is MISSING:
+            return False
+        second = args[1](item, names, values)
+        if name == 'attribute_type':
+            return get_dynamodb_type(first) == second
+        if name == 'begins_with':
+            return (
+                isinstance(first, six.string_types) and
+                isinstance(second, six.string_types) and
+                first.startswith(second))
+        # contains
+        try:
+            return second in first
+        except TypeError:
+            return False
+    return condition
+
+
+class UpdateExpression(object):
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.actions = []
+        for clause, path, value in Parser(expression).parse_update():
+            if value is not None:
+                value = compile_operand_node(value)
+            self.actions.append((clause, path, value))
+
+    def apply(self, item, names=None, values=None, original=None):
+        """Update the item in place, return the set of updated attributes.
+
+        All values are evaluated against the original item (before any
+        action is applied), same as DynamoDB does. The original is the
+        copy of the item unless it is given (the caller already has the
+        item before the update, it is not changed).
+        """
+        shared = original is not None
+        if not shared:
+            original = copy_value(dict(item))
+        changes = []
+        for clause, path, value in self.actions:
+            keys = resolve_path(path, names)
+            if value is not None:
+                value = value(original, names, values)
+                if shared and isinstance(value, (list, dict)):
+                    # nested values of the original can't be shared
+                    value = copy_value(value)
+            changes.append((clause, keys, value))
+        updated = set()
+        for clause, keys, value in changes:
+            updated.add(keys[0])
+            if clause == 'SET':
+                set_path(item, keys, value)
+            elif clause == 'REMOVE':
+                remove_path(item, keys)
+            elif clause == 'ADD':
+                current = get_path(item, keys)
+                if isinstance(value, set):
+                    current = set() if current is MISSING else current
+                    if not isinstance(current, set):
+                        raise ExpressionError(
+                            'Incorrect operand type for operator ADD')
+                    set_path(item, keys, current | value)
+                elif is_number(value):
+                    current = 0 if current is MISSING else current
+                    if not is_number(current):
+                        raise ExpressionError(
+                            'Incorrect operand type for operator ADD')
+                    set_path(item, keys, current + value)
+                else:
+                    raise ExpressionError(
+                        'ADD action is supported only for numbers and sets')
+            else:
+                # DELETE
+                if not isinstance(value, set):
+                    raise ExpressionError(
+                        'DELETE action is supported only for sets')
+                current = get_path(item, keys)
+                if current is MISSING:
+                    continue
+                if not isinstance(current, set):
+                    raise ExpressionError(
+                        'Incorrect operand type for operator DELETE')
+                current = current - value
+                if current:
+                    set_path(item, keys, current)
+                else:
+                    remove_path(item, keys)
+        return updated
+
+
+class ConditionExpression(object):
+
+    def __init__(self, expression):
+        self.expression = expression
+        parser = Parser(expression)
+        self.tree = parser.parse_condition()
+        parser.done()
+        self._evaluate = compile_condition_node(self.tree)
+
+    def evaluate(self, item, names=None, values=None):
+        return self._evaluate(item or {}, names, values)
+
+    def equality_values(self, names=None, values=None):
+        """Get {attribute: value} for `path = :value` parts joined by AND.
+
+        Used to find the partition key value in key condition expressions.
+        """
+        result = {}
+        nodes = [self.tree]
+        while nodes:
+            node = nodes.pop()
+            if node[0] == 'and':
+                nodes.extend(node[1:])
+            elif (
+                node[0] == 'compare' and node[1] == '=' and
+                node[2][0] == 'path' and node[3][0] == 'value' and
+                len(node[2][1]) == 1
+            ):
+                name = resolve_path(node[2], names)[0]
+                result[name] = compile_operand_node(node[3])({}, names, values)
+        return result
+
+
+def _compiled(expression_class, expression):
+    key = (expression_class, expression)
+    compiled = _cache.get(key)
+    if compiled is None:
+        if len(_cache) >= MAX_CACHE_SIZE:
+            _cache.clear()
+        compiled = _cache[key] = expression_class(expression)
+    return compiled
+
+
+def compile_update(expression):
+    """Get the (cached) compiled update expression."""
+    return _compiled(UpdateExpression, expression)
+
+
+def compile_condition(expression):
+    """Get the (cached) compiled condition expression."""
+    return _compiled(ConditionExpression, expression)
@@ -0,0 +1,89 @@
+"""
+Compact fingerprints of loaded items.
+
+By default the record loaded from the database keeps the boto Item
+(`record._item`), which holds the second copy of the data and the
+snapshot of original values, it is used to save only changed attributes.
+With `keep_items = False` on the table class, the record keeps the
+Fingerprint instead: values of keys (of the table, global indexes and
+the version field) and the 8-byte digest of each stored attribute.
+On save() digests of current values are compared to the fingerprint and
+only changed attributes are updated:
+
+    class CustomerTable(DynamoTable):
+        keep_items = False
+
+    customer = CustomerTable().get('C1', 20)
+    customer.email = 'new@example.com'
+    # UpdateItem request with `SET email = ...`
+    CustomerTable().save(customer)
+
+Digests are calculated from the wire format (set values are sorted), so
+the number loaded as Decimal and the same int value are equal.
+"""
+import hashlib
+import json
+
+from dynamo_objects import codec
+
+DIGEST_SIZE = 8
+
+# attribute names tuples are shared by fingerprints
+_names = {}
+
+
+def canonical(wire):
+    """Get the wire value with sorted sets (JSON serializable)."""
+    kind, value = list(wire.items())[0]
+    if kind in ('SS', 'NS', 'BS'):
+        return [kind, sorted(value)]
+    if kind == 'L':
+        return [kind, [canonical(element) for element in value]]
+    if kind == 'M':
+        return [kind, dict(
+            (key, canonical(element)) for key, element in value.items())]
+    return [kind, value]
+
+
+def value_digest(value):
+    """Get the digest of the attribute value."""
+    encoded = json.dumps(canonical(codec.encode_value(value)), sort_keys=True)
+    return hashlib.md5(encoded.encode('utf-8')).digest()[:DIGEST_SIZE]
+
+
+class Fingerprint(object):
+    """Loaded state of the item: key values and attribute digests.
+
+    data - the item data (stored values only)
+    key_names - names of attributes to keep values of
+    """
+
+    __slots__ = ('keys', 'names', 'digests')
+
+    def __init__(self, data, key_names):
+        self.keys = tuple(data.get(name) for name in key_names)
+        names = tuple(sorted(data))
+        self.names = _names.setdefault(names, names)
+        self.digests = b''.join(value_digest(data[name]) for name in names)
+
+    def get_keys(self, key_names):
+        """Get {name: loaded value}, the value is None if not stored."""
+        return dict(zip(key_names, self.keys))
+
+    def digest(self, name):
+        """Get the digest of the loaded value, None if not stored."""
+        if name not in self.names:
+            return None
+        start = self.names.index(name) * DIGEST_SIZE
+        return self.digests[start:start + DIGEST_SIZE]
+
+    def changes(self, data):
+        """Get names of attributes set, changed or removed since load.
+
+        data - the current data (stored values only)
+        """
+        changed = [
+            name for name in data
+            if self.digest(name) != value_digest(data[name])]
+        changed.extend(name for name in self.names if name not in data)
+        return changed
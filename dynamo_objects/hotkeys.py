@@ -0,0 +1,185 @@
+"""
+Hot keys detection: sampling of key accesses with bounded memory.
+
+Set the sampler as the `key_sampler` attribute of DynamoTable subclasses
+(the same sampler can be shared by several tables):
+
+    sampler = KeySampler(capacity=1000, sample_rate=0.1)
+
+    class StoreTable(DynamoTable):
+        key_sampler = sampler
+
+    # later
+    sampler.top('store', k=10)               # by consumed capacity
+    sampler.top('store', k=10, metric='writes')
+    sampler.dump(k=10)                       # all tables and indexes
+
+Reads (get, query) and writes (save, delete, update_counter and
+MemoryTable flushes) are counted per hash key, along with the estimated
+capacity units (1 unit per 4KB read and per 1KB written).
+Each (table, index, metric) is tracked with the Space-Saving algorithm,
+it keeps at most `capacity` keys and finds keys with frequency higher
+than 1 / capacity of all accesses, counts can be overestimated by up to
+the reported error.
+"""
+import heapq
+import itertools
+import math
+import random
+import threading
+
+from boto.compat import six
+from boto.dynamodb.types import Binary
+
+METRICS = ('reads', 'writes', 'units')
+
+
+def value_size(value):
+    if isinstance(value, Binary):
+        return len(value.value)
+    if isinstance(value, six.binary_type):
+        return len(value)
+    return len(six.text_type(value))
+
+
+def item_size(data):
+    """Approximate item size in bytes (names and values lengths)."""
+    return sum(len(name) + value_size(value) for name, value in data.items())
+
+
+def item_units(data, operation):
+    """Estimate capacity units to read or write the item (dict)."""
+    return size_units(item_size(data), operation)
+
+
+def size_units(size, operation):
+    unit_size = 4096.0 if operation == 'read' else 1024.0
+    return max(1, int(math.ceil(size / unit_size)))
+
+
+class SpaceSaving(object):
+    """Top-k frequent keys with at most `capacity` counters.
+
+    When the new key comes and all counters are used, the key with the
+    minimal count is replaced and the new key inherits its count (as an
+    error, the upper bound of overestimation).
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.total = 0
+        # key: [count, error]
+        self._counters = {}
+        # (count, sequence, key) for each key to find the minimal count,
+        # counts here are not updated on add() and can be lower than
+        # actual, the entry is updated when it gets to the top
+        self._heap = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, key, count=1):
+        with self._lock:
+            self.total += count
+            counter = self._counters.get(key)
+            if counter is not None:
+                counter[0] += count
+            elif len(self._counters) < self.capacity:
+                self._counters[key] = [count, 0]
+                heapq.heappush(
+                    self._heap, (count, next(self._sequence), key))
+            else:
+                min_count, min_key = self._pop_min()
+                self._counters[key] = [min_count + count, min_count]
+                heapq.heappush(
+                    self._heap,
+                    (min_count + count, next(self._sequence), key))
+
+    def _pop_min(self):
+        """Remove the key with the minimal count, returns (count, key)."""
+        while True:
+            count, __, key = heapq.heappop(self._heap)
+            actual = self._counters[key][0]
+            if actual == count:
+                del self._counters[key]
+                return count, key
+            heapq.heappush(self._heap, (actual, next(self._sequence), key))
+
+    def top(self, k=10):
+        """Get [(key, count, error)] of k most frequent keys."""
+        with self._lock:
+            counters = sorted(
+                self._counters.items(), key=lambda item: -item[1][0])
+            return [
+                (key, count, error) for key, (count, error) in counters[:k]]
+
+    def __len__(self):
+        return len(self._counters)
+
+
+class KeySampler(object):
+    """Counts reads, writes and capacity units per table / index hash key.
+
+    capacity - max number of keys tracked per table, index and metric
+    sample_rate - part of accesses to count (counts are scaled back)
+    """
+
+    def __init__(self, capacity=1000, sample_rate=1.0):
+        self.capacity = capacity
+        self.sample_rate = sample_rate
+        # (table_name, index, metric): SpaceSaving
+        self._sketches = {}
+        self._lock = threading.Lock()
+        self._stop = None
+
+    def record(self, table_name, operation, key, units=1, index=None):
+        """Count the access, operation is 'read' or 'write'."""
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        scale = 1.0 / self.sample_rate
+        metric = 'reads' if operation == 'read' else 'writes'
+        self._sketch(table_name, index, metric).add(key, scale)
+        self._sketch(table_name, index, 'units').add(key, units * scale)
+
+    def top(self, table_name, k=10, metric='units', index=None):
+        """Get [(key, count, error)] of the hottest keys."""
+        sketch = self._sketches.get((table_name, index, metric))
+        return sketch.top(k) if sketch is not None else []
+
+    def dump(self, k=10):
+        """Get {table_name: {index or 'table': {metric: top keys}}}."""
+        result = {}
+        for table_name, index, metric in list(self._sketches):
+            tables = result.setdefault(table_name, {})
+            metrics = tables.setdefault(index or 'table', {})
+            metrics[metric] = self.top(table_name, k, metric, index)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._sketches = {}
+
+    def start_reporting(self, interval, report, k=10):
+        """Call report(dump) every `interval` seconds in the background."""
+        self.stop_reporting()
+        stop = self._stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                report(self.dump(k))
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+    def stop_reporting(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _sketch(self, table_name, index, metric):
+        key = (table_name, index, metric)
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            with self._lock:
+                sketch = self._sketches.setdefault(
+                    key, SpaceSaving(self.capacity))
+        return sketch
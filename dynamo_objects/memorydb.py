@@ -1,15 +1,25 @@
 import datetime
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
 
 from boto.dynamodb2.exceptions import ItemNotFound
 
+from dynamo_objects.coalesce import SingleFlight
+from dynamo_objects.columnar import ColumnarData
+
 NOT_FOUND = 'missing'
 
 
 class KeyValueStorage(object):
 
-    def __init__(self):
-        self.data = {}
+    def __init__(self, data_factory=dict):
+        # data_factory creates the {hash: record} mapping
+        self._data_factory = data_factory
+        self.data = data_factory()
         self.db_table = None
+        self._lock = threading.RLock()
 
     def get_hash(self, *args):
         keys = self.db_table._check_keys(*args)
@@ -33,29 +43,42 @@ class KeyValueStorage(object):
             raise Exception('here')
         if not hashkey:
             raise Exception('Unable to get a hash key for item: %s' % item)
-        if (hashkey in self.data) and (self.data[hashkey] is not None):
-            raise Exception(
-                'Item with %s key already exists in %s: %s' % (
-                    hashkey, type(self), str(self.data[hashkey].get_dict())))
-        self.data[hashkey] = item
+        with self._lock:
+            if (hashkey in self.data) and (self.data[hashkey] is not None):
+                raise Exception(
+                    'Item with %s key already exists in %s: %s' % (
+                        hashkey, type(self),
+                        str(self.data[hashkey].get_dict())))
+            self.data[hashkey] = item
 
     def delete_item(self, *args):
         hashkey = self.get_hash(*args)
-        if hashkey in self.data:
-            del self.data[hashkey]
+        with self._lock:
+            if hashkey in self.data:
+                del self.data[hashkey]
 
     def reset(self):
-        self.data = {}
+        with self._lock:
+            self.data = self._data_factory()
 
 
 class MemoryTable(KeyValueStorage):
     db_reads = 0
     hits = 0
 
-    def __init__(self, db_table):
+    def __init__(self, db_table, columnar=False):
+        """With columnar=True records data is kept in columns (see the
+        columnar module), this needs much less memory for many records.
+        """
+        data_factory = dict
+        if columnar:
+            data_factory = partial(ColumnarData, db_table.record_class)
+        super(MemoryTable, self).__init__(data_factory)
         self.db_table = db_table
+        self.columnar = columnar
         self.load_from_db = True
-        super(MemoryTable, self).__init__()
+        # concurrent misses for the same key do only one db read
+        self._loads = SingleFlight()
 
     def get_db_table(self):
         raise Exception('Not implemented')
@@ -80,29 +103,9 @@ class MemoryTable(KeyValueStorage):
         if times:
             times['mem_get_item'] += (en - st).total_seconds()
         if item is None:
-            if self.load_from_db:
-                st = datetime.datetime.now()
-                self.db_reads += 1
-                if times:
-                    item = self.db_table.get(
-                        hashkey, rangekey, create, times=times)
-                else:
-                    try:
-                        item = self.db_table.get(hashkey, rangekey, create)
-                    except:
-                        self.put_item(NOT_FOUND, hashkey, rangekey)
-                        raise
-                self.put_item(item, hashkey, rangekey)
-                en = datetime.datetime.now()
-                if times:
-                    times['mem_get_from_db'] += (en - st).total_seconds()
-            else:
-                st = datetime.datetime.now()
-                item = self.db_table._create_record(hashkey, rangekey)
-                self.put_item(item, hashkey, rangekey)
-                en = datetime.datetime.now()
-                if times:
-                    times['mem_create_record'] += (en - st).total_seconds()
+            item = self._loads.do(
+                self.get_hash(hashkey, rangekey),
+                lambda: self._load(hashkey, rangekey, create, times))
         else:
             self.hits += 1
         end = datetime.datetime.now()
@@ -110,6 +113,43 @@ class MemoryTable(KeyValueStorage):
             times['mem_total'] += (end - start).total_seconds()
         return item
 
+    def _load(self, hashkey, rangekey, create, times):
+        # the item could be loaded by another thread meanwhile
+        item = self.get_item(hashkey, rangekey)
+        if item == NOT_FOUND:
+            if not create:
+                raise ItemNotFound
+            self.delete_item(hashkey, rangekey)
+        elif item is not None:
+            return item
+        if self.load_from_db:
+            st = datetime.datetime.now()
+            self.db_reads += 1
+            if times:
+                item = self.db_table.get(
+                    hashkey, rangekey, create, times=times)
+            else:
+                try:
+                    item = self.db_table.get(hashkey, rangekey, create)
+                except:
+                    self.put_item(NOT_FOUND, hashkey, rangekey)
+                    raise
+            self.put_item(item, hashkey, rangekey)
+            # the stored record (the view for the columnar storage)
+            item = self.get_item(hashkey, rangekey)
+            en = datetime.datetime.now()
+            if times:
+                times['mem_get_from_db'] += (en - st).total_seconds()
+        else:
+            st = datetime.datetime.now()
+            item = self.db_table._create_record(hashkey, rangekey)
+            self.put_item(item, hashkey, rangekey)
+            item = self.get_item(hashkey, rangekey)
+            en = datetime.datetime.now()
+            if times:
+                times['mem_create_record'] += (en - st).total_seconds()
+        return item
+
     def delete(self, hashkey, rangekey=None):
         item = self.db_table.delete(hashkey, rangekey)
         self.delete_item(item, hashkey, rangekey)
@@ -118,19 +158,25 @@ class MemoryTable(KeyValueStorage):
     def save(self, item):
         keys = self.db_table._get_record_keys(item)
         hashkey = self.get_hash(*keys)
-        existed = self.data.get(hashkey)
-        if existed == NOT_FOUND:
-            del (self.data[hashkey])
-        if existed in [NOT_FOUND, None]:
-            self.put_item(item, *keys)
+        with self._lock:
+            existed = self.data.get(hashkey)
+            if existed == NOT_FOUND:
+                del (self.data[hashkey])
+            if existed in [NOT_FOUND, None]:
+                self.put_item(item, *keys)
 
     def save_data(self, ignore_errors=False, overwrite=False):
         for hashkey in self.data:
             try:
                 if self.data[hashkey] == NOT_FOUND:
                     continue
-                item = self.db_table._get_item_for_record(self.data[hashkey])
-                item.save(overwrite=overwrite)
+                record = self.data[hashkey]
+                item = self.db_table._get_item_for_record(record)
+                # columnar and fingerprinted records don't keep the loaded
+                # item, so the conditional save would fail for existing items
+                item.save(overwrite=overwrite or record._detached or (
+                    record._fingerprint is not None and record._item is None))
+                self._sample_write(item)
             except Exception as e:
                 if ignore_errors:
                     return e
@@ -147,6 +193,7 @@ class MemoryTable(KeyValueStorage):
                     item = \
                         self.db_table._get_item_for_record(self.data[hashkey])
                     batch.put_item(item, overwrite=overwrite)
+                    self._sample_write(item)
                 except Exception as e:
                     if ignore_errors:
                         return e
@@ -156,3 +203,91 @@ class MemoryTable(KeyValueStorage):
 
     def get_data(self):
         return [item for __, item in self.data.items()]
+
+    def _sample_write(self, item):
+        if self.db_table.key_sampler is not None:
+            self.db_table._sample('write', item)
+
+
+class QueryCache(object):
+    """Cache for query results with TTL and size limit (least recently
+    used entries are removed first).
+
+    Entries are tagged, usually with (table, hash key, value), and
+    invalidated by tags when the data is changed.
+    To use the cache, set it as the `query_cache` attribute of the
+    DynamoTable subclass.
+    """
+
+    def __init__(self, ttl=60, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # incremented on each invalidation, see put()
+        self.version = 0
+        # key: (expires_at, value, tags)
+        self._entries = OrderedDict()
+        # tag: set of keys
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            # move to the end, as the most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, tags, version=None):
+        """Add the value to the cache.
+
+        If the version (the cache version before the value was read from
+        the database) is given and the data was invalidated since then,
+        the value is not added, because it could be stale.
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                return False
+            self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def invalidate(self, tags):
+        with self._lock:
+            self.version += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self):
+        return len(self._entries)
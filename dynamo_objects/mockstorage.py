@@ -0,0 +1,364 @@
+"""
+Storage engines for the dynamock tables.
+
+The MemoryStorage (default) keeps all the data in python dicts.
+The SqliteStorage keeps tables in the SQLite database (a file on disk or
+in memory), so large data sets do not need to fit into RAM and the data
+(with table definitions) can be reused across test runs:
+
+    from dynamo_objects import dynamock
+    from dynamo_objects.mockstorage import SqliteStorage
+    dynamock.set_storage(SqliteStorage('/tmp/fixtures.db'))
+
+Each table is represented by a table data object which supports
+the same interface (get / put / delete / scan / partition, etc).
+"""
+import bisect
+import pickle
+import sqlite3
+import threading
+from decimal import Decimal
+
+from boto.compat import six
+
+# batch size to fetch rows from the SQLite database
+FETCH_SIZE = 500
+
+
+def index_keys(meta):
+    """Get [(index_name, hash_name, range_name)] from the table metadata."""
+    result = []
+    indexes = (meta.get('global_indexes') or []) + \
+        (meta.get('local_indexes') or [])
+    for index in indexes:
+        range_name = None
+        if len(index.parts) > 1:
+            range_name = index.parts[1].name
+        result.append((index.name, index.parts[0].name, range_name))
+    return result
+
+
+def order_key(value):
+    """Get the key value to order items by (boto's Binary by bytes)."""
+    if hasattr(value, 'value') and not isinstance(value, six.integer_types):
+        return value.value
+    return value
+
+
+class MemoryTableData(object):
+    """Table data in python dicts: {hash: {range: item}}.
+
+    For tables without a range key the range value is None.
+    """
+
+    def __init__(self, hashkey, rangekey, indexes=None):
+        self.hashkey = hashkey
+        self.rangekey = rangekey
+        self.indexes = indexes or []
+        self.items = {}
+
+    def get(self, hash_value, range_value=None):
+        return self.items.get(hash_value, {}).get(range_value)
+
+    def put(self, hash_value, range_value, item):
+        self.items.setdefault(hash_value, {})[range_value] = item
+
+    def delete(self, hash_value, range_value=None):
+        partition = self.items.get(hash_value)
+        if partition is None or range_value not in partition:
+            return False
+        del partition[range_value]
+        if not partition:
+            del self.items[hash_value]
+        return True
+
+    def partition(self, hash_value):
+        """Items with given hash key."""
+        return list(self.items.get(hash_value, {}).values())
+
+    def index_partition(self, index_name, hash_value):
+        """Items with given hash key of the secondary index."""
+        for name, index_hash, __ in self.indexes:
+            if name == index_name:
+                return [
+                    item for item in self
+                    if item.get(index_hash) == hash_value]
+        return list(self)
+
+    def scan(self, start_key=None):
+        """Iterate items in the key order, starting after the (hash, range)
+        start_key (the item with start_key may be already deleted)."""
+        hash_values = sorted(self.items, key=order_key)
+        start_hash = start_range = None
+        if start_key is not None:
+            start_hash = order_key(start_key[0])
+            start_range = order_key(start_key[1])
+            hash_values = hash_values[bisect.bisect_left(
+                [order_key(value) for value in hash_values], start_hash):]
+        for hash_value in hash_values:
+            partition = self.items.get(hash_value, {})
+            range_values = sorted(partition, key=order_key)
+            if start_key is not None and order_key(hash_value) == start_hash:
+                range_values = [
+                    value for value in range_values
+                    if start_range is not None and
+                    order_key(value) > start_range]
+            for range_value in range_values:
+                item = partition.get(range_value)
+                if item is not None:
+                    yield item
+
+    def clear(self):
+        self.items.clear()
+
+    def __iter__(self):
+        # all items in any order
+        for partition in list(self.items.values()):
+            for item in list(partition.values()):
+                yield item
+
+    def __len__(self):
+        return sum(len(partition) for partition in self.items.values())
+
+
+class MemoryStorage(object):
+    """Default storage, data is kept in memory and is not persisted."""
+
+    def create_table(self, table_name, info):
+        return MemoryTableData(
+            info['hashkey'], info['rangekey'], index_keys(info['meta']))
+
+    def update_table(self, table_name, info):
+        pass
+
+    def delete_table(self, table_name):
+        pass
+
+    def load_tables(self):
+        return {}
+
+
+def sql_key(value):
+    """Convert the key value to the value SQLite can store and order."""
+    if value is None:
+        return ''
+    if isinstance(value, Decimal):
+        if value == value.to_integral_value():
+            value = int(value)
+        else:
+            return float(value)
+    if isinstance(value, six.integer_types) and abs(value) >= 2 ** 63:
+        return float(value)
+    if hasattr(value, 'value') and not isinstance(value, six.integer_types):
+        # boto's Binary
+        return sqlite3.Binary(value.value)
+    return value
+
+
+class SqliteTableData(object):
+    """Table data in SQLite, keyed by (hash, range) with secondary indexes.
+
+    Items are pickled, key values (and index key values) are stored in
+    separate columns, so get / query / scan use SQLite indexes.
+    """
+
+    def __init__(self, storage, table_name, hashkey, rangekey, indexes=None):
+        self.storage = storage
+        self.table_name = table_name
+        self.hashkey = hashkey
+        self.rangekey = rangekey
+        self.indexes = indexes or []
+
+    def _execute(self, sql, params=()):
+        with self.storage.lock:
+            return self.storage.db.execute(sql, params).fetchall()
+
+    def get(self, hash_value, range_value=None):
+        rows = self._execute(
+            'SELECT data FROM items '
+            'WHERE tbl = ? AND hash_key = ? AND range_key = ?',
+            (self.table_name, sql_key(hash_value), sql_key(range_value)))
+        if not rows:
+            return None
+        return pickle.loads(bytes(rows[0][0]))
+
+    def put(self, hash_value, range_value, item):
+        params = (self.table_name, sql_key(hash_value), sql_key(range_value))
+        data = sqlite3.Binary(pickle.dumps(dict(item), 2))
+        with self.storage.lock:
+            db = self.storage.db
+            db.execute(
+                'INSERT OR REPLACE INTO items '
+                '(tbl, hash_key, range_key, data) VALUES (?, ?, ?, ?)',
+                params + (data,))
+            db.execute(
+                'DELETE FROM index_keys '
+                'WHERE tbl = ? AND item_hash = ? AND item_range = ?', params)
+            for name, index_hash, index_range in self.indexes:
+                if index_hash not in item:
+                    continue
+                if index_range and index_range not in item:
+                    continue
+                db.execute(
+                    'INSERT INTO index_keys '
+                    '(tbl, idx, hash_key, range_key, item_hash, item_range) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', (
+                        self.table_name, name, sql_key(item[index_hash]),
+                        sql_key(item.get(index_range))) + params[1:])
+            self.storage.changed()
+
+    def delete(self, hash_value, range_value=None):
+        params = (self.table_name, sql_key(hash_value), sql_key(range_value))
+        with self.storage.lock:
+            db = self.storage.db
+            deleted = db.execute(
+                'DELETE FROM items '
+                'WHERE tbl = ? AND hash_key = ? AND range_key = ?',
+                params).rowcount
+            db.execute(
+                'DELETE FROM index_keys '
+                'WHERE tbl = ? AND item_hash = ? AND item_range = ?', params)
+            self.storage.changed()
+        return deleted > 0
+
+    def partition(self, hash_value):
+        rows = self._execute(
+            'SELECT data FROM items WHERE tbl = ? AND hash_key = ? '
+            'ORDER BY range_key', (self.table_name, sql_key(hash_value)))
+        return [pickle.loads(bytes(row[0])) for row in rows]
+
+    def index_partition(self, index_name, hash_value):
+        rows = self._execute(
+            'SELECT items.data FROM index_keys JOIN items ON '
+            'items.tbl = index_keys.tbl AND '
+            'items.hash_key = index_keys.item_hash AND '
+            'items.range_key = index_keys.item_range '
+            'WHERE index_keys.tbl = ? AND index_keys.idx = ? AND '
+            'index_keys.hash_key = ? ORDER BY index_keys.range_key',
+            (self.table_name, index_name, sql_key(hash_value)))
+        return [pickle.loads(bytes(row[0])) for row in rows]
+
+    def scan(self, start_key=None):
+        """Iterate items in the key order, fetching rows in batches."""
+        if start_key is not None:
+            last = (sql_key(start_key[0]), sql_key(start_key[1]))
+        else:
+            last = None
+        while True:
+            if last is None:
+                rows = self._execute(
+                    'SELECT hash_key, range_key, data FROM items '
+                    'WHERE tbl = ? ORDER BY hash_key, range_key LIMIT ?',
+                    (self.table_name, FETCH_SIZE))
+            else:
+                rows = self._execute(
+                    'SELECT hash_key, range_key, data FROM items '
+                    'WHERE tbl = ? AND (hash_key > ? OR '
+                    '(hash_key = ? AND range_key > ?)) '
+                    'ORDER BY hash_key, range_key LIMIT ?',
+                    (self.table_name, last[0], last[0], last[1], FETCH_SIZE))
+            for row in rows:
+                yield pickle.loads(bytes(row[2]))
+            if len(rows) < FETCH_SIZE:
+                return
+            last = (rows[-1][0], rows[-1][1])
+
+    def clear(self):
+        with self.storage.lock:
+            self.storage.db.execute(
+                'DELETE FROM items WHERE tbl = ?', (self.table_name,))
+            self.storage.db.execute(
+                'DELETE FROM index_keys WHERE tbl = ?', (self.table_name,))
+            self.storage.changed()
+
+    def __iter__(self):
+        return self.scan()
+
+    def __len__(self):
+        rows = self._execute(
+            'SELECT COUNT(*) FROM items WHERE tbl = ?', (self.table_name,))
+        return rows[0][0]
+
+
+class SqliteStorage(object):
+    """Keeps tables in the SQLite database.
+
+    Table definitions and data are persisted, so the database file can be
+    used as a reusable fixture: once loaded, the data is available in the
+    next test run without reloading.
+
+    Changes are committed every `commit_every` writes and by `commit()`.
+    """
+
+    def __init__(self, path=':memory:', commit_every=1000):
+        self.path = path
+        self.commit_every = commit_every
+        self.lock = threading.RLock()
+        self._changes = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS tables (
+                name TEXT PRIMARY KEY, info BLOB);
+            CREATE TABLE IF NOT EXISTS items (
+                tbl TEXT, hash_key, range_key, data BLOB,
+                PRIMARY KEY (tbl, hash_key, range_key));
+            CREATE TABLE IF NOT EXISTS index_keys (
+                tbl TEXT, idx TEXT, hash_key, range_key,
+                item_hash, item_range);
+            CREATE INDEX IF NOT EXISTS index_keys_lookup
+                ON index_keys (tbl, idx, hash_key, range_key);
+            CREATE INDEX IF NOT EXISTS index_keys_item
+                ON index_keys (tbl, item_hash, item_range);
+        ''')
+
+    def _table_data(self, table_name, info):
+        return SqliteTableData(
+            self, table_name, info['hashkey'], info['rangekey'],
+            index_keys(info['meta']))
+
+    def create_table(self, table_name, info):
+        self.update_table(table_name, info)
+        return self._table_data(table_name, info)
+
+    def update_table(self, table_name, info):
+        info = dict(
+            (key, value) for key, value in info.items() if key != 'data')
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO tables (name, info) VALUES (?, ?)',
+                (table_name, sqlite3.Binary(pickle.dumps(info, 2))))
+            self.commit()
+
+    def delete_table(self, table_name):
+        with self.lock:
+            self.db.execute('DELETE FROM tables WHERE name = ?', (table_name,))
+            self.db.execute('DELETE FROM items WHERE tbl = ?', (table_name,))
+            self.db.execute(
+                'DELETE FROM index_keys WHERE tbl = ?', (table_name,))
+            self.commit()
+
+    def load_tables(self):
+        """Load persisted tables: {table_name: table info}."""
+        tables = {}
+        with self.lock:
+            rows = self.db.execute('SELECT name, info FROM tables').fetchall()
+        for name, info in rows:
+            info = pickle.loads(bytes(info))
+            info['data'] = self._table_data(name, info)
+            tables[name] = info
+        return tables
+
+    def changed(self):
+        self._changes += 1
+        if self._changes >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            self._changes = 0
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
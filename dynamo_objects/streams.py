@@ -0,0 +1,283 @@
+"""
+Change feed: incremental processing of table changes (DynamoDB Streams).
+
+Instead of re-scanning the table, the consumer reads INSERT / MODIFY /
+REMOVE changes in order and applies them to derived data (caches,
+aggregates). The position in the stream is checkpointed, so the stopped
+consumer continues from the last processed change:
+
+    enable_stream('customer')
+
+    def handler(changes):
+        for change in changes:
+            if change.event == 'REMOVE':
+                cache.delete(change.keys)
+            else:
+                cache.put(change.keys, change.new)
+
+    feed = ChangeFeed(
+        'customer', checkpoints=FileCheckpoints('/var/lib/app/feed.json'))
+    # process available changes and return
+    feed.process(handler)
+    # or keep polling until the stop event is set
+    feed.process(handler, poll_interval=1, stop=stop_event)
+
+With dynamock the changes are recorded by the mock connection, for the
+real DynamoDB the Streams API is used via boto3 (Boto3Streams adapter,
+boto3 is only required in this case).
+
+The handler gets batches of changes, the checkpoint is saved after the
+handler returns, if the handler fails, the batch is delivered again
+(at-least-once delivery).
+"""
+import json
+import os
+import threading
+
+from dynamo_objects import codec
+from dynamo_objects.database import DynamoDatabase, DynamoException
+
+
+def enable_stream(table_name, view_type='NEW_AND_OLD_IMAGES'):
+    """Enable the stream of the table, returns the stream ARN."""
+    db = DynamoDatabase()
+    full_name = db.get_table_name(table_name)
+    connection = db.get_connection()
+    if hasattr(connection, 'enable_stream'):
+        return connection.enable_stream(full_name, view_type)
+    # boto's layer1 update_table does not support streams
+    result = connection.make_request('UpdateTable', json.dumps({
+        'TableName': full_name,
+        'StreamSpecification': {
+            'StreamEnabled': True, 'StreamViewType': view_type
+        }
+    }))
+    return result['TableDescription']['LatestStreamArn']
+
+
+class Change(object):
+    """The change of the item: INSERT, MODIFY or REMOVE event.
+
+    keys, old and new are dicts of values (old / new are None if the
+    stream view type does not include them).
+    """
+
+    def __init__(self, record, shard_id):
+        change = record['dynamodb']
+        self.event = record['eventName']
+        self.shard_id = shard_id
+        self.sequence_number = change['SequenceNumber']
+        decode = codec.default_codec.decode
+        self.keys = decode(change['Keys'])
+        self.old = decode(change['OldImage']) \
+            if 'OldImage' in change else None
+        self.new = decode(change['NewImage']) \
+            if 'NewImage' in change else None
+
+    def __repr__(self):
+        return '<Change %s %s %s>' % (
+            self.event, self.keys, self.sequence_number)
+
+
+class Boto3Streams(object):
+    """DynamoDB Streams connection, adapts the boto3 client.
+
+    Methods accept and return data like the dynamock connection does.
+    """
+
+    def __init__(self, region_name=None, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client('dynamodbstreams', region_name=region_name)
+        self.client = client
+
+    def describe_stream(self, stream_arn, limit=None,
+                        exclusive_start_shard_id=None):
+        kwargs = {'StreamArn': stream_arn}
+        if limit:
+            kwargs['Limit'] = limit
+        if exclusive_start_shard_id:
+            kwargs['ExclusiveStartShardId'] = exclusive_start_shard_id
+        return self.client.describe_stream(**kwargs)
+
+    def get_shard_iterator(self, stream_arn, shard_id, shard_iterator_type,
+                           sequence_number=None):
+        kwargs = {
+            'StreamArn': stream_arn,
+            'ShardId': shard_id,
+            'ShardIteratorType': shard_iterator_type
+        }
+        if sequence_number is not None:
+            kwargs['SequenceNumber'] = sequence_number
+        return self.client.get_shard_iterator(**kwargs)
+
+    def get_records(self, shard_iterator, limit=None):
+        kwargs = {'ShardIterator': shard_iterator}
+        if limit:
+            kwargs['Limit'] = limit
+        return self.client.get_records(**kwargs)
+
+
+class FileCheckpoints(dict):
+    """Checkpoints {shard_id: sequence number} saved to the JSON file."""
+
+    def __init__(self, path):
+        super(FileCheckpoints, self).__init__()
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as checkpoints_file:
+                self.update(json.load(checkpoints_file))
+
+    def save(self):
+        # write the new file and rename, so the file is never partial
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as checkpoints_file:
+            json.dump(dict(self), checkpoints_file)
+        os.rename(temp_path, self.path)
+
+
+class ChangeFeed(object):
+    """Reads changes of the table in batches, with checkpoints.
+
+    table_name - the table with the enabled stream
+    checkpoints - dict-like {shard_id: last processed sequence number},
+        if it has the save() method, it is called after the update
+    batch_size - max number of records to read from each shard per batch
+    start - where to start shards without checkpoints: 'TRIM_HORIZON'
+        (the oldest available change) or 'LATEST' (new changes only),
+        it is used for shards found when the feed is created, shards
+        created later (children of closed shards) are read from the start
+    streams - streams connection, by default the dynamock connection or
+        Boto3Streams for the real DynamoDB
+    """
+
+    def __init__(
+        self, table_name, checkpoints=None, batch_size=100,
+        start='TRIM_HORIZON', streams=None
+    ):
+        self.db = DynamoDatabase()
+        self.table_name = table_name
+        self.checkpoints = checkpoints if checkpoints is not None else {}
+        self.batch_size = batch_size
+        self.start = start
+        self.streams = streams or self._default_streams()
+        self.stream_arn = self._get_stream_arn()
+        # {shard_id: iterator}, None for finished (closed) shards
+        self._iterators = {}
+        # {shard_id: sequence number} of changes read but not committed
+        self._pending = {}
+        # start reading from the current position (matters for 'LATEST')
+        for shard in self._get_shards():
+            self._get_iterator(shard['ShardId'], self.start)
+        # iterators after the last commit, to read changes again
+        self._committed = dict(self._iterators)
+
+    def get_batch(self):
+        """Read the next changes (the list may be empty).
+
+        Call commit() after the batch is processed, so it is not read
+        again after the restart.
+        """
+        changes = []
+        for shard in self._get_shards():
+            shard_id = shard['ShardId']
+            iterator = self._get_iterator(shard_id)
+            if iterator is None:
+                continue
+            result = self.streams.get_records(iterator, self.batch_size)
+            records = result.get('Records', [])
+            for record in records:
+                changes.append(Change(record, shard_id))
+            if records:
+                self._pending[shard_id] = \
+                    records[-1]['dynamodb']['SequenceNumber']
+            self._iterators[shard_id] = result.get('NextShardIterator')
+        return changes
+
+    def commit(self):
+        """Save checkpoints of changes returned by get_batch()."""
+        self._committed = dict(self._iterators)
+        if not self._pending:
+            return
+        self.checkpoints.update(self._pending)
+        self._pending = {}
+        if hasattr(self.checkpoints, 'save'):
+            self.checkpoints.save()
+
+    def rewind(self):
+        """Forget not committed changes, they will be read again."""
+        self._iterators = dict(self._committed)
+        self._pending = {}
+
+    def process(self, handler, poll_interval=None, stop=None):
+        """Call handler(changes) for batches of changes.
+
+        Without `poll_interval` returns when there are no more changes,
+        otherwise waits for new changes until the `stop` event is set.
+        Returns the number of processed changes.
+        """
+        stop = stop or threading.Event()
+        count = 0
+        while not stop.is_set():
+            changes = self.get_batch()
+            if changes:
+                try:
+                    handler(changes)
+                except Exception:
+                    self.rewind()
+                    raise
+                self.commit()
+                count += len(changes)
+            elif poll_interval is None:
+                break
+            else:
+                stop.wait(poll_interval)
+        return count
+
+    def _get_shards(self):
+        """Get shards to read, parent shards go before their children."""
+        shards = []
+        start_shard_id = None
+        while True:
+            result = self.streams.describe_stream(
+                self.stream_arn, exclusive_start_shard_id=start_shard_id)
+            description = result['StreamDescription']
+            shards.extend(description.get('Shards', []))
+            start_shard_id = description.get('LastEvaluatedShardId')
+            if not start_shard_id:
+                break
+        active = set(
+            shard['ShardId'] for shard in shards
+            if self._iterators.get(shard['ShardId'], True) is not None)
+        # the child shard is read once the parent shard is finished
+        return [
+            shard for shard in shards
+            if shard['ShardId'] in active and
+            shard.get('ParentShardId') not in active]
+
+    def _get_iterator(self, shard_id, start='TRIM_HORIZON'):
+        if shard_id in self._iterators:
+            return self._iterators[shard_id]
+        sequence = self.checkpoints.get(shard_id)
+        if sequence is not None:
+            result = self.streams.get_shard_iterator(
+                self.stream_arn, shard_id, 'AFTER_SEQUENCE_NUMBER', sequence)
+        else:
+            result = self.streams.get_shard_iterator(
+                self.stream_arn, shard_id, start)
+        iterator = self._iterators[shard_id] = result['ShardIterator']
+        return iterator
+
+    def _get_stream_arn(self):
+        description = self.db.get_connection().describe_table(
+            self.db.get_table_name(self.table_name))['Table']
+        if not description.get('LatestStreamArn'):
+            raise DynamoException(
+                'Stream is not enabled for the table: %s' % self.table_name)
+        return description['LatestStreamArn']
+
+    def _default_streams(self):
+        connection = self.db.get_connection()
+        if hasattr(connection, 'get_records'):
+            return connection
+        return Boto3Streams(connection.region.name)
@@ -0,0 +1,251 @@
+"""
+Adaptive throughput: provisioned throughput follows the consumed capacity.
+
+The controller is the TableThroughput context manager that samples the
+consumed capacity while the block runs and adjusts the table and global
+index throughput within the bounds:
+
+    bounds = {
+        'customer': {
+            'table': {'read': (5, 500), 'write': (5, 1000)},
+            'CustomerEmailIndex': {'read': (1, 50), 'write': (5, 1000)},
+        }
+    }
+    with AdaptiveThroughput(bounds, interval=60):
+        run_batch_job()
+
+Every `interval` seconds the throughput is set to the consumed capacity
+divided by the `target` utilization (but within bounds). Increases are
+applied immediately, decreases are only applied if the throughput can
+be reduced by more than `decrease_margin` and the table has not reached
+the daily limit of decreases. On exit the original throughput is restored.
+
+The consumed capacity is read from CloudWatch metrics, with dynamock it is
+read from the capacity counters of the mock connection.
+"""
+import datetime
+import math
+import threading
+import time
+
+from dynamo_objects.database import DynamoDatabase, TableThroughput
+from dynamo_objects.database import table_throughputs
+
+# max number of throughput decreases per table per UTC day
+DECREASES_PER_DAY = 27
+
+OPERATIONS = ('read', 'write')
+
+
+class CounterMetrics(object):
+    """Consumed capacity rates from cumulative counters (dynamock).
+
+    The connection.consumed_capacity(table_name) returns units consumed
+    since the table was created, rates are computed between calls.
+    """
+
+    def __init__(self, connection, clock=time.time):
+        self.connection = connection
+        self.clock = clock
+        self._last = {}
+
+    def consumed(self, table_name, parts):
+        """Get {part: {'read': units/sec, 'write': units/sec}}.
+
+        Returns None for the first call (there is nothing to compare with).
+        """
+        now = self.clock()
+        counters = self.connection.consumed_capacity(table_name)
+        last = self._last.get(table_name)
+        self._last[table_name] = (now, counters)
+        if last is None or now <= last[0]:
+            return None
+        elapsed = float(now - last[0])
+        rates = {}
+        for part in parts:
+            values = counters.get(part, {})
+            old_values = last[1].get(part, {})
+            rates[part] = dict(
+                (op, (values.get(op, 0) - old_values.get(op, 0)) / elapsed)
+                for op in OPERATIONS)
+        return rates
+
+
+class CloudWatchMetrics(object):
+    """Consumed capacity rates from CloudWatch (per-minute sums)."""
+
+    METRICS = {
+        'read': 'ConsumedReadCapacityUnits',
+        'write': 'ConsumedWriteCapacityUnits'
+    }
+
+    def __init__(self, region_name=None, period=60, connection=None):
+        if connection is None:
+            import boto.ec2.cloudwatch
+            connection = boto.ec2.cloudwatch.connect_to_region(region_name)
+        self.connection = connection
+        self.period = period
+
+    def consumed(self, table_name, parts):
+        """Get {part: {'read': units/sec, 'write': units/sec}}."""
+        end = datetime.datetime.utcnow()
+        # metrics are delayed, look at several last periods
+        start = end - datetime.timedelta(seconds=self.period * 5)
+        rates = {}
+        for part in parts:
+            dimensions = {'TableName': table_name}
+            if part != 'table':
+                dimensions['GlobalSecondaryIndexName'] = part
+            rates[part] = {}
+            for op, metric in self.METRICS.items():
+                points = self.connection.get_metric_statistics(
+                    self.period, start, end, metric, 'AWS/DynamoDB',
+                    ['Sum'], dimensions=dimensions)
+                points = sorted(points, key=lambda point: point['Timestamp'])
+                rates[part][op] = \
+                    points[-1]['Sum'] / self.period if points else 0
+        return rates
+
+
+class AdaptiveThroughput(TableThroughput):
+    """Adjusts tables throughput to the consumed capacity.
+
+    bounds - {'table_name': {'table': {'read': (min, max), ...},
+                             'IndexName': {...}}}
+    metrics - consumed capacity source (CloudWatchMetrics by default,
+        CounterMetrics for dynamock)
+    interval - seconds between adjustments
+    target - target utilization (consumed / provisioned)
+    start - throughputs to set on enter, by default current throughputs
+        are limited by bounds
+    """
+
+    def __init__(
+        self, bounds, metrics=None, interval=60, target=0.7,
+        decrease_margin=0.3, max_decreases=DECREASES_PER_DAY, start=None,
+        restore=True, wait_enter=True, wait_exit=False
+    ):
+        db = DynamoDatabase()
+        old_throughputs = dict(
+            (table_name, db.get_table_throughputs(db.get_table(table_name)))
+            for table_name in bounds)
+        if start is None:
+            start = {}
+            for table_name in bounds:
+                limited = self._limit(
+                    bounds[table_name], old_throughputs[table_name])
+                if limited:
+                    start[table_name] = limited
+        super(AdaptiveThroughput, self).__init__(
+            start, old_throughputs, restore=restore,
+            wait_enter=wait_enter, wait_exit=wait_exit)
+        for table_name in bounds:
+            self._tables[table_name] = self.db.get_table(table_name)
+        self.bounds = bounds
+        self.metrics = metrics or self._default_metrics()
+        self.interval = interval
+        self.target = target
+        self.decrease_margin = decrease_margin
+        self.max_decreases = max_decreases
+        # [(time, {table_name: throughputs})] of applied updates
+        self.history = []
+        self.errors = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        super(AdaptiveThroughput, self).__enter__()
+        for table_name in self.bounds:
+            # the first sample is the base for rates
+            self.metrics.consumed(
+                self.db.get_table_name(table_name),
+                list(self.bounds[table_name]))
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self._stop.set()
+        self._thread.join()
+        if self.restore:
+            # restore only changed tables, DynamoDB rejects updates
+            # that do not change the throughput
+            changed = set(self._new_throughputs)
+            for __, updates in self.history:
+                changed.update(updates)
+            self.update_throughputs(
+                dict((table_name, self._old_throughputs[table_name])
+                     for table_name in changed),
+                self.wait_exit)
+
+    def step(self):
+        """Sample consumed capacity and update throughputs, once.
+
+        Returns {table_name: throughputs} of applied updates.
+        """
+        updates = {}
+        for table_name in self.bounds:
+            info = self._tables[table_name].describe()['Table']
+            if info['TableStatus'] != 'ACTIVE':
+                # the previous update is still in progress
+                continue
+            consumed = self.metrics.consumed(
+                self.db.get_table_name(table_name),
+                list(self.bounds[table_name]))
+            if consumed is None:
+                continue
+            decreases = info['ProvisionedThroughput'].get(
+                'NumberOfDecreasesToday', 0)
+            update = self._adjust(
+                self.bounds[table_name], table_throughputs(info), consumed,
+                decreases < self.max_decreases)
+            if update:
+                updates[table_name] = update
+        if updates:
+            self.update_throughputs(updates, wait=False)
+            self.history.append((time.time(), updates))
+        return updates
+
+    def _adjust(self, bounds, current, consumed, can_decrease):
+        update = {}
+        for part, part_bounds in bounds.items():
+            new = dict(current[part])
+            for op, (low, high) in part_bounds.items():
+                used = consumed.get(part, {}).get(op, 0)
+                desired = int(math.ceil(used / self.target))
+                desired = min(high, max(low, desired))
+                if desired > new[op]:
+                    new[op] = desired
+                elif can_decrease and \
+                        desired < new[op] * (1 - self.decrease_margin):
+                    new[op] = desired
+            if new != current[part]:
+                update[part] = new
+        return update
+
+    def _limit(self, bounds, current):
+        """Get throughputs limited by bounds (only changed parts)."""
+        limited = {}
+        for part, part_bounds in bounds.items():
+            new = dict(current[part])
+            for op, (low, high) in part_bounds.items():
+                new[op] = min(high, max(low, new[op]))
+            if new != current[part]:
+                limited[part] = new
+        return limited
+
+    def _default_metrics(self):
+        connection = self.db.get_connection()
+        if hasattr(connection, 'consumed_capacity'):
+            return CounterMetrics(connection)
+        return CloudWatchMetrics(connection.region.name)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.step()
+            except Exception as e:
+                # keep adjusting, errors can be checked after the block
+                self.errors.append(e)
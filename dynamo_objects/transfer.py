@@ -0,0 +1,291 @@
+"""
+Export / import of the table data to / from the gzipped JSON Lines files.
+
+The export is a directory with the `manifest.json` (table description
+and the list of shards) and data shards like `segment-002-00001.jsonl.gz`.
+Items are stored in the DynamoDB wire format (same JSON the API uses),
+one item per line, so types (sets, numbers, binary) are preserved:
+
+    {"customer_id": {"S": "C1"}, "age": {"N": "20"}}
+
+The export scans the table in parallel segments, each segment is written
+into its own shards, the shard is closed once it has `shard_size` items,
+so only one page per segment is kept in memory.
+
+The import writes shards with batch writes (optionally rate-limited) and
+records finished shards in the progress file of the destination table,
+so the interrupted import can be resumed (it will skip already imported
+shards).
+
+Usually the DynamoDatabase methods are used:
+
+    db.export_table('customer', '/tmp/customer_export')
+    db.import_table('/tmp/customer_export', 'customer_copy')
+"""
+import gzip
+import json
+import os
+import threading
+import time
+
+from boto.exception import JSONResponseError
+
+MANIFEST = 'manifest.json'
+# the progress file of the import into the table
+PROGRESS = 'import-progress-%s.txt'
+
+# max number of items in the batch_write_item request
+BATCH_WRITE_SIZE = 25
+
+
+def thread_pool(size):
+    # multiprocessing is imported on the first use to speed up the startup
+    from multiprocessing.pool import ThreadPool
+    return ThreadPool(size)
+
+
+def fork_pool(size, initializer=None):
+    """Process pool with forked workers (they inherit the parent state).
+
+    Returns None if the platform does not support fork.
+    """
+    import multiprocessing
+    if not hasattr(multiprocessing, 'get_context'):
+        # python 2 always forks on posix
+        if not hasattr(os, 'fork'):
+            return None
+        return multiprocessing.Pool(size, initializer)
+    try:
+        context = multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+    return context.Pool(size, initializer)
+
+
+class RateLimiter(object):
+    """Limits the rate of operations (like items written) per second.
+
+    Thread-safe, can be shared by several workers.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._next_time = time.time()
+        self._lock = threading.Lock()
+
+    def wait(self, count=1):
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_time)
+            self._next_time = start + count / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def table_schema(description):
+    """Get create_table() wire arguments from the table description."""
+    throughput = description['ProvisionedThroughput']
+    schema = {
+        'attribute_definitions': description['AttributeDefinitions'],
+        'key_schema': description['KeySchema'],
+        'provisioned_throughput': {
+            'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+            'WriteCapacityUnits': throughput['WriteCapacityUnits']
+        }
+    }
+    global_indexes = []
+    for index in description.get('GlobalSecondaryIndexes') or []:
+        index_throughput = index['ProvisionedThroughput']
+        global_indexes.append({
+            'IndexName': index['IndexName'],
+            'KeySchema': index['KeySchema'],
+            'Projection': index['Projection'],
+            'ProvisionedThroughput': {
+                'ReadCapacityUnits': index_throughput['ReadCapacityUnits'],
+                'WriteCapacityUnits': index_throughput['WriteCapacityUnits']
+            }
+        })
+    if global_indexes:
+        schema['global_secondary_indexes'] = global_indexes
+    local_indexes = [
+        {
+            'IndexName': index['IndexName'],
+            'KeySchema': index['KeySchema'],
+            'Projection': index['Projection']
+        }
+        for index in description.get('LocalSecondaryIndexes') or []
+    ]
+    if local_indexes:
+        schema['local_secondary_indexes'] = local_indexes
+    return schema
+
+
+class ShardWriter(object):
+    """Writes items into the sequence of gzipped JSON Lines shards."""
+
+    def __init__(self, path, segment, shard_size):
+        self.path = path
+        self.segment = segment
+        self.shard_size = shard_size
+        self.shards = []
+        self._file = None
+
+    def write(self, item):
+        if self._file is None:
+            name = 'segment-%03d-%05d.jsonl.gz' % (
+                self.segment, len(self.shards))
+            self._file = gzip.open(os.path.join(self.path, name), 'wb')
+            self.shards.append({'name': name, 'count': 0})
+        line = json.dumps(item, sort_keys=True) + '\n'
+        self._file.write(line.encode('utf-8'))
+        self.shards[-1]['count'] += 1
+        if self.shards[-1]['count'] >= self.shard_size:
+            self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_shard(path):
+    """Iterate items (in the wire format) from the shard file."""
+    with gzip.open(path, 'rb') as shard:
+        for line in shard:
+            if line.strip():
+                yield json.loads(line.decode('utf-8'))
+
+
+def export_table(connection, table_name, path, segments=4, shard_size=10000,
+                 page_size=None):
+    """Export the table into the directory, returns the manifest.
+
+    connection - low-level connection (DynamoDBConnection or dynamock)
+    segments - number of parallel scan segments (and worker threads)
+    shard_size - max number of items in one shard file
+    page_size - scan page size (the `Limit` parameter)
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    description = connection.describe_table(table_name)['Table']
+
+    def export_segment(segment):
+        writer = ShardWriter(path, segment, shard_size)
+        start_key = None
+        try:
+            while True:
+                result = connection.scan(
+                    table_name, limit=page_size,
+                    exclusive_start_key=start_key,
+                    segment=segment, total_segments=segments)
+                for item in result.get('Items', []):
+                    writer.write(item)
+                start_key = result.get('LastEvaluatedKey')
+                if not start_key:
+                    return writer.shards
+        finally:
+            writer.close()
+
+    pool = thread_pool(segments)
+    try:
+        segment_shards = pool.map(export_segment, range(segments))
+    finally:
+        pool.close()
+        pool.join()
+    shards = [shard for shards in segment_shards for shard in shards]
+    manifest = {
+        'table_name': table_name,
+        'schema': table_schema(description),
+        'count': sum(shard['count'] for shard in shards),
+        'shards': shards
+    }
+    # the manifest is written last, the export without it is incomplete
+    with open(os.path.join(path, MANIFEST), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def wait_table_active(connection, table_name, max_delay=5):
+    delay = 0.05
+    while True:
+        info = connection.describe_table(table_name)['Table']
+        if info['TableStatus'] == 'ACTIVE':
+            return
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def import_table(connection, path, table_name, workers=4, rate=None,
+                 progress_path=None, create=True, progress=None):
+    """Import the exported data into the table, returns number of items.
+
+    The table is created (with the exported schema) if it does not exist
+    and `create` is True.
+
+    workers - number of shards to import in parallel
+    rate - max number of items written per second (for all workers)
+    progress_path - file to record imported shards, by default it is
+        the `import-progress-<table_name>.txt` in the export directory
+        (so the export can be imported into several tables); remove it
+        to import the data again
+    progress - optional progress bar object with update(count) method
+    """
+    manifest = read_manifest(path)
+    if create:
+        try:
+            connection.describe_table(table_name)
+        except JSONResponseError as e:
+            if not e.body.get('__type', '').endswith(
+                    '#ResourceNotFoundException'):
+                raise
+            connection.create_table(
+                table_name=table_name, **manifest['schema'])
+            wait_table_active(connection, table_name)
+    if progress_path is None:
+        progress_path = os.path.join(path, PROGRESS % table_name)
+    done = set()
+    if os.path.exists(progress_path):
+        with open(progress_path) as progress_file:
+            done = set(line.strip() for line in progress_file)
+    limiter = RateLimiter(rate) if rate else None
+    lock = threading.Lock()
+
+    def write_batch(requests):
+        delay = 0.05
+        while requests:
+            if limiter:
+                limiter.wait(len(requests))
+            result = connection.batch_write_item({table_name: requests})
+            requests = result.get('UnprocessedItems', {}).get(table_name)
+            if requests:
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+
+    def import_shard(shard):
+        requests = []
+        for item in read_shard(os.path.join(path, shard['name'])):
+            requests.append({'PutRequest': {'Item': item}})
+            if len(requests) == BATCH_WRITE_SIZE:
+                write_batch(requests)
+                requests = []
+        write_batch(requests)
+        with lock:
+            with open(progress_path, 'a') as progress_file:
+                progress_file.write(shard['name'] + '\n')
+            if progress:
+                progress.update(shard['count'])
+        return shard['count']
+
+    shards = [
+        shard for shard in manifest['shards'] if shard['name'] not in done]
+    pool = thread_pool(workers)
+    try:
+        return sum(pool.map(import_shard, shards))
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,212 @@
+"""
+Write-behind: save() returns immediately, records are written later.
+
+Records are put into the bounded queue and written by background workers
+with BatchWriteItem requests. Repeated saves of the same key made before
+the write are merged (only the last version is written). When the queue
+is full, save() waits until workers free the space (backpressure).
+
+To use it for DynamoTable.save(), set the `write_behind` attribute of
+the table class (the same writer can be shared by several tables):
+
+    writer = WriteBehind(max_size=10000, workers=2)
+
+    class VisitTable(DynamoTable):
+        write_behind = writer
+
+    table.save(visit)   # queued
+    writer.flush()      # wait until all queued records are written
+
+Records are written with full puts (like MemoryTable.save_data_batch()),
+records with the _version_field are saved synchronously, as they need
+the conditional write.
+Failed writes are passed to the `on_error(table_name, items, error)`
+callback, if it is not set, they are kept in the `dead_letters` list
+as (table_name, items, error).
+Queued records are written on the interpreter exit (see close()).
+"""
+import atexit
+import collections
+import threading
+import time
+
+from dynamo_objects.database import DynamoException, hashable_value
+from dynamo_objects import transfer
+
+
+class WriteBehind(object):
+    """Queue of records to write in background with batch writes.
+
+    max_size - max number of queued records, save() blocks when full
+    workers - number of background writer threads
+    batch_wait - seconds to wait for more records to fill the batch
+    on_error - callback(table_name, items, error) for failed writes
+    """
+
+    def __init__(
+        self, max_size=1000, workers=2, batch_wait=0.05, on_error=None,
+        at_exit=True
+    ):
+        self.max_size = max_size
+        self.batch_wait = batch_wait
+        self.on_error = on_error
+        self.dead_letters = []
+        self.written = 0
+        self.merged = 0
+        # (table_name, key): (table, item data, [old data])
+        self._queue = collections.OrderedDict()
+        # keys being written, not taken from the queue until done
+        self._writing = set()
+        self._changed = threading.Condition(threading.Lock())
+        self._closed = False
+        self._threads = []
+        for __ in range(workers):
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        if at_exit:
+            atexit.register(self.close)
+
+    def save(self, table, record, timeout=None):
+        """Queue the record of the DynamoTable.
+
+        Waits for the free space if the queue is full, raises
+        DynamoException if it is not available within `timeout` seconds.
+        """
+        keys = table._get_record_keys(record)
+        data = table._get_safe_data(table._get_record_data(record))
+        key = (table.table_name, hashable_value(keys))
+        # values before update, to invalidate queries by old index keys
+        old_data = []
+        if table.query_cache is not None:
+            if record._item:
+                old_data.append(dict(record._item.items()))
+            elif record._fingerprint is not None:
+                old_data.append(record._fingerprint.get_keys(
+                    table._fingerprint_keys()))
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            if self._closed:
+                raise DynamoException('Write-behind queue is closed')
+            while key not in self._queue and \
+                    len(self._queue) >= self.max_size:
+                wait = None if deadline is None else deadline - time.time()
+                if wait is not None and wait <= 0:
+                    raise DynamoException('Write-behind queue is full')
+                self._changed.wait(wait)
+            if key in self._queue:
+                self.merged += 1
+                # the merged save was not written, its old data is too
+                old_data = self._queue[key][2] + old_data
+            self._queue[key] = (table, data, old_data)
+            self._changed.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until all queued records are written.
+
+        Returns False if the timeout expired before that.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while self._queue or self._writing:
+                wait = None if deadline is None else deadline - time.time()
+                if wait is not None and wait <= 0:
+                    return False
+                self._changed.wait(wait)
+        return True
+
+    def close(self, timeout=None):
+        """Write queued records and stop workers, save() is not accepted."""
+        with self._changed:
+            if self._closed:
+                return
+            self._closed = True
+            self._changed.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _take_batch(self):
+        """Get up to BATCH_WRITE_SIZE queued records, None to stop."""
+        with self._changed:
+            while True:
+                if self._closed or len(self._queue) >= \
+                        transfer.BATCH_WRITE_SIZE:
+                    # don't wait for more records
+                    batch = self._pop_batch()
+                elif self._queue:
+                    # give other saves a chance to join the batch
+                    self._changed.wait(self.batch_wait)
+                    batch = self._pop_batch()
+                else:
+                    batch = None
+                if batch:
+                    return batch
+                if self._closed and not self._queue and not self._writing:
+                    return None
+                self._changed.wait()
+
+    def _pop_batch(self):
+        batch = []
+        for key in list(self._queue):
+            if key in self._writing:
+                # the previous version of the record is being written
+                continue
+            batch.append((key, self._queue.pop(key)))
+            self._writing.add(key)
+            if len(batch) >= transfer.BATCH_WRITE_SIZE:
+                break
+        if batch:
+            # the space is available
+            self._changed.notify_all()
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            finally:
+                with self._changed:
+                    for key, __ in batch:
+                        self._writing.discard(key)
+                    self._changed.notify_all()
+
+    def _write(self, batch):
+        tables = collections.OrderedDict()
+        for (table_name, __), (table, data, old_data) in batch:
+            __, items, old_items = tables.setdefault(
+                table_name, (table, [], []))
+            items.append(data)
+            old_items.extend(old_data)
+        for table_name, (table, items, old_items) in tables.items():
+            record_codec = table._get_codec()
+            requests = [
+                {'PutRequest': {'Item': record_codec.encode(data)}}
+                for data in items]
+            try:
+                table.db._batch_write(
+                    table.db.get_table_name(table_name), requests)
+            except Exception as e:
+                self._failed(table_name, items, e)
+                continue
+            self.written += len(items)
+            table._invalidate_query_cache(*(items + old_items))
+            if table.key_sampler is not None:
+                for data in items:
+                    table._sample('write', data)
+
+    def _failed(self, table_name, items, error):
+        if self.on_error is None:
+            self.dead_letters.append((table_name, items, error))
+            return
+        try:
+            self.on_error(table_name, items, error)
+        except Exception as e:
+            # the worker should continue
+            self.dead_letters.append((table_name, items, e))
@@ -21,7 +21,7 @@ TEST_REQUIREMENTS = [
 setup(
     name='dynamo_objects',
     version='1.0.18',
-    packages=find_packages(exclude=('tests', 'tool')),
+    packages=find_packages(exclude=('tests', 'tool', 'benchmarks')),
     url='https://github.com/serebrov/dynamo_objects',
     author='Boris Serebrov',
     author_email='dynamo_objects@googlegroups.com',
@@ -33,12 +33,6 @@ class BaseDynamoTest(unittest.TestCase):
         else:
             # or ensure that we have the local dynamodb, not the real one
             self.assertTrue(self.db.is_local_db())
-            tables = self.db.get_tables()
-            if tables:
-                for name in tables:
-                    if name.startswith(TABLE_PREFIX):
-                        table = self.db.get_table_raw(name)
-                        table.delete()
-                        while self.db.check_exists(table):
-                            time.sleep(.5)
-            self.db.get_tables()
+            self.db.delete_tables([
+                name[len(TABLE_PREFIX):] for name in self.db.get_tables()
+                if name.startswith(TABLE_PREFIX)])
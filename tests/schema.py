@@ -35,7 +35,7 @@ class CompanyTable(DynamoTable):
             record_class=Company)
 
     def get_stores(self):
-        return StoreTable().query(
+        return StoreTable.instance().query(
             company_id__eq=self.company_id, index='StoreCompanyIndex')
 
 
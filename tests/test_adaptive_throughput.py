@@ -0,0 +1,92 @@
+import unittest
+from dynamo_objects import database
+from dynamo_objects.throughput import AdaptiveThroughput, CounterMetrics
+from .base import BaseDynamoTest, DYNAMODB_MOCK
+from .schema import Customer, CustomerTable
+
+
+@unittest.skipUnless(DYNAMODB_MOCK, 'uses dynamock capacity counters')
+class AdaptiveThroughputTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(AdaptiveThroughputTest, self).setUp()
+        self.table = CustomerTable()
+        self.now = [0]
+        self.written = 0
+        self.metrics = CounterMetrics(
+            self.db.get_connection(), clock=lambda: self.now[0])
+        self.bounds = {
+            'customer': {'table': {'read': (2, 100), 'write': (1, 50)}}}
+
+    def throughputs(self):
+        return self.db.get_table_throughputs(self.table.table)['table']
+
+    def write(self, count):
+        for num in range(self.written, self.written + count):
+            self.table.save(Customer(customer_id='C%s' % num, age=num))
+        self.written += count
+        self.now[0] += 1
+
+    def controller(self, **kwargs):
+        return AdaptiveThroughput(
+            self.bounds, metrics=self.metrics, interval=3600, **kwargs)
+
+    def test_adjust(self):
+        old = self.throughputs()
+        with self.controller() as controller:
+            self.write(14)
+            self.assertEqual(
+                {'customer': {'table': {'read': 2, 'write': 20}}},
+                controller.step())
+            # the table is updating, no changes
+            self.write(100)
+            self.assertEqual({}, controller.step())
+            self.assertEqual({'read': 2, 'write': 20}, self.throughputs())
+            # the max limit
+            self.write(100)
+            self.assertEqual(
+                {'customer': {'table': {'read': 2, 'write': 50}}},
+                controller.step())
+            self.now[0] += 1
+            self.throughputs()
+            # decrease
+            self.assertEqual(
+                {'customer': {'table': {'read': 2, 'write': 1}}},
+                controller.step())
+        self.assertEqual(old, self.throughputs())
+
+    def test_decreases_limit(self):
+        with self.controller(max_decreases=0) as controller:
+            self.now[0] += 1
+            self.assertEqual({}, controller.step())
+            self.write(70)
+            self.assertEqual(
+                {'customer': {'table': {'read': 20, 'write': 50}}},
+                controller.step())
+
+    def test_start(self):
+        self.bounds['customer']['table']['write'] = (10, 50)
+        with self.controller():
+            self.assertEqual({'read': 20, 'write': 10}, self.throughputs())
+
+    def test_consumed_capacity(self):
+        connection = self.db.get_connection()
+        table_name = self.db.get_table_name('customer')
+        consumed = connection.consumed_capacity(table_name).get(
+            'table', {'read': 0, 'write': 0})
+        # writes don't consume the read capacity
+        self.write(2)
+        connection.delete_item(
+            table_name, {'customer_id': {'S': 'C0'}, 'age': {'N': '0'}})
+        self.table.save(Customer(customer_id='C9', age=9, first_name='F'))
+        self.assertEqual(
+            {'read': consumed['read'], 'write': consumed['write'] + 4},
+            connection.consumed_capacity(table_name)['table'])
+        self.table.get('C1', 1)
+        self.assertEqual(
+            consumed['read'] + 1,
+            connection.consumed_capacity(table_name)['table']['read'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+class BenchmarksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.dirname(os.path.dirname(os.path.abspath(
+            __file__)))
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def run_benchmarks(self, *args):
+        # benchmarks connect with their own table prefix, so they run in
+        # the separate process
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(
+                [sys.executable, '-m', 'benchmarks.run', '--sizes', '10',
+                 '--repeat', '1', '--min-time', '0.01'] + list(args),
+                cwd=self.root, stdout=devnull)
+
+    def test_smoke(self):
+        output = os.path.join(self.path, 'output.json')
+        baseline = os.path.join(self.path, 'baseline.json')
+        # the first run records the baseline
+        self.assertEqual(0, self.run_benchmarks(
+            '--output', output, '--baseline', baseline))
+        with open(output) as output_file:
+            results = json.load(output_file)['results']
+        with open(baseline) as baseline_file:
+            self.assertEqual(results, json.load(baseline_file)['results'])
+        self.assertIn('table_save_update', results)
+        self.assertIn('query_10', results)
+        self.assertTrue(all(
+            result['seconds'] > 0 for result in results.values()))
+        # everything is slower than the fast baseline
+        for result in results.values():
+            result['seconds'] /= 100
+        with open(baseline, 'w') as baseline_file:
+            json.dump({'results': results}, baseline_file)
+        self.assertEqual(1, self.run_benchmarks(
+            '--only', 'record_get_dict', '--baseline', baseline))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+from dynamo_objects.coalesce import BatchGetter, SingleFlight
+from dynamo_objects.database import ItemNotFound
+from dynamo_objects.memorydb import MemoryTable
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable
+
+
+def run_threads(count, target):
+    """Run target(num) in threads, return results by num."""
+    results = {}
+
+    def run(num):
+        try:
+            results[num] = target(num)
+        except Exception as e:
+            results[num] = e
+    threads = [
+        threading.Thread(target=run, args=(num,)) for num in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_do(self):
+        flight = SingleFlight()
+        calls = []
+
+        def load():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'value'
+        results = run_threads(5, lambda num: flight.do('key', load))
+        self.assertEqual(['value'] * 5, list(results.values()))
+        self.assertEqual(1, len(calls))
+        # next call after the first one is finished
+        self.assertEqual('value', flight.do('key', load))
+        self.assertEqual(2, len(calls))
+
+    def test_error(self):
+        flight = SingleFlight()
+
+        def load():
+            time.sleep(0.05)
+            raise ItemNotFound()
+        results = run_threads(3, lambda num: flight.do('key', load))
+        for result in results.values():
+            self.assertIsInstance(result, ItemNotFound)
+
+
+class CoalescedGetTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(CoalescedGetTest, self).setUp()
+        self.table = CustomerTable()
+        for age in range(5):
+            self.table.save(Customer(customer_id='C1', age=age))
+
+    def tearDown(self):
+        CustomerTable.get_coalescer = None
+
+    def test_single_flight(self):
+        CustomerTable.get_coalescer = SingleFlight()
+        results = run_threads(5, lambda num: self.table.get('C1', 2))
+        records = list(results.values())
+        self.assertEqual([2] * 5, [record.age for record in records])
+        # each record has its own boto item
+        self.assertEqual(5, len(set(id(record._item) for record in records)))
+        with self.assertRaises(ItemNotFound):
+            self.table.get('C1', 10)
+
+    def test_batch_getter(self):
+        getter = BatchGetter(window=0.1)
+        CustomerTable.get_coalescer = getter
+        results = run_threads(
+            7, lambda num: self.table.get('C1', num % 6).age)
+        self.assertEqual(1, getter.batches)
+        for num, result in results.items():
+            if num % 6 == 5:
+                self.assertIsInstance(result, ItemNotFound)
+            else:
+                self.assertEqual(num % 6, result)
+        record = self.table.get('C1', 1)
+        record.first_name = 'Bob'
+        self.table.save(record)
+        self.assertEqual('Bob', self.table.get('C1', 1).first_name)
+        self.assertEqual(3, getter.batches)
+
+    def test_memory_table(self):
+        memory = MemoryTable(self.table)
+        original_get = self.table.get
+
+        def slow_get(*args):
+            time.sleep(0.05)
+            return original_get(*args)
+        self.table.get = slow_get
+        results = run_threads(5, lambda num: memory.get('C1', 1))
+        self.assertEqual(1, len(set(id(item) for item in results.values())))
+        self.assertEqual(1, memory.db_reads)
+        results = run_threads(3, lambda num: memory.get('C1', 10))
+        for result in results.values():
+            self.assertIsInstance(result, ItemNotFound)
+        self.assertEqual(2, memory.db_reads)
+        # create the record if it is not found
+        self.assertEqual(10, memory.get('C1', 10, create=True).age)
+
+
+if __name__ == "__main__":
+    unittest.main()
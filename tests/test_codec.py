@@ -0,0 +1,108 @@
+import unittest
+from decimal import Decimal
+from boto.dynamodb.types import Dynamizer
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException
+from dynamo_objects import codec
+from dynamo_objects.codec import RecordCodec, record_codec
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable
+
+
+class RecordCodecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = record_codec(Customer)
+        self.data = {
+            'customer_id': 'C1', 'age': 20, 'first_name': u'\xc4nna',
+            'email': '', 'updated': 1.5, 'thanks_count': 0,
+            'tags': set(['a', 'b']), 'extra': {'a': 1, 'b': ''},
+            'visits': [1, 'x'], 'active': False, 'note': None}
+
+    def test_encode(self):
+        dyn = Dynamizer()
+        expected = dict(
+            (key, dyn.encode(value))
+            for key, value in codec.storable_data(self.data).items()
+            if codec.is_storable(value))
+        self.assertEqual(expected, self.codec.encode(self.data))
+        self.assertNotIn('email', self.codec.encode(self.data))
+        self.assertEqual({'M': {'a': {'N': '1'}}},
+                         self.codec.encode(self.data)['extra'])
+
+    def test_mismatched_types(self):
+        wire = self.codec.encode(
+            {'customer_id': 10, 'age': '20', 'thanks_count': 10 ** 20})
+        self.assertEqual({'N': '10'}, wire['customer_id'])
+        self.assertEqual({'S': '20'}, wire['age'])
+        self.assertEqual({'N': str(10 ** 20)}, wire['thanks_count'])
+
+    def test_decode(self):
+        wire = self.codec.encode(self.data)
+        data = self.codec.decode(wire)
+        self.assertEqual(Decimal('20'), data['age'])
+        self.assertEqual(set(['a', 'b']), data['tags'])
+        data = self.codec.decode(wire, native_numbers=True)
+        self.assertIs(int, type(data['age']))
+        self.assertEqual(1.5, data['updated'])
+        self.assertEqual(u'\xc4nna', data['first_name'])
+
+    def test_cached(self):
+        self.assertIs(self.codec, record_codec(Customer))
+        self.assertEqual({}, RecordCodec().encoders)
+
+
+class TableCodecTest(BaseDynamoTest):
+
+    def test_update_counter(self):
+        table = CustomerTable()
+        table.save(Customer(customer_id='C1', age=1))
+        table.update_counter('C1', 1, thanks_count=2)
+        self.assertEqual(2, table.get('C1', 1).thanks_count)
+
+    def test_save(self):
+        table = CustomerTable()
+        table.save(Customer(customer_id='C1', age=1, first_name='F'))
+        # the new record is not saved over the existing item
+        with self.assertRaises(ConditionalCheckFailedException):
+            table.save(Customer(customer_id='C1', age=1))
+        first = table.get('C1', 1)
+        second = table.get('C1', 1)
+        first.first_name = 'First'
+        first.email = 'e@example.com'
+        table.save(first)
+        # the saved record is updated again
+        first.email = ''
+        table.save(first)
+        customer = table.get('C1', 1)
+        self.assertEqual('First', customer.first_name)
+        self.assertEqual('', customer.email)
+        # the attribute was changed after load
+        second.first_name = 'Second'
+        with self.assertRaises(ConditionalCheckFailedException):
+            table.save(second)
+
+    def test_save_changed_keys(self):
+        table = CustomerTable()
+        table.save(Customer(customer_id='C1', age=1, first_name='F'))
+        customer = table.get('C1', 1)
+        # the record with changed keys is saved as the new item
+        customer.age = 2
+        customer.last_name = 'L'
+        table.save(customer)
+        self.assertEqual('L', table.get('C1', 2).last_name)
+        self.assertEqual('F', table.get('C1', 2).first_name)
+        self.assertEqual('', table.get('C1', 1).last_name)
+        # and it is updated after that
+        customer.last_name = 'Last'
+        table.save(customer)
+        self.assertEqual('Last', table.get('C1', 2).last_name)
+        self.assertEqual(2, table.query_count(customer_id__eq='C1'))
+        # the new item is not saved over the existing one
+        other = table.get('C1', 1)
+        other.age = 2
+        with self.assertRaises(ConditionalCheckFailedException):
+            table.save(other)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from boto.dynamodb2.fields import HashKey
+from boto.dynamodb.types import Binary
+from dynamo_objects import DynamoRecord, DynamoTable
+from dynamo_objects import compression
+from dynamo_objects.compression import CompressedField, ZlibCodec
+from .base import BaseDynamoTest
+
+
+class Document(DynamoRecord):
+
+    body = CompressedField(threshold=100)
+    meta = CompressedField(threshold=100, codec=ZlibCodec(level=9))
+
+    def __init__(self, **data):
+        self.doc_id = ''
+        self.title = ''
+        self.body = ''
+        self.meta = {}
+        super(Document, self).__init__(**data)
+
+
+class DocumentTable(DynamoTable):
+
+    def __init__(self):
+        super(DocumentTable, self).__init__(
+            'document',
+            schema=[HashKey('doc_id')],
+            throughput={'read': 3, 'write': 3},
+            record_class=Document)
+
+
+class CompressionTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(CompressionTest, self).setUp()
+        self.table = DocumentTable()
+        self.body = u'Long text \xe4 ' * 100
+        self.meta = {'tags': ['a', 'b'] * 50, 'size': 10}
+        self.table.save(Document(
+            doc_id='D1', title='Doc', body=self.body, meta=self.meta))
+
+    def test_stored_compressed(self):
+        item = self.table.table.get_item(doc_id='D1')
+        self.assertIsInstance(item['body'], Binary)
+        self.assertTrue(len(item['body'].value) < len(self.body))
+        self.assertIsInstance(item['meta'], Binary)
+        self.assertEqual('Doc', item['title'])
+
+    def test_small_not_compressed(self):
+        self.table.save(Document(doc_id='D2', body='short'))
+        item = self.table.table.get_item(doc_id='D2')
+        self.assertEqual('short', item['body'])
+        self.assertEqual('short', self.table.get('D2').body)
+
+    def test_load(self):
+        doc = self.table.get('D1')
+        self.assertEqual(self.body, doc.body)
+        self.assertEqual(self.meta, doc.meta)
+        self.assertEqual(self.body, doc.get_dict()['body'])
+
+    def test_lazy(self):
+        doc = self.table.get('D1')
+        self.assertTrue(compression.is_compressed(doc.__dict__['body']))
+        self.assertEqual(self.body, doc.body)
+        self.assertEqual(self.body, doc.__dict__['body'])
+        # not accessed field is saved without decompression
+        doc.title = 'Changed'
+        self.table.save(doc)
+        self.assertTrue(compression.is_compressed(doc.__dict__['meta']))
+        doc = self.table.get('D1')
+        self.assertEqual('Changed', doc.title)
+        self.assertEqual(self.meta, doc.meta)
+
+    def test_update(self):
+        doc = self.table.get('D1')
+        doc.body += u'more'
+        doc.meta['size'] = 20
+        self.table.save(doc)
+        doc = self.table.get('D1')
+        self.assertEqual(self.body + u'more', doc.body)
+        self.assertEqual(20, doc.meta['size'])
+
+    def test_bytes(self):
+        data = b'\x00\xff' * 100
+        field = CompressedField(threshold=10)
+        self.assertEqual(data, compression.decompress(field.compress(data)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,12 @@
 import unittest
+from boto.dynamodb2.fields import HashKey
 from dynamo_objects import database
 from .base import BaseDynamoTest
-from .schema import Store, StoreTable
+from .schema import Customer, CustomerTable, Store, StoreTable
+
+
+class ExistingCustomerTable(CustomerTable):
+    assume_exists = True
 
 
 class DbTest(BaseDynamoTest):
@@ -29,6 +34,65 @@ class DbTest(BaseDynamoTest):
         with self.assertRaises(database.DynamoSchemaException):
             store.update_data(**{'ctiy': 'test'})
 
+    def test_table_instance(self):
+        table = StoreTable.instance()
+        self.assertIs(table, StoreTable.instance())
+        self.assertIsInstance(CustomerTable.instance(), CustomerTable)
+        table.save(Store(store_id='S1'))
+        self.assertEqual('S1', StoreTable.instance().get('S1').store_id)
+        # instances are reset when the table is deleted
+        self.db.delete_table('store')
+        self.assertIsNot(table, StoreTable.instance())
+
+
+class LazyConnectTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(LazyConnectTest, self).setUp()
+        self.db.disconnect()
+        self.db.connect(
+            lazy=True, region_name='localhost',
+            table_prefix=self.db.table_prefix)
+
+    def tearDown(self):
+        self.db.disconnect()
+
+    def test_lazy_table(self):
+        self.assertIsNone(database.DynamoDatabase.tables)
+        table = StoreTable()
+        self.assertIsNone(database.DynamoDatabase.tables)
+        # the table is checked and created on the first use
+        table.save(Store(store_id='S1'))
+        self.assertTrue(self.db.exists('store'))
+        self.assertEqual('S1', StoreTable().get('S1').store_id)
+
+    def test_assume_exists(self):
+        CustomerTable().table
+        database.DynamoDatabase.tables = None
+        table = ExistingCustomerTable()
+        table.save(Customer(customer_id='C1', age=1))
+        self.assertIsNone(database.DynamoDatabase.tables)
+        self.assertEqual(1, table.get('C1', 1).age)
+
+    def test_set_table(self):
+        self.db.create_table(
+            'store_copy', schema=[HashKey('store_id')],
+            throughput={'read': 1, 'write': 1})
+        table = StoreTable()
+        table.table = self.db.get_table('store_copy')
+        table.save(Store(store_id='S1'))
+        # the assigned table is used, the store table is not created
+        self.assertFalse(self.db.exists('store'))
+        self.assertEqual(
+            'S1', self.db.get_table('store_copy').get_item(
+                store_id='S1')['store_id'])
+
+    def test_reset_instances(self):
+        table = StoreTable.instance()
+        self.db.disconnect()
+        self.db.connect(region_name='localhost')
+        self.assertIsNot(table, StoreTable.instance())
+
 
 if __name__ == "__main__":
     unittest.main()
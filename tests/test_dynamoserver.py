@@ -0,0 +1,215 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from boto.compat import http_client
+from .base import DYNAMODB_MOCK
+
+if DYNAMODB_MOCK:
+    # the server imports dynamock, only use it in the mock mode
+    from dynamo_objects.dynamoserver import DynamoServer
+
+
+@unittest.skipUnless(DYNAMODB_MOCK, 'dynamock is required for the server')
+class DynamoServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = DynamoServer(port=0).start()
+        self.http = http_client.HTTPConnection('localhost', self.server.port)
+        self.request('CreateTable', {
+            'TableName': 'customer',
+            'AttributeDefinitions': [
+                {'AttributeName': 'customer_id', 'AttributeType': 'S'},
+                {'AttributeName': 'age', 'AttributeType': 'N'}
+            ],
+            'KeySchema': [
+                {'AttributeName': 'customer_id', 'KeyType': 'HASH'},
+                {'AttributeName': 'age', 'KeyType': 'RANGE'}
+            ],
+            'ProvisionedThroughput': {
+                'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5
+            }
+        })
+
+    def tearDown(self):
+        self.http.close()
+        self.server.stop()
+
+    def request(self, operation, data, status=200):
+        self.http.request('POST', '/', json.dumps(data), {
+            'X-Amz-Target': 'DynamoDB_20120810.%s' % operation,
+            'Content-Type': 'application/x-amz-json-1.0'
+        })
+        response = self.http.getresponse()
+        result = json.loads(response.read().decode('utf-8'))
+        self.assertEqual(status, response.status, result)
+        return result
+
+    def put(self, customer_id, age, **data):
+        item = {'customer_id': {'S': customer_id}, 'age': {'N': str(age)}}
+        for key, value in data.items():
+            item[key] = {'S': value}
+        self.request('PutItem', {'TableName': 'customer', 'Item': item})
+
+    def test_tables(self):
+        self.assertEqual(
+            {'TableNames': ['customer']}, self.request('ListTables', {}))
+        table = self.request(
+            'DescribeTable', {'TableName': 'customer'})['Table']
+        self.assertEqual('ACTIVE', table['TableStatus'])
+        self.assertEqual(
+            [{'AttributeName': 'customer_id', 'KeyType': 'HASH'},
+             {'AttributeName': 'age', 'KeyType': 'RANGE'}],
+            table['KeySchema'])
+        self.request('DeleteTable', {'TableName': 'customer'})
+        self.assertEqual(
+            {'TableNames': []}, self.request('ListTables', {}))
+
+    def test_get_put_item(self):
+        self.put('C1', 20, first_name='Bob')
+        result = self.request('GetItem', {
+            'TableName': 'customer',
+            'Key': {'customer_id': {'S': 'C1'}, 'age': {'N': '20'}}
+        })
+        self.assertEqual({'S': 'Bob'}, result['Item']['first_name'])
+        result = self.request('GetItem', {
+            'TableName': 'customer',
+            'Key': {'customer_id': {'S': 'C1'}, 'age': {'N': '21'}}
+        })
+        self.assertEqual({}, result)
+
+    def test_update_item(self):
+        self.put('C1', 20)
+        result = self.request('UpdateItem', {
+            'TableName': 'customer',
+            'Key': {'customer_id': {'S': 'C1'}, 'age': {'N': '20'}},
+            'AttributeUpdates': {
+                'visits': {'Action': 'ADD', 'Value': {'N': '2'}}
+            },
+            'ReturnValues': 'UPDATED_NEW'
+        })
+        self.assertEqual({'visits': {'N': '2'}}, result['Attributes'])
+
+    def test_query_pages(self):
+        for age in (30, 10, 20):
+            self.put('C1', age)
+        self.put('C2', 40)
+        params = {
+            'TableName': 'customer',
+            'KeyConditions': {
+                'customer_id': {
+                    'ComparisonOperator': 'EQ',
+                    'AttributeValueList': [{'S': 'C1'}]
+                }
+            },
+            'Limit': 2
+        }
+        result = self.request('Query', params)
+        self.assertEqual(
+            ['10', '20'], [item['age']['N'] for item in result['Items']])
+        params['ExclusiveStartKey'] = result['LastEvaluatedKey']
+        result = self.request('Query', params)
+        self.assertEqual(
+            ['30'], [item['age']['N'] for item in result['Items']])
+        self.assertNotIn('LastEvaluatedKey', result)
+
+    def test_batch_write_get(self):
+        self.request('BatchWriteItem', {'RequestItems': {'customer': [
+            {'PutRequest': {'Item': {
+                'customer_id': {'S': 'C%s' % num}, 'age': {'N': '1'}}}}
+            for num in range(3)
+        ]}})
+        result = self.request('BatchGetItem', {'RequestItems': {'customer': {
+            'Keys': [
+                {'customer_id': {'S': 'C1'}, 'age': {'N': '1'}},
+                {'customer_id': {'S': 'C5'}, 'age': {'N': '1'}}
+            ]
+        }}})
+        self.assertEqual(1, len(result['Responses']['customer']))
+        self.assertEqual(3, self.request(
+            'Scan', {'TableName': 'customer', 'Select': 'COUNT'})['Count'])
+
+    def test_errors(self):
+        result = self.request(
+            'DescribeTable', {'TableName': 'missing'}, status=400)
+        self.assertTrue(
+            result['__type'].endswith('#ResourceNotFoundException'))
+        result = self.request('PutItem', {
+            'TableName': 'customer',
+            'Item': {'customer_id': {'S': 'C1'}, 'age': {'N': '1'}},
+            'Expected': {'customer_id': {'Exists': False}}
+        })
+        result = self.request('PutItem', {
+            'TableName': 'customer',
+            'Item': {'customer_id': {'S': 'C1'}, 'age': {'N': '1'}},
+            'Expected': {'customer_id': {'Exists': False}}
+        }, status=400)
+        self.assertTrue(
+            result['__type'].endswith('#ConditionalCheckFailedException'))
+        # the mock raises the plain exception for the unknown operator
+        result = self.request('Scan', {
+            'TableName': 'customer',
+            'ScanFilter': {'customer_id': {
+                'ComparisonOperator': 'UNKNOWN',
+                'AttributeValueList': [{'S': 'C1'}]
+            }}
+        }, status=400)
+        self.assertTrue(result['__type'].endswith('#ValidationException'))
+
+
+# the client runs in the separate process with real (not mocked) boto
+CLIENT = """
+import json, sys, time
+from boto.dynamodb2.layer1 import DynamoDBConnection
+connection = DynamoDBConnection(
+    host='localhost', port=int(sys.argv[1]), is_secure=False,
+    aws_access_key_id='local', aws_secret_access_key='success')
+connection.create_table(
+    [{'AttributeName': 'id', 'AttributeType': 'S'}], 'item',
+    [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+    {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5})
+connection.put_item('item', {'id': {'S': 'A'}, 'name': {'S': 'Name'}})
+start = time.time()
+for __ in range(100):
+    item = connection.get_item('item', {'id': {'S': 'A'}})['Item']
+elapsed = time.time() - start
+print(json.dumps({
+    'tables': connection.list_tables()['TableNames'],
+    'item': item, 'elapsed': elapsed}))
+"""
+
+
+class DynamoServerProcessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = os.path.dirname(os.path.dirname(os.path.abspath(
+            __file__)))
+        self.server = subprocess.Popen(
+            [sys.executable, '-u', '-m', 'dynamo_objects.dynamoserver',
+             '--port', '0'],
+            cwd=self.root, stdout=subprocess.PIPE)
+        # Serving DynamoDB API on localhost:<port>
+        line = self.server.stdout.readline().decode('utf-8')
+        self.port = line.strip().split(':')[-1]
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.wait()
+        self.server.stdout.close()
+
+    def test_boto_client(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c', CLIENT, self.port], cwd=self.root)
+        result = json.loads(output.decode('utf-8'))
+        self.assertEqual(['item'], result['tables'])
+        self.assertEqual(
+            {'id': {'S': 'A'}, 'name': {'S': 'Name'}}, result['item'])
+        # requests on the keep-alive connection are not delayed
+        # (it is about 4 seconds with the Nagle's algorithm)
+        self.assertLess(result['elapsed'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+import unittest
+
+from boto.dynamodb2 import exceptions
+from .base import DYNAMODB_MOCK
+
+if DYNAMODB_MOCK:
+    from dynamo_objects import dynamock
+    from dynamo_objects import expressions
+
+
+@unittest.skipUnless(DYNAMODB_MOCK, 'dynamock expressions test')
+class UpdateExpressionTest(unittest.TestCase):
+
+    def update(self, item, expression, names=None, **values):
+        values = dict((':' + key, value) for key, value in values.items())
+        update = expressions.compile_update(expression)
+        return update.apply(item, names, values)
+
+    def test_set_multiple(self):
+        item = {'a': 1, 'b': 2}
+        updated = self.update(
+            item, 'SET a = a + :inc, b = a - :inc, #c = :c',
+            names={'#c': 'c'}, inc=1, c='x')
+        # values are evaluated against the original item
+        self.assertEqual({'a': 2, 'b': 0, 'c': 'x'}, item)
+        self.assertEqual(set(['a', 'b', 'c']), updated)
+
+    def test_clauses(self):
+        item = {'n': 1, 'tags': set(['x', 'y']), 'old': 1, 'keep': 1}
+        self.update(
+            item, 'ADD n :one, tags :new, cnt :one REMOVE old '
+            'DELETE tags :del', one=1, new=set(['z']), **{'del': set(['x'])})
+        self.assertEqual(
+            {'n': 2, 'cnt': 1, 'tags': set(['y', 'z']), 'keep': 1}, item)
+
+    def test_functions(self):
+        item = {'log': [1]}
+        self.update(
+            item, 'SET log = list_append(log, :log), '
+            'cnt = if_not_exists(cnt, :zero) + :one, '
+            'keep = if_not_exists(log, :log)',
+            log=[2], zero=0, one=1)
+        self.assertEqual({'log': [1, 2], 'cnt': 1, 'keep': [1]}, item)
+
+    def test_nested(self):
+        item = {'a': {'b': [{'c': 1}, {'c': 2}]}}
+        self.update(item, 'SET a.b[1].c = :v REMOVE a.b[0]', v=3)
+        self.assertEqual({'a': {'b': [{'c': 3}]}}, item)
+
+    def test_errors(self):
+        with self.assertRaises(expressions.ExpressionError):
+            self.update({}, 'SET a = a + :v', v=1)
+        with self.assertRaises(expressions.ExpressionError):
+            self.update({}, 'SET a = :missing')
+        with self.assertRaises(expressions.ExpressionError):
+            self.update({}, 'SET a = ')
+
+    def test_cache(self):
+        expression = 'SET cached = :v'
+        self.assertIs(
+            expressions.compile_update(expression),
+            expressions.compile_update(expression))
+
+
+@unittest.skipUnless(DYNAMODB_MOCK, 'dynamock expressions test')
+class ConditionExpressionTest(unittest.TestCase):
+
+    def check(self, item, expression, names=None, **values):
+        values = dict((':' + key, value) for key, value in values.items())
+        condition = expressions.compile_condition(expression)
+        return condition.evaluate(item, names, values)
+
+    def test_conditions(self):
+        item = {'v': 3, 'name': 'abc', 'tags': set(['x'])}
+        self.assertTrue(self.check(item, 'v = :v AND #n <> :n',
+                                   names={'#n': 'name'}, v=3, n='x'))
+        self.assertTrue(self.check(item, 'v BETWEEN :a AND :b', a=1, b=3))
+        self.assertTrue(self.check(item, 'v IN (:a, :b)', a=1, b=3))
+        self.assertTrue(self.check(
+            item, 'attribute_not_exists(missing) OR v > :v', v=5))
+        self.assertFalse(self.check(
+            item, 'NOT (attribute_exists(v) AND begins_with(name, :p))',
+            p='ab'))
+        self.assertTrue(self.check(
+            item, 'contains(tags, :t) AND size(name) = :s', t='x', s=3))
+        self.assertTrue(self.check(item, 'attribute_type(tags, :t)', t='SS'))
+        self.assertFalse(self.check(item, 'v < :s', s='string'))
+
+    def test_equality_values(self):
+        condition = expressions.compile_condition(
+            '#id = :id AND age > :age')
+        self.assertEqual(
+            {'customer_id': 'C1'},
+            condition.equality_values({'#id': 'customer_id'},
+                                      {':id': 'C1', ':age': 1}))
+
+
+@unittest.skipUnless(DYNAMODB_MOCK, 'dynamock expressions test')
+class ConnectionExpressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = dynamock.Connection()
+        self.conn.create_table(
+            [{'AttributeName': 'id', 'AttributeType': 'S'},
+             {'AttributeName': 'num', 'AttributeType': 'N'}],
+            'item',
+            [{'AttributeName': 'id', 'KeyType': 'HASH'},
+             {'AttributeName': 'num', 'KeyType': 'RANGE'}],
+            {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1})
+        for num in range(5):
+            self.conn.put_item('item', {
+                'id': {'S': 'A'}, 'num': {'N': str(num)},
+                'even': {'BOOL': num % 2 == 0}})
+
+    def test_update_item(self):
+        key = {'id': {'S': 'B'}, 'num': {'N': '1'}}
+        result = self.conn.update_item(
+            'item', key,
+            update_expression='SET cnt = if_not_exists(cnt, :zero) + :inc '
+                              'ADD tags :tags',
+            expression_attribute_values={
+                ':zero': {'N': '0'}, ':inc': {'N': '2'},
+                ':tags': {'SS': ['x']}},
+            return_values='UPDATED_NEW')
+        self.assertEqual(
+            {'cnt': {'N': '2'}, 'tags': {'SS': ['x']}}, result['Attributes'])
+
+    def test_update_key_error(self):
+        with self.assertRaises(exceptions.ValidationException):
+            self.conn.update_item(
+                'item', {'id': {'S': 'A'}, 'num': {'N': '1'}},
+                update_expression='SET num = :num',
+                expression_attribute_values={':num': {'N': '2'}})
+
+    def test_failed_nested_update(self):
+        key = {'id': {'S': 'A'}, 'num': {'N': '1'}}
+        self.conn.update_item(
+            'item', key, update_expression='SET meta = :meta',
+            expression_attribute_values={
+                ':meta': {'M': {'a': {'N': '1'}}}})
+        with self.assertRaises(exceptions.ValidationException):
+            self.conn.update_item(
+                'item', key,
+                update_expression='SET meta.a = :two, num = :two',
+                expression_attribute_values={':two': {'N': '2'}})
+        # the failed update did not change the stored item
+        item = self.conn.get_item('item', key)['Item']
+        self.assertEqual({'M': {'a': {'N': '1'}}}, item['meta'])
+
+    def test_copied_values(self):
+        key = {'id': {'S': 'A'}, 'num': {'N': '1'}}
+        self.conn.update_item(
+            'item', key, update_expression='SET meta = :meta',
+            expression_attribute_values={
+                ':meta': {'M': {'a': {'L': [{'N': '1'}]}}}})
+        self.conn.update_item(
+            'item', key, update_expression='SET other = meta')
+        result = self.conn.update_item(
+            'item', key, update_expression='SET other.a[0] = :two',
+            expression_attribute_values={':two': {'N': '2'}},
+            return_values='ALL_OLD')
+        # the copied value is not shared with the source attribute and
+        # the old image is not changed by the update
+        self.assertEqual(
+            {'M': {'a': {'L': [{'N': '1'}]}}}, result['Attributes']['other'])
+        item = self.conn.get_item('item', key)['Item']
+        self.assertEqual({'M': {'a': {'L': [{'N': '1'}]}}}, item['meta'])
+        self.assertEqual({'M': {'a': {'L': [{'N': '2'}]}}}, item['other'])
+
+    def test_condition_expression(self):
+        item = {'id': {'S': 'A'}, 'num': {'N': '1'}}
+        with self.assertRaises(exceptions.ConditionalCheckFailedException):
+            self.conn.put_item(
+                'item', item,
+                condition_expression='attribute_not_exists(id)')
+        self.conn.put_item(
+            'item', item, condition_expression='even = :even',
+            expression_attribute_values={':even': {'BOOL': False}})
+
+    def test_query_expressions(self):
+        result = self.conn.query(
+            'item', key_condition_expression='id = :id AND num >= :num',
+            filter_expression='even = :even',
+            expression_attribute_values={
+                ':id': {'S': 'A'}, ':num': {'N': '1'},
+                ':even': {'BOOL': True}})
+        self.assertEqual(
+            ['2', '4'], [item['num']['N'] for item in result['Items']])
+        result = self.conn.scan(
+            'item', filter_expression='NOT even = :even',
+            expression_attribute_values={':even': {'BOOL': True}})
+        self.assertEqual(2, result['Count'])
+
+
+if __name__ == "__main__":
+    unittest.main()
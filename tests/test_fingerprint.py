@@ -0,0 +1,86 @@
+import unittest
+from decimal import Decimal
+from dynamo_objects import VersionConflictException
+from dynamo_objects.fingerprint import Fingerprint, value_digest
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable
+from .test_versioning import Account, AccountTable
+
+
+class CustomerFingerprintTable(CustomerTable):
+    keep_items = False
+
+
+class AccountFingerprintTable(AccountTable):
+    keep_items = False
+
+
+class FingerprintTest(BaseDynamoTest):
+
+    def test_digest(self):
+        self.assertEqual(value_digest(20), value_digest(Decimal('20')))
+        self.assertEqual(
+            value_digest(set(['a', 'b', 'c'])),
+            value_digest(set(['c', 'b', 'a'])))
+        self.assertNotEqual(value_digest(-1), value_digest(-2))
+        self.assertNotEqual(value_digest('1'), value_digest(1))
+        fingerprint = Fingerprint(
+            {'id': 'X', 'age': Decimal(5), 'tags': ['a']}, ['id', 'code'])
+        self.assertEqual(
+            {'id': 'X', 'code': None}, fingerprint.get_keys(['id', 'code']))
+        self.assertEqual([], fingerprint.changes(
+            {'id': 'X', 'age': 5, 'tags': ['a']}))
+        self.assertEqual(
+            ['age', 'name', 'tags'], sorted(fingerprint.changes(
+                {'id': 'X', 'age': 6, 'name': 'N'})))
+        # names are shared
+        other = Fingerprint({'id': 'Y', 'age': 1, 'tags': []}, ['id'])
+        self.assertIs(fingerprint.names, other.names)
+
+    def test_save(self):
+        table = CustomerFingerprintTable()
+        table.save(Customer(customer_id='C1', age=20, first_name='F'))
+        first = table.get('C1', 20)
+        self.assertIsNone(first._item)
+        self.assertIsNotNone(first._fingerprint)
+        second = table.get('C1', 20)
+        # only changed attributes are updated, so changes of different
+        # attributes made to different copies are kept
+        first.first_name = 'First'
+        table.save(first)
+        second.last_name = 'Last'
+        second.email = 'e@example.com'
+        table.save(second)
+        customer = table.get('C1', 20)
+        self.assertEqual('First', customer.first_name)
+        self.assertEqual('Last', customer.last_name)
+        # the record can be saved again, empty values are removed
+        second.email = ''
+        table.save(second)
+        self.assertEqual('', table.get('C1', 20).email)
+        # the changed key makes the new item
+        second.age = 21
+        table.save(second)
+        self.assertEqual('Last', table.get('C1', 21).last_name)
+        self.assertEqual(2, table.query_count(customer_id__eq='C1'))
+
+    def test_versioned(self):
+        table = AccountFingerprintTable()
+        table.save(Account(account_id='A1', balance=10))
+        first = table.get('A1')
+        second = table.get('A1')
+        first.balance = 20
+        table.save(first)
+        self.assertEqual(2, first.version)
+        first.balance = 30
+        table.save(first)
+        second.balance = 40
+        with self.assertRaises(VersionConflictException):
+            table.save(second)
+        account = table.get('A1')
+        self.assertEqual(30, account.balance)
+        self.assertEqual(3, account.version)
+
+
+if __name__ == "__main__":
+    unittest.main()
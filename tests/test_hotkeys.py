@@ -0,0 +1,88 @@
+import unittest
+from dynamo_objects.hotkeys import KeySampler, SpaceSaving
+from dynamo_objects.memorydb import MemoryTable
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable, Store, StoreTable
+
+
+class SpaceSavingTest(unittest.TestCase):
+
+    def test_top(self):
+        sketch = SpaceSaving(capacity=3)
+        for key in 'aaaaabbbcd':
+            sketch.add(key)
+        self.assertEqual(3, len(sketch))
+        self.assertEqual([('a', 5, 0), ('b', 3, 0)], sketch.top(2))
+        # 'd' replaced 'c' and inherited its count as error
+        self.assertEqual(('d', 2, 1), sketch.top(3)[2])
+        self.assertEqual(10, sketch.total)
+
+    def test_evictions(self):
+        sketch = SpaceSaving(capacity=5)
+        keys = []
+        for num in range(200):
+            keys.append('hot' if num % 3 else 'k%s' % (num % 17))
+        for key in keys:
+            sketch.add(key)
+        self.assertEqual(5, len(sketch))
+        key, count, error = sketch.top(1)[0]
+        self.assertEqual('hot', key)
+        self.assertTrue(count - error <= keys.count('hot') <= count)
+        # the sum of counts is the total
+        self.assertEqual(200, sum(count for __, count, __ in sketch.top(5)))
+        # mixed key types, equal counts
+        sketch = SpaceSaving(capacity=2)
+        for key in ['a', 1, None, ('t', 1)]:
+            sketch.add(key)
+        self.assertEqual(2, len(sketch))
+
+
+class KeySamplerTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(KeySamplerTest, self).setUp()
+        self.sampler = KeySampler(capacity=10)
+        CustomerTable.key_sampler = self.sampler
+        StoreTable.key_sampler = self.sampler
+
+    def tearDown(self):
+        CustomerTable.key_sampler = None
+        StoreTable.key_sampler = None
+
+    def test_table(self):
+        table = CustomerTable()
+        for num in range(5):
+            table.save(Customer(customer_id='C1', age=num))
+        table.save(Customer(customer_id='C2', age=1))
+        table.get('C1', 1)
+        list(table.query(customer_id__eq='C1'))
+        table.update_counter('C2', 1, thanks_count=1)
+        self.assertEqual(
+            [('C1', 5, 0), ('C2', 2, 0)],
+            self.sampler.top('customer', metric='writes'))
+        self.assertEqual(
+            [('C1', 2, 0)], self.sampler.top('customer', metric='reads'))
+        self.assertEqual('C1', self.sampler.top('customer')[0][0])
+
+    def test_index(self):
+        table = StoreTable()
+        table.save(Store(store_id='S1', company_id='MYC'))
+        list(table.query(company_id__eq='MYC', index='StoreCompanyIndex'))
+        dump = self.sampler.dump()
+        self.assertEqual(
+            [('MYC', 1, 0)],
+            dump['store']['StoreCompanyIndex']['reads'])
+        self.assertEqual([('S1', 1, 0)], dump['store']['table']['writes'])
+
+    def test_memory_table(self):
+        memory = MemoryTable(CustomerTable())
+        memory.set_load_from_db(False)
+        for num in range(3):
+            memory.get('C1', num, create=True)
+        memory.save_data_batch()
+        self.assertEqual(
+            [('C1', 3, 0)], self.sampler.top('customer', metric='writes'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from decimal import Decimal
+from dynamo_objects.columnar import ColumnarData
+from dynamo_objects.database import DynamoException, ItemNotFound
+from dynamo_objects.memorydb import MemoryTable
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable
+from .test_versioning import AccountTable
+
+
+class MemoryTableTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(MemoryTableTest, self).setUp()
+        self.table = CustomerTable()
+        self.table.save(Customer(customer_id='C1', age=20))
+        self.memory = MemoryTable(self.table)
+
+    def test_get(self):
+        customer = self.memory.get('C1', 20)
+        self.assertIs(customer, self.memory.get('C1', 20))
+        self.assertEqual(1, self.memory.db_reads)
+        self.assertEqual(1, self.memory.hits)
+
+    def test_not_found(self):
+        for __ in range(2):
+            with self.assertRaises(ItemNotFound):
+                self.memory.get('C2', 20)
+        self.assertEqual(1, self.memory.db_reads)
+
+
+class ColumnarMemoryTableTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(ColumnarMemoryTableTest, self).setUp()
+        self.table = CustomerTable()
+        self.table.save(Customer(
+            customer_id='C1', age=20, first_name='Bob', updated=1.5))
+        self.memory = MemoryTable(self.table, columnar=True)
+
+    def test_get(self):
+        customer = self.memory.get('C1', 20)
+        self.assertIsInstance(customer, Customer)
+        self.assertEqual('Bob', customer.first_name)
+        # integral Decimal loaded by boto is stored as int
+        self.assertEqual(20, customer.age)
+        self.assertIs(int, type(customer.age))
+        self.assertEqual(1.5, customer.updated)
+        self.assertEqual(customer.get_dict(), self.memory.get(
+            'C1', 20).get_dict())
+        self.assertEqual(1, self.memory.db_reads)
+        with self.assertRaises(ItemNotFound):
+            self.memory.get('C2', 20)
+
+    def test_save_data(self):
+        customer = self.memory.get('C1', 20)
+        customer.first_name = 'Changed'
+        self.assertEqual('Changed', self.memory.get('C1', 20).first_name)
+        self.memory.save(Customer(customer_id='C2', age=30, last_name='L'))
+        self.memory.save_data_batch()
+        self.assertEqual('Changed', self.table.get('C1', 20).first_name)
+        self.assertEqual('L', self.table.get('C2', 30).last_name)
+        customer.first_name = 'Again'
+        self.memory.save_data()
+        self.assertEqual('Again', self.table.get('C1', 20).first_name)
+        # the view is saved over the existing item
+        customer.first_name = 'Table'
+        self.table.save(customer)
+        self.assertEqual('Table', self.table.get('C1', 20).first_name)
+
+    def test_private_attributes(self):
+        customer = self.memory.get('C1', 20)
+        self.assertIsNone(customer._ts)
+        customer._ts = 1
+        self.assertEqual(1, customer._ts)
+        self.assertIsNone(self.memory.get('C1', 20)._ts)
+        with self.assertRaises(AttributeError):
+            customer._missing
+        with self.assertRaises(DynamoException):
+            MemoryTable(AccountTable(), columnar=True)
+
+    def test_rows(self):
+        data = ColumnarData(Customer)
+        data['a'] = Customer(customer_id='a', age=Decimal('1.5'))
+        data['b'] = Customer(customer_id='b', age=2 ** 70, email=None)
+        self.assertEqual(Decimal('1.5'), data['a'].age)
+        self.assertEqual(2 ** 70, data['b'].age)
+        self.assertIsNone(data['b'].email)
+        del data['a']
+        data['c'] = 'missing'
+        data['d'] = Customer(customer_id='d', tags=set(['x']))
+        self.assertEqual(set(['b', 'c', 'd']), set(data.keys()))
+        # the row of the deleted record is reused
+        self.assertEqual(2, len(data.rows))
+        self.assertEqual(0, data.rows['d'])
+        self.assertEqual('missing', data['c'])
+        self.assertEqual(set(['x']), data['d'].tags)
+        self.assertEqual('', data['d'].email)
+        self.assertFalse(hasattr(data['b'], 'tags'))
+
+
+if __name__ == "__main__":
+    unittest.main()
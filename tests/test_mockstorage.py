@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from boto.dynamodb2.fields import HashKey, RangeKey, GlobalAllIndex
+from boto.dynamodb2.types import NUMBER
+from .base import DYNAMODB_MOCK
+
+if DYNAMODB_MOCK:
+    from dynamo_objects import dynamock
+    from dynamo_objects.mockstorage import MemoryStorage, SqliteStorage
+
+
+def create_visits(conn):
+    table = dynamock.Table.create(
+        'visit',
+        schema=[HashKey('customer'), RangeKey('day', data_type=NUMBER)],
+        throughput={'read': 1, 'write': 1},
+        connection=conn,
+        global_indexes=[
+            GlobalAllIndex('StoreIndex', parts=[
+                HashKey('store'), RangeKey('day', data_type=NUMBER)])
+        ])
+    for day in range(5):
+        for customer in ('C1', 'C2'):
+            table._set_data({
+                'customer': customer, 'day': day,
+                'store': 'S%s' % (day % 2)})
+    return table
+
+
+@unittest.skipUnless(DYNAMODB_MOCK, 'dynamock storage test')
+class SqliteStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'mock.db')
+        self.storage = SqliteStorage(self.path)
+        self.conn = dynamock.Connection(storage=self.storage)
+        self.table = create_visits(self.conn)
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_delete(self):
+        item = self.table.get_item(customer='C1', day=3)
+        self.assertEqual('S1', item['store'])
+        item.delete()
+        with self.assertRaises(dynamock.ItemNotFound):
+            self.table.get_item(customer='C1', day=3)
+        self.assertEqual(9, self.table.count_items())
+
+    def test_query(self):
+        days = [
+            item['day'] for item in
+            self.table.query_2(customer__eq='C2', day__gte=2, reverse=True)]
+        self.assertEqual([4, 3, 2], days)
+        items = list(self.table.query_2(store__eq='S1', index='StoreIndex'))
+        self.assertEqual(
+            [1, 1, 3, 3], [item['day'] for item in items])
+
+    def test_scan_pages(self):
+        results = self.table.scan(max_page_size=3)
+        keys = [(item['customer'], item['day']) for item in results]
+        self.assertEqual(10, len(set(keys)))
+        self.assertEqual(4, results._fetches)
+
+    def test_persistence(self):
+        self.storage.commit()
+        storage = SqliteStorage(self.path)
+        conn = dynamock.Connection(storage=storage)
+        self.assertEqual({'TableNames': ['visit']}, conn.list_tables())
+        table = dynamock.Table('visit', conn)
+        self.assertEqual(10, table.count_items())
+        self.assertEqual(2, len(list(
+            table.query_2(store__eq='S0', index='StoreIndex', day__eq=2))))
+        storage.close()
+
+
+@unittest.skipUnless(DYNAMODB_MOCK, 'dynamock storage test')
+class DeletedStartKeyTest(unittest.TestCase):
+    """Pages continue after the start key deleted between requests."""
+
+    def create_storage(self):
+        return MemoryStorage()
+
+    def setUp(self):
+        self.conn = dynamock.Connection(storage=self.create_storage())
+        create_visits(self.conn)
+
+    def read_pages(self, method, limit, **kwargs):
+        """Read pages, delete the last item of the first page."""
+        result = method('visit', limit=limit, **kwargs)
+        items = result['Items']
+        last_key = result['LastEvaluatedKey']
+        self.conn.delete_item('visit', dict(
+            (name, last_key[name]) for name in ('customer', 'day')))
+        while last_key:
+            result = method(
+                'visit', limit=limit, exclusive_start_key=last_key, **kwargs)
+            items.extend(result['Items'])
+            last_key = result.get('LastEvaluatedKey')
+        return [(item['customer']['S'], int(item['day']['N']))
+                for item in items]
+
+    def test_scan(self):
+        keys = self.read_pages(self.conn.scan, 3)
+        self.assertEqual(10, len(keys))
+        self.assertEqual(10, len(set(keys)))
+
+    def test_query(self):
+        keys = self.read_pages(self.conn.query, 2, key_conditions={
+            'customer': {
+                'AttributeValueList': [{'S': 'C1'}],
+                'ComparisonOperator': 'EQ'}})
+        self.assertEqual([('C1', day) for day in range(5)], keys)
+
+    def test_query_index(self):
+        keys = self.read_pages(
+            self.conn.query, 2, index_name='StoreIndex',
+            scan_index_forward=False, key_conditions={
+                'store': {
+                    'AttributeValueList': [{'S': 'S0'}],
+                    'ComparisonOperator': 'EQ'}})
+        self.assertEqual(
+            [4, 4, 2, 2, 0, 0], [day for __, day in keys])
+        self.assertEqual(6, len(set(keys)))
+
+
+class SqliteDeletedStartKeyTest(DeletedStartKeyTest):
+
+    def create_storage(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.storage = SqliteStorage(os.path.join(self.tmp_dir, 'mock.db'))
+        return self.storage
+
+    def tearDown(self):
+        self.storage.close()
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
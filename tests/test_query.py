@@ -1,7 +1,7 @@
 import unittest
 from dynamo_objects import database
 from .base import BaseDynamoTest
-from .schema import Store, StoreTable
+from .schema import Customer, CustomerTable, Store, StoreTable
 
 
 class QueryTest(BaseDynamoTest):
@@ -50,6 +50,115 @@ class QueryTest(BaseDynamoTest):
         self.assertEquals(1, self.table.query_count(
             company_id__eq='YRC', index='StoreCompanyIndex'))
 
+    def test_scan_raw(self):
+        data = list(self.table.scan_raw(city__eq='C1'))
+        self.assertEquals(2, len(data))
+        for store in data:
+            self.assertIs(dict, type(store))
+            self.assertEquals(self.expected[store['store_id']]['city'],
+                              store['city'])
+            # only stored attributes, empty values are not stored
+            self.assertNotIn('country', store)
+
+    def test_query_raw(self):
+        data = list(self.table.query_raw(
+            company_id__eq='MYC', index='StoreCompanyIndex'))
+        self.assertEquals(
+            ['STORE1', 'STORE2'], [store['store_id'] for store in data])
+
+    def test_columns(self):
+        table = CustomerTable()
+        for age in range(5):
+            customer = Customer(customer_id='C1', age=age)
+            if age % 2:
+                customer.last_name = 'L%s' % age
+            table.save(customer)
+        batches = list(table.query_columns(
+            batch_size=3, customer_id__eq='C1'))
+        self.assertEquals(2, len(batches))
+        self.assertEquals([0, 1, 2], list(batches[0]['age']))
+        self.assertEquals([None, 'L1', None], batches[0]['last_name'])
+        batches = list(table.scan_columns(attributes=['age']))
+        self.assertEquals(['age'], list(batches[0].keys()))
+        self.assertEquals(10, sum(batches[0]['age']))
+
+    def test_prefetch(self):
+        table = CustomerTable()
+        for age in range(7):
+            table.save(Customer(customer_id='C1', age=age))
+        ages = [customer.age for customer in table.query(
+            prefetch=2, max_page_size=2, customer_id__eq='C1')]
+        self.assertEquals(list(range(7)), ages)
+        data = list(table.scan_raw(prefetch=1, max_page_size=3))
+        self.assertEquals(7, len(data))
+        # the limit is applied to items, the last page is trimmed
+        ages = [customer.age for customer in table.query(
+            limit=5, prefetch=2, max_page_size=2, customer_id__eq='C1')]
+        self.assertEquals(list(range(5)), ages)
+        data = list(table.query_raw(
+            limit=3, prefetch=1, max_page_size=2, customer_id__eq='C1'))
+        self.assertEquals(3, len(data))
+        data = list(table.scan_raw(limit=4, prefetch=1, max_page_size=3))
+        self.assertEquals(4, len(data))
+        # stop the iteration before all pages are read
+        records = table.scan(prefetch=1, max_page_size=1)
+        self.assertEquals('C1', next(records).customer_id)
+        records.close()
+
+    def test_pages(self):
+        table = CustomerTable()
+        for age in range(5):
+            table.save(Customer(customer_id='C1', age=age))
+        pages = []
+        cursor = None
+        while True:
+            records, cursor = table.query_page(
+                2, cursor, customer_id__eq='C1', age__gte=1)
+            pages.append([customer.age for customer in records])
+            if cursor is None:
+                break
+        self.assertEquals([[1, 2], [3, 4]], pages[:2])
+        records, cursor = table.scan_page(10)
+        self.assertEquals(5, len(records))
+        with self.assertRaises(database.DynamoException):
+            table.query_page(2, 'invalid', customer_id__eq='C1')
+
+    def test_query_many(self):
+        table = CustomerTable()
+        for num, customer_id in enumerate(['C1', 'C2', 'C3']):
+            for age in range(num, 12, 3):
+                table.save(Customer(customer_id=customer_id, age=age))
+        grouped = table.query_many(['C1', 'C2', 'X'], age__gte=3)
+        self.assertEquals([3, 6, 9], [c.age for c in grouped['C1']])
+        self.assertEquals([4, 7, 10], [c.age for c in grouped['C2']])
+        self.assertEquals([], grouped['X'])
+        records = table.query_many(
+            ['C1', 'C2', 'C3'], merge=True, workers=2, max_page_size=1)
+        self.assertEquals(list(range(12)), [c.age for c in records])
+        records = table.query_many(
+            ['C1', 'C3'], merge=True, limit=4, reverse=True, age__lt=9)
+        self.assertEquals([8, 6, 5, 3], [c.age for c in records])
+        # stop before the end, outstanding pages are not read
+        records = table.query_many(
+            ['C1', 'C2'], merge=True, max_page_size=1)
+        self.assertEquals(0, next(records).age)
+        records.close()
+        stores = StoreTable().query_many(
+            ['MYC', 'YRC'], merge=True, index='StoreCompanyIndex')
+        self.assertEquals(
+            ['STORE1', 'STORE2', 'STORE3'], [s.store_id for s in stores])
+        with self.assertRaises(database.DynamoException):
+            list(StoreTable().query_many(['STORE1'], merge=True))
+
+    def test_column_values(self):
+        self.assertEquals(
+            ['a', None], database.column_values(['a', None]))
+        if database.get_numpy() is not None:
+            values = database.column_values([1, 2])
+            self.assertEquals('int64', values.dtype.name)
+            values = database.column_values([1.5, None])
+            self.assertEquals('float64', values.dtype.name)
+
 
 if __name__ == "__main__":
     unittest.main()
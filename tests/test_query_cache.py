@@ -0,0 +1,121 @@
+import unittest
+from dynamo_objects.memorydb import QueryCache
+from dynamo_objects.writebehind import WriteBehind
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable, Store, StoreTable
+
+
+class QueryCacheTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(QueryCacheTest, self).setUp()
+        self.cache = QueryCache(ttl=60, max_size=10)
+        StoreTable.query_cache = self.cache
+        self.table = StoreTable()
+        for num, company in enumerate(['MYC', 'MYC', 'YRC']):
+            self.table.save(Store(
+                store_id='STORE%s' % num, company_id=company, city='C1'))
+
+    def tearDown(self):
+        StoreTable.query_cache = None
+
+    def stores(self, company_id):
+        return sorted(store.store_id for store in self.table.query(
+            company_id__eq=company_id, index='StoreCompanyIndex'))
+
+    def test_cached(self):
+        self.assertEqual(['STORE0', 'STORE1'], self.stores('MYC'))
+        self.assertEqual(['STORE0', 'STORE1'], self.stores('MYC'))
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+        list(self.table.query(
+            cache=False, company_id__eq='MYC', index='StoreCompanyIndex'))
+        self.assertEqual(1, self.cache.hits)
+
+    def test_invalidate_save(self):
+        self.assertEqual(['STORE0', 'STORE1'], self.stores('MYC'))
+        self.assertEqual(['STORE2'], self.stores('YRC'))
+        store = self.table.get('STORE1')
+        store.company_id = 'YRC'
+        self.table.save(store)
+        # both old and new index values are invalidated
+        self.assertEqual(['STORE0'], self.stores('MYC'))
+        self.assertEqual(['STORE1', 'STORE2'], self.stores('YRC'))
+
+    def test_invalidate_write_behind(self):
+        self.assertEqual(['STORE0', 'STORE1'], self.stores('MYC'))
+        writer = WriteBehind(at_exit=False)
+        StoreTable.write_behind = writer
+        try:
+            store = self.table.get('STORE1')
+            store.company_id = 'YRC'
+            self.table.save(store)
+            writer.flush()
+        finally:
+            StoreTable.write_behind = None
+            writer.close()
+        self.assertEqual(['STORE0'], self.stores('MYC'))
+
+    def test_invalidate_delete(self):
+        self.assertEqual(['STORE2'], self.stores('YRC'))
+        self.table.delete('STORE2')
+        self.assertEqual([], self.stores('YRC'))
+
+    def test_cached_records(self):
+        self.stores('MYC')
+        store = list(self.table.query(
+            company_id__eq='MYC', index='StoreCompanyIndex'))[0]
+        self.assertEqual(1, self.cache.hits)
+        # records from the cache can be changed and saved
+        store.city = 'C2'
+        self.table.save(store)
+        self.assertEqual('C2', self.table.get(store.store_id).city)
+        cities = set(store.city for store in self.table.query(
+            company_id__eq='MYC', index='StoreCompanyIndex'))
+        self.assertEqual(set(['C1', 'C2']), cities)
+
+    def test_update_counter(self):
+        CustomerTable.query_cache = self.cache
+        try:
+            table = CustomerTable()
+            customer = Customer(customer_id='C1', age=20)
+            customer.thanks_count = 0
+            table.save(customer)
+            self.assertEqual(0, list(table.query(
+                customer_id__eq='C1'))[0].thanks_count)
+            table.update_counter('C1', 20, thanks_count=2)
+            self.assertEqual(2, list(table.query(
+                customer_id__eq='C1'))[0].thanks_count)
+        finally:
+            CustomerTable.query_cache = None
+
+
+class QueryCacheLimitsTest(unittest.TestCase):
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=-1)
+        cache.put('key', 'value', ['tag'])
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(0, len(cache))
+
+    def test_max_size(self):
+        cache = QueryCache(max_size=2)
+        for key in ('a', 'b'):
+            cache.put(key, key, ['tag'])
+        cache.get('a')
+        cache.put('c', 'c', ['tag'])
+        self.assertEqual('a', cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        cache.invalidate(['tag'])
+        self.assertEqual(0, len(cache))
+
+    def test_stale_put(self):
+        cache = QueryCache()
+        version = cache.version
+        cache.invalidate(['tag'])
+        self.assertFalse(cache.put('key', 'value', ['tag'], version))
+        self.assertIsNone(cache.get('key'))
+
+
+if __name__ == "__main__":
+    unittest.main()
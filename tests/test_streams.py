@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+from dynamo_objects import DynamoException
+from dynamo_objects.streams import ChangeFeed, FileCheckpoints, enable_stream
+from .base import BaseDynamoTest, DYNAMODB_MOCK
+from .schema import Customer, CustomerTable, StoreTable
+
+
+class SplitStreams(object):
+    """Streams with the parent shard which is closed and split."""
+
+    def __init__(self):
+        self.shards = [{'ShardId': 'parent'}]
+        self.records = {'child': [{
+            'eventName': 'INSERT',
+            'dynamodb': {
+                'SequenceNumber': '1',
+                'Keys': {'customer_id': {'S': 'C1'}}
+            }
+        }]}
+        self.iterator_types = {}
+
+    def close_parent(self):
+        self.shards.append({'ShardId': 'child', 'ParentShardId': 'parent'})
+
+    def describe_stream(self, stream_arn, limit=None,
+                        exclusive_start_shard_id=None):
+        return {'StreamDescription': {'Shards': list(self.shards)}}
+
+    def get_shard_iterator(self, stream_arn, shard_id, shard_iterator_type,
+                           sequence_number=None):
+        self.iterator_types[shard_id] = shard_iterator_type
+        return {'ShardIterator': shard_id}
+
+    def get_records(self, shard_iterator, limit=None):
+        result = {'Records': self.records.pop(shard_iterator, [])}
+        if shard_iterator != 'parent' or len(self.shards) == 1:
+            result['NextShardIterator'] = shard_iterator
+        return result
+
+
+@unittest.skipUnless(DYNAMODB_MOCK, 'streams are recorded by dynamock')
+class ChangeFeedTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(ChangeFeedTest, self).setUp()
+        self.table = CustomerTable()
+        enable_stream('customer')
+
+    def tearDown(self):
+        self.db.get_connection().disable_stream(
+            self.db.get_table_name('customer'))
+
+    def test_events(self):
+        self.table.save(Customer(customer_id='C1', age=1, first_name='A'))
+        customer = self.table.get('C1', 1)
+        # not changed, not recorded
+        self.table.save(customer)
+        customer.first_name = 'B'
+        self.table.save(customer)
+        self.table.update_counter('C1', 1, thanks_count=1)
+        self.table.delete('C1', 1)
+        changes = ChangeFeed('customer').get_batch()
+        self.assertEqual(
+            ['INSERT', 'MODIFY', 'MODIFY', 'REMOVE'],
+            [change.event for change in changes])
+        self.assertEqual({'customer_id': 'C1', 'age': 1}, changes[0].keys)
+        self.assertIsNone(changes[0].old)
+        self.assertEqual('A', changes[1].old['first_name'])
+        self.assertEqual('B', changes[1].new['first_name'])
+        self.assertEqual(1, changes[2].new['thanks_count'])
+        self.assertEqual('B', changes[3].old['first_name'])
+        self.assertIsNone(changes[3].new)
+
+    def test_checkpoints(self):
+        checkpoints = {}
+        received = []
+        for age in range(5):
+            self.table.save(Customer(customer_id='C1', age=age))
+        feed = ChangeFeed('customer', checkpoints, batch_size=2)
+        self.assertEqual(5, feed.process(received.append))
+        self.assertEqual([2, 2, 1], [len(batch) for batch in received])
+        self.table.save(Customer(customer_id='C2', age=1))
+        # the new consumer continues from the checkpoint
+        feed = ChangeFeed('customer', checkpoints)
+        changes = feed.get_batch()
+        self.assertEqual(['C2'], [c.keys['customer_id'] for c in changes])
+        self.assertEqual([], feed.get_batch())
+
+    def test_redelivery(self):
+        self.table.save(Customer(customer_id='C1', age=1))
+        feed = ChangeFeed('customer')
+
+        def failed(changes):
+            raise ValueError('Failed')
+        with self.assertRaises(ValueError):
+            feed.process(failed)
+        received = []
+        feed.process(received.extend)
+        self.assertEqual(['INSERT'], [change.event for change in received])
+
+    def test_file_checkpoints(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'feed.json')
+            self.table.save(Customer(customer_id='C1', age=1))
+            feed = ChangeFeed('customer', FileCheckpoints(path))
+            self.assertEqual(1, feed.process(lambda changes: None))
+            feed = ChangeFeed('customer', FileCheckpoints(path))
+            self.assertEqual(0, feed.process(lambda changes: None))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_keys_only(self):
+        enable_stream('customer', 'KEYS_ONLY')
+        self.table.save(Customer(customer_id='C1', age=1))
+        feed = ChangeFeed('customer', start='LATEST')
+        self.table.save(Customer(customer_id='C2', age=1))
+        changes = feed.get_batch()
+        self.assertEqual(1, len(changes))
+        self.assertEqual('C2', changes[0].keys['customer_id'])
+        self.assertIsNone(changes[0].new)
+
+    def test_child_shards(self):
+        streams = SplitStreams()
+        feed = ChangeFeed('customer', start='LATEST', streams=streams)
+        self.assertEqual({'parent': 'LATEST'}, streams.iterator_types)
+        streams.close_parent()
+        # the parent shard is finished
+        self.assertEqual([], feed.get_batch())
+        # changes of the child shard are read from its start
+        changes = feed.get_batch()
+        self.assertEqual('TRIM_HORIZON', streams.iterator_types['child'])
+        self.assertEqual(['C1'], [c.keys['customer_id'] for c in changes])
+
+    def test_not_enabled(self):
+        StoreTable()
+        with self.assertRaises(DynamoException):
+            ChangeFeed('store')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+from boto.dynamodb2.fields import HashKey, RangeKey
+from boto.dynamodb2.types import NUMBER
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable
+
+
+class TablesTest(BaseDynamoTest):
+
+    def test_truncate(self):
+        table = CustomerTable()
+        for num in range(60):
+            table.save(Customer(customer_id='C%s' % (num % 7), age=num))
+        self.assertEqual(60, table.truncate(workers=3))
+        self.assertEqual([], list(table.scan()))
+        # the table is still there
+        table.save(Customer(customer_id='C1', age=1))
+        self.assertEqual(1, len(list(table.scan())))
+
+    def test_truncate_empty(self):
+        self.assertEqual(0, CustomerTable().truncate())
+
+    def test_create_delete_tables(self):
+        self.db.create_tables([{
+            'table_name': 'bulk_%s' % num,
+            'schema': [HashKey('id'), RangeKey('num', data_type=NUMBER)],
+            'throughput': {'read': 1, 'write': 1}
+        } for num in range(3)])
+        for num in range(3):
+            self.assertTrue(self.db.exists('bulk_%s' % num))
+        self.assertEqual(
+            ['bulk_0', 'bulk_2'],
+            self.db.delete_tables(['bulk_0', 'missing', 'bulk_2']))
+        self.assertFalse(self.db.exists('bulk_0'))
+        self.assertTrue(self.db.exists('bulk_1'))
+        self.assertFalse(self.db.exists('bulk_2'))
+        self.assertTrue(self.db.delete_table('bulk_1'))
+        self.assertFalse(self.db.delete_table('bulk_1'))
+
+    def test_sync_table_data(self):
+        table = CustomerTable()
+        for num in range(40):
+            table.save(Customer(
+                customer_id='C%s' % (num % 7), age=num,
+                tags=set(['a', 'b', 'c'])))
+        self.db.create_tables([{
+            'table_name': 'customer_copy',
+            'schema': [HashKey('customer_id'),
+                       RangeKey('age', data_type=NUMBER)],
+            'throughput': {'read': 1, 'write': 1}
+        }])
+        counts = self.db.sync_table_data(
+            'customer', 'customer_copy', segments=3)
+        self.assertEqual(40, counts['written'])
+        self.assertEqual(0, counts['unchanged'])
+        copy = self.db.get_table('customer_copy')
+        self.assertEqual(40, len(list(copy.scan())))
+
+        # only changed items are written
+        customer = table.get('C1', 1)
+        customer.first_name = 'Changed'
+        table.save(customer)
+        with copy.batch_write() as batch:
+            batch.put_item({'customer_id': 'extra', 'age': 1})
+        counts = self.db.sync_table_data(
+            'customer', 'customer_copy', delete=True, segments=3)
+        self.assertEqual(40, counts['scanned'])
+        self.assertEqual(1, counts['written'])
+        self.assertEqual(39, counts['unchanged'])
+        self.assertEqual(1, counts['deleted'])
+        self.assertEqual(
+            'Changed', copy.get_item(customer_id='C1', age=1)['first_name'])
+        self.assertEqual(40, len(list(copy.scan())))
+
+    def test_map_reduce(self):
+        table = CustomerTable()
+        for num in range(50):
+            table.save(Customer(customer_id='C%s' % (num % 7), age=num))
+        total = table.map_reduce(
+            lambda customer: customer.age, lambda a, b: a + b,
+            segments=5, processes=2)
+        self.assertEqual(sum(range(50)), total)
+
+        def merge(a, b):
+            return dict((key, a.get(key, 0) + b.get(key, 0))
+                        for key in set(a) | set(b))
+        counts = table.map_reduce(
+            lambda customer: {customer.customer_id: 1}, merge,
+            segments=3, processes=2, age__lt=14)
+        self.assertEqual(dict(('C%s' % num, 2) for num in range(7)), counts)
+        self.assertEqual(0, table.map_reduce(
+            lambda customer: 1, lambda a, b: a + b, initial=0,
+            segments=2, processes=2, age__gt=100))
+
+
+if __name__ == "__main__":
+    unittest.main()
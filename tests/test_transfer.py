@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable, Store, StoreTable
+
+
+class TransferTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(TransferTest, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.table = CustomerTable()
+        for num in range(40):
+            customer = Customer(customer_id='C%s' % (num % 9), age=num)
+            customer.first_name = u'N\xe4me %s' % num
+            self.table.save(customer)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_export_import(self):
+        manifest = self.db.export_table(
+            'customer', self.path, segments=3, shard_size=7)
+        self.assertEqual(40, manifest['count'])
+        self.assertTrue(all(
+            shard['count'] <= 7 for shard in manifest['shards']))
+        self.assertEqual(
+            40, self.db.import_table(self.path, 'customer_copy', rate=10000))
+        self.assertTrue(self.db.exists('customer_copy'))
+        table = self.db.get_table('customer_copy')
+        item = table.get_item(customer_id='C3', age=12)
+        self.assertEqual(u'N\xe4me 12', item['first_name'])
+        self.assertEqual(40, len(list(table.scan())))
+
+    def test_import_resume(self):
+        manifest = self.db.export_table('customer', self.path, shard_size=5)
+        progress_path = os.path.join(self.path, 'progress.txt')
+        done = manifest['shards'][:3]
+        with open(progress_path, 'w') as progress_file:
+            for shard in done:
+                progress_file.write(shard['name'] + '\n')
+        count = self.db.import_table(
+            self.path, 'customer_copy', progress_path=progress_path)
+        self.assertEqual(40 - sum(shard['count'] for shard in done), count)
+        # everything is imported now
+        self.assertEqual(0, self.db.import_table(
+            self.path, 'customer_copy', progress_path=progress_path))
+
+    def test_import_tables(self):
+        self.db.export_table('customer', self.path, shard_size=10)
+        # the progress is recorded for each table
+        self.assertEqual(40, self.db.import_table(self.path, 'customer_a'))
+        self.assertEqual(40, self.db.import_table(self.path, 'customer_b'))
+        self.assertEqual(0, self.db.import_table(self.path, 'customer_a'))
+        self.assertEqual(
+            40, len(list(self.db.get_table('customer_b').scan())))
+
+    def test_indexes(self):
+        self.db.delete_table('store')
+        store_table = StoreTable()
+        store_table.save(Store(store_id='S1', company_id='C1'))
+        self.db.export_table('store', self.path)
+        self.db.import_table(self.path, 'store_copy')
+        table = self.db.get_table('store_copy')
+        stores = list(table.query_2(
+            company_id__eq='C1', index='StoreCompanyIndex'))
+        self.assertEqual(['S1'], [store['store_id'] for store in stores])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+from boto.dynamodb2.fields import HashKey
+from boto.dynamodb2.types import NUMBER
 from dynamo_objects import database
 from .base import BaseDynamoTest
 from .schema import CustomerTable, Customer
@@ -44,5 +46,87 @@ class UpdateCountersTest(BaseDynamoTest):
         self.assertEquals(4, customer.thanks_count)
 
 
+class ShardedCountersTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(ShardedCountersTest, self).setUp()
+        CustomerTable.counter_shards = {'thanks_count': 4}
+        self.table = CustomerTable()
+        self.customer = Customer(customer_id='CUSTOMER1', age=22)
+        self.customer.thanks_count = 0
+        self.table.save(self.customer)
+
+    def tearDown(self):
+        CustomerTable.counter_shards = {}
+
+    def test_counter(self):
+        for __ in range(50):
+            self.table.update_counter('CUSTOMER1', 22, thanks_count=2)
+        self.assertEquals(
+            100, self.table.get_counter('thanks_count', 'CUSTOMER1', 22))
+        # increments are spread over shards
+        customer = self.table.get('CUSTOMER1', 22)
+        self.assertLess(customer.thanks_count, 100)
+        shard = self.table.find('CUSTOMER1#1', 22)
+        self.assertIsNotNone(shard)
+
+    def test_compact(self):
+        for __ in range(20):
+            self.table.update_counter('CUSTOMER1', 22, thanks_count=1)
+        customer = self.table.get('CUSTOMER1', 22)
+        moved = self.table.compact_counter('thanks_count', 'CUSTOMER1', 22)
+        self.assertEquals(20, customer.thanks_count + moved)
+        customer = self.table.get('CUSTOMER1', 22)
+        self.assertEquals(20, customer.thanks_count)
+        self.table.update_counter('CUSTOMER1', 22, thanks_count=-1)
+        self.assertEquals(
+            19, self.table.get_counter('thanks_count', 'CUSTOMER1', 22))
+
+    def test_skip_shards(self):
+        for __ in range(20):
+            self.table.update_counter('CUSTOMER1', 22, thanks_count=1)
+        self.assertLess(1, len(list(self.table.table.scan())))
+        # shard items are not returned as records
+        self.assertEquals(
+            ['CUSTOMER1'],
+            [customer.customer_id for customer in self.table.scan()])
+        self.assertEquals(
+            ['CUSTOMER1'],
+            [item['customer_id'] for item in self.table.scan_raw()])
+        records, __ = self.table.scan_page(10)
+        self.assertEquals(1, len(records))
+        for shard in range(1, 4):
+            self.assertEquals([], list(self.table.query(
+                customer_id__eq='CUSTOMER1#%s' % shard)))
+        self.assertEquals(1, self.table.map_reduce(
+            lambda customer: 1, lambda a, b: a + b, segments=2,
+            processes=2))
+        # shard items are deleted with the table data
+        self.table.truncate()
+        self.assertEquals(
+            0, self.table.get_counter('thanks_count', 'CUSTOMER1', 22))
+
+    def test_numeric_hash_key(self):
+        self.table.schema = [
+            HashKey('customer_id', data_type=NUMBER), self.table.schema[1]]
+        # the error is raised for every call, whatever the shard is
+        for __ in range(10):
+            with self.assertRaises(database.DynamoException):
+                self.table.update_counter(1, 22, thanks_count=1)
+        with self.assertRaises(database.DynamoException):
+            self.table.get_counter('thanks_count', 1, 22)
+        with self.assertRaises(database.DynamoException):
+            self.table.compact_counter('thanks_count', 1, 22)
+
+    def test_not_sharded(self):
+        CustomerTable.counter_shards = {}
+        self.table.update_counter('CUSTOMER1', 22, thanks_count=3)
+        self.assertEquals(
+            3, self.table.get_counter('thanks_count', 'CUSTOMER1', 22))
+        self.assertEquals(
+            0, self.table.compact_counter('thanks_count', 'CUSTOMER1', 22))
+        self.assertIsNone(self.table.find('CUSTOMER1#1', 22))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from boto.dynamodb2.fields import HashKey
+from dynamo_objects import DynamoException, DynamoRecord, DynamoTable
+from dynamo_objects import VersionConflictException
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable
+
+
+class Account(DynamoRecord):
+
+    _version_field = 'version'
+
+    def __init__(self, **data):
+        self.account_id = ''
+        self.balance = 0
+        self.note = ''
+        self.version = 0
+        super(Account, self).__init__(**data)
+
+
+class AccountTable(DynamoTable):
+
+    def __init__(self):
+        super(AccountTable, self).__init__(
+            'account',
+            schema=[HashKey('account_id')],
+            throughput={'read': 3, 'write': 3},
+            record_class=Account)
+
+
+class VersioningTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(VersioningTest, self).setUp()
+        self.table = AccountTable()
+
+    def test_insert(self):
+        account = Account(account_id='A1', balance=10)
+        self.table.save(account)
+        self.assertEqual(1, account.version)
+        self.assertEqual(1, self.table.get('A1').version)
+        with self.assertRaises(VersionConflictException):
+            self.table.save(Account(account_id='A1', balance=20))
+        self.assertEqual(10, self.table.get('A1').balance)
+
+    def test_update(self):
+        self.table.save(Account(account_id='A1', balance=10, note='new'))
+        account = self.table.get('A1')
+        account.balance = 20
+        account.note = ''
+        self.table.save(account)
+        self.assertEqual(2, account.version)
+        # the saved record can be saved again
+        account.balance = 30
+        self.table.save(account)
+        account = self.table.get('A1')
+        self.assertEqual(30, account.balance)
+        self.assertEqual(3, account.version)
+        self.assertEqual('', account.note)
+
+    def test_conflict(self):
+        self.table.save(Account(account_id='A1', balance=10))
+        first = self.table.get('A1')
+        second = self.table.get('A1')
+        first.balance = 20
+        self.table.save(first)
+        second.balance = 30
+        with self.assertRaises(VersionConflictException):
+            self.table.save(second)
+        self.assertEqual(20, self.table.get('A1').balance)
+
+    def test_create(self):
+        account = self.table.get('A1', create=True)
+        account.balance = 5
+        self.table.save(account)
+        self.assertEqual(5, self.table.get('A1').balance)
+
+
+class CopyTableTest(BaseDynamoTest):
+
+    def test_copy_table_data(self):
+        table = CustomerTable()
+        for num in range(5):
+            table.save(Customer(customer_id='C%s' % num, age=num))
+        if not self.db.exists('customer_copy'):
+            self.db.create_table(
+                'customer_copy', schema=table.schema,
+                throughput={'read': 1, 'write': 1})
+        self.assertEqual(
+            5, self.db.copy_table_data('customer', 'customer_copy'))
+        with self.assertRaises(DynamoException):
+            self.db.copy_table_data('customer', 'customer_copy')
+        self.assertEqual(5, self.db.copy_table_data(
+            'customer', 'customer_copy', update=True))
+        item = table.get('C1', 1)._item
+        with self.assertRaises(DynamoException):
+            self.db.copy_item(item, 'customer_copy')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from dynamo_objects import DynamoException
+from dynamo_objects.writebehind import WriteBehind
+from .base import BaseDynamoTest
+from .schema import Customer, CustomerTable
+
+
+class WriteBehindTest(BaseDynamoTest):
+
+    def setUp(self):
+        super(WriteBehindTest, self).setUp()
+        self.writer = WriteBehind(max_size=10, at_exit=False)
+        CustomerTable.write_behind = self.writer
+        self.table = CustomerTable()
+
+    def tearDown(self):
+        CustomerTable.write_behind = None
+        self.writer.close()
+
+    def test_save(self):
+        for age in range(30):
+            self.table.save(Customer(customer_id='C1', age=age))
+        self.assertTrue(self.writer.flush(timeout=10))
+        self.assertEqual(30, self.writer.written)
+        self.assertEqual(
+            list(range(30)),
+            [c.age for c in self.table.query(customer_id__eq='C1')])
+
+    def test_merge(self):
+        self.writer.batch_wait = 0.5
+        customer = Customer(customer_id='C1', age=1)
+        for name in ['A', 'B', 'C']:
+            customer.name = name
+            self.table.save(customer)
+        self.writer.flush()
+        self.assertEqual('C', self.table.get('C1', 1).name)
+        self.assertTrue(self.writer.merged >= 1)
+
+    def test_backpressure(self):
+        # no workers, the queue is not processed
+        writer = WriteBehind(max_size=2, workers=0, at_exit=False)
+        writer.save(self.table, Customer(customer_id='C1', age=1))
+        writer.save(self.table, Customer(customer_id='C2', age=1))
+        # the same key is merged, no new space required
+        writer.save(self.table, Customer(customer_id='C2', age=1, name='B'))
+        self.assertEqual(2, len(writer))
+        with self.assertRaises(DynamoException):
+            writer.save(
+                self.table, Customer(customer_id='C3', age=1), timeout=0.1)
+
+    def test_errors(self):
+        errors = []
+        self.writer.on_error = lambda *args: errors.append(args)
+
+        def failed_write(table_name, requests):
+            raise DynamoException('Write failed')
+        self.table.db._batch_write = failed_write
+        self.table.save(Customer(customer_id='C1', age=1))
+        self.writer.close()
+        self.assertEqual(1, len(errors))
+        self.assertEqual('customer', errors[0][0])
+        self.assertEqual('C1', errors[0][1][0]['customer_id'])
+        with self.assertRaises(DynamoException):
+            self.table.save(Customer(customer_id='C1', age=2))
+
+
+if __name__ == "__main__":
+    unittest.main()